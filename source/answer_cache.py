@@ -0,0 +1,162 @@
+import math
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import ArgAnswerCache
+from utils import Logger, compute_args_hash, normalize_text, parse_specification_range
+
+LOGGER = Logger(name=__file__, log_file="answer_cache.log")
+
+RANGE_FIELDS = ("price", "power", "weight", "volume")
+
+
+def demand_key(demands: Dict[str, Any]) -> str:
+    """
+    Key của nhóm câu hỏi có cùng ý định: group, object (hãng, model), các khoảng giá trị đã parse và intent.
+    "10 - 12 triệu" và "từ 10tr đến 12tr" cho ra cùng 1 key, "máy giặt LG" và "máy giặt Samsung" thì không.
+    """
+    parts = [normalize_text(str(demands.get("group") or "")),
+             normalize_text(str(demands.get("object") or ""))]
+    for name in RANGE_FIELDS:
+        value = str(demands.get(name) or "")
+        if not value:
+            parts.append("")
+        elif "BIGGEST" in value or "SMALLEST" in value:
+            parts.append("BIGGEST" if "BIGGEST" in value else "SMALLEST")
+        else:
+            min_value, max_value = parse_specification_range(value)
+            parts.append(f"{round(min_value)}-{round(max_value) if max_value != math.inf else 'inf'}")
+    parts.append(normalize_text(str(demands.get("intent") or "")))
+    return compute_args_hash(*parts)
+
+
+@dataclass
+class _Entry:
+    bucket: str
+    text: str
+    embedding: Optional[np.ndarray]
+    answer: str
+    created_at: float
+
+
+@dataclass
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời cuối cùng của chatbot.
+    Câu hỏi trước hết được gom theo demand_key, trong cùng 1 bucket câu hỏi mới khớp với câu cũ
+    khi cosine similarity của embedding >= similarity_threshold (không có embedding thì so khớp
+    text đã chuẩn hóa). Entry hết hạn sau ttl_seconds, bị đẩy ra theo LRU khi vượt max_entries
+    và toàn bộ cache bị xóa khi fingerprint của catalog thay đổi.
+    """
+    similarity_threshold: float = ArgAnswerCache.similarity_threshold
+    ttl_seconds: float = ArgAnswerCache.ttl_seconds
+    max_entries: int = ArgAnswerCache.max_entries
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    _entries: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _buckets: Dict[str, List[int]] = field(default_factory=dict, init=False, repr=False)
+    _fingerprint: Optional[str] = field(default=None, init=False, repr=False)
+    _next_id: int = field(default=0, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @staticmethod
+    def _normalize_embedding(embedding: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_fingerprint(self, fingerprint: Optional[str]):
+        if fingerprint is not None and fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                LOGGER.log.info("Catalog changed, clear answer cache")
+            self._entries.clear()
+            self._buckets.clear()
+            self._fingerprint = fingerprint
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry.bucket]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[entry.bucket]
+
+    def lookup(self, 
+               question: str, 
+               demands: Dict[str, Any], 
+               embedding: Optional[Sequence[float]]=None,
+               fingerprint: Optional[str]=None) -> Optional[str]:
+        bucket = demand_key(demands)
+        text = normalize_text(question)
+        query = self._normalize_embedding(embedding)
+        now = time.time()
+
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+
+            candidates = []
+            for entry_id in list(self._buckets.get(bucket, [])):
+                if now - self._entries[entry_id].created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                else:
+                    candidates.append(entry_id)
+
+            best_id = None
+            exact = [entry_id for entry_id in candidates if self._entries[entry_id].text == text]
+            if exact:
+                best_id = exact[0]
+            elif query is not None:
+                with_embedding = [entry_id for entry_id in candidates 
+                                  if self._entries[entry_id].embedding is not None]
+                if with_embedding:
+                    matrix = np.stack([self._entries[entry_id].embedding for entry_id in with_embedding])
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        best_id = with_embedding[best]
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id].answer
+
+    def store(self, 
+              question: str, 
+              demands: Dict[str, Any], 
+              answer: str,
+              embedding: Optional[Sequence[float]]=None,
+              fingerprint: Optional[str]=None):
+        entry = _Entry(bucket=demand_key(demands),
+                       text=normalize_text(question),
+                       embedding=self._normalize_embedding(embedding),
+                       answer=answer,
+                       created_at=time.time())
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self._entries[entry_id] = entry
+            self._buckets.setdefault(entry.bucket, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), 
+                "hits": self.hits, 
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+ANSWER_CACHE = SemanticAnswerCache()
@@ -1,24 +1,161 @@
-
+import asyncio
+import pandas as pd
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional, Tuple
+
+# fields requested from every backend (_source includes, with_payload, chroma metadata)
+PRODUCT_FIELDS: Tuple[str, ...] = ("product_info_id", "product_name", "group_product_name", "price_vnd",
+                                   "lifecare_price", "sold_quantity", "specifications", "file_path",
+                                   "power_w", "weight_kg", "volume_l")
+
+
+def _present(value: Any) -> bool:
+    return value is not None and value == value and value != ""  # None, NaN, "" of chroma metadata
+
+
+class ProductHit:
+    """Compact search result shared by all engines, holds only the projected fields"""
+    __slots__ = ("product_info_id", "product_name", "group_product_name", "price", "sold_quantity",
+                 "specifications", "file_path", "power_w", "weight_kg", "volume_l", "score")
+
+    def __init__(self, product_info_id: Any=None, product_name: str=None, group_product_name: str=None,
+                 price: float=None, sold_quantity: int=None, specifications: str=None, file_path: str=None,
+                 power_w: float=None, weight_kg: float=None, volume_l: float=None, score: float=None):
+        self.product_info_id = product_info_id
+        self.product_name = product_name
+        self.group_product_name = group_product_name
+        self.price = price
+        self.sold_quantity = sold_quantity
+        self.specifications = specifications
+        self.file_path = file_path
+        self.power_w = power_w
+        self.weight_kg = weight_kg
+        self.volume_l = volume_l
+        self.score = score
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], score: Optional[float]=None) -> "ProductHit":
+        """Build from an ES _source, a Qdrant payload ('price') or a Chroma metadata dict"""
+        def get(*names):
+            for name in names:
+                value = record.get(name)
+                if _present(value):
+                    return value
+            return None
+
+        return cls(product_info_id=get("product_info_id"),
+                   product_name=get("product_name"),
+                   group_product_name=get("group_product_name"),
+                   price=get("price_vnd", "lifecare_price", "price"),
+                   sold_quantity=get("sold_quantity"),
+                   specifications=get("specifications"),
+                   file_path=get("file_path"),
+                   power_w=get("power_w"),
+                   weight_kg=get("weight_kg"),
+                   volume_l=get("volume_l"),
+                   score=score)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def format(self, index: int) -> str:
+        price = f"{self.price:,.0f}" if self.price is not None else "N/A"
+        return (f"\n{index + 1}. Tên: '{self.product_name}' \n"
+                f"        - Mã sản phẩm: {self.product_info_id} \n"
+                f"        - Giá: {price} đ\n"
+                f"        - Số lượng đã bán: {self.sold_quantity}\n"
+                f"        - Thông số : {self.specifications}\n")
+
+    def __repr__(self) -> str:
+        return f"ProductHit(product_info_id={self.product_info_id!r}, product_name={self.product_name!r})"
+
+
+def format_hits(hits: List[ProductHit]) -> str:
+    """The one place results are rendered to text, after retrieval is finished"""
+    return "".join(hit.format(index) for index, hit in enumerate(hits))
+
+
+@dataclass
+class UpsertReport:
+    """Summary of what an upsert changed in the backend"""
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def merge(self, other: "UpsertReport") -> "UpsertReport":
+        """Cộng dồn report của 1 chunk vào report tổng"""
+        self.added += other.added
+        self.updated += other.updated
+        self.deleted += other.deleted
+        self.unchanged += other.unchanged
+        self.failed += other.failed
+        self.errors.extend(other.errors)
+        self.elapsed += other.elapsed
+        return self
+
 
 @dataclass
 class BaseRetriever(ABC):
+    # False với engine dựng lại toàn bộ index trong bộ nhớ từ cả catalog: không nhận upsert_chunk
+    streaming_ingest = True
 
     @abstractmethod
-    async def query(self, query: str, *args, **kwargs) -> str:
+    def query(self, query: str, *args, **kwargs) -> str:
         """Perform retrieval document from user's query"""
         raise NotImplementedError
     
     @abstractmethod
-    async def upsert(self, *args, **kwargs):
+    def upsert(self, *args, **kwargs):
         """
         Use 'content' field from value for embedding, use key as id.
         If embedding_func is None, use 'embedding' field from value
         """
         raise NotImplementedError
+
+    async def aquery(self, query: str, *args, **kwargs) -> str:
+        """Async retrieval. Engines without a native async client run query() in a worker thread"""
+        return await asyncio.to_thread(self.query, *args, query=query, **kwargs)
+
+    def search_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        """Same retrieval as query() but returns the projected hits, best match first"""
+        raise NotImplementedError
+
+    async def asearch_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        return await asyncio.to_thread(self.search_records, query=query, demands=demands)
+
+    def upsert_chunk(self, df: pd.DataFrame) -> UpsertReport:
+        """
+        Ingest 1 chunk of a streamed catalog. Defaults to upsert(), which is right for engines whose
+        upsert only adds or updates rows; engines that prune on upsert override it and engines that
+        rebuild their whole index set streaming_ingest = False
+        """
+        return self.upsert(df)
+
+    def finish_ingest(self, complete: bool=True) -> UpsertReport:
+        """
+        Called once after the last chunk of a streamed catalog (prune, rebuild, refresh...).
+        complete=False when the stream was cut short or a chunk failed: release ingest state
+        but never prune or rebuild from the partial data
+        """
+        return UpsertReport()
+
+    async def aupsert(self, *args, **kwargs):
+        """Async upsert. Defaults to running upsert() in a worker thread"""
+        return await asyncio.to_thread(self.upsert, *args, **kwargs)
     
     def format_output_structure(self, *args, **kwargs) -> str:
         """Reponse retriever's output"""
         raise NotImplementedError
+
+    def close(self):
+        """Release connections held by the engine"""
+        pass
+
+    async def aclose(self):
+        """Release async connections held by the engine"""
+        pass
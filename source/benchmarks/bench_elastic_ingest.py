@@ -0,0 +1,66 @@
+"""
+Đo tốc độ ingest của ElasticQueryEngine: index từng document (cách cũ) so với bulk song song.
+
+Chạy với 1 Elasticsearch/OpenSearch local, ví dụ:
+    docker run -p 9200:9200 -e discovery.type=single-node -e xpack.security.enabled=false elasticsearch:8.15.0
+    PYTHONPATH=source python -m benchmarks.bench_elastic_ingest --hosts http://localhost:9200 --rows 20000
+"""
+import time
+import argparse
+import pandas as pd
+
+from catalog import CATALOG
+from vectorstore import ElasticQueryEngine
+from benchmarks.synthetic import synthesize_catalog
+
+
+def bench_sequential(engine: ElasticQueryEngine, df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    for doc in df.astype(object).where(df.notna(), None).to_dict(orient="records"):
+        engine.client.index(index=engine.index_name, id=doc['product_info_id'], document=doc)
+    engine.client.indices.refresh(index=engine.index_name)
+    return len(df) / (time.perf_counter() - start)
+
+
+def bench_bulk(engine: ElasticQueryEngine, df: pd.DataFrame, chunk_size: int, thread_count: int) -> float:
+    report = engine.bulk_index(df, chunk_size=chunk_size, thread_count=thread_count)
+    if report.failed:
+        print(f"  {report.failed} documents failed, first error: {report.errors[0]}")
+    return report.added / report.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", default="http://localhost:9200")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--sequential-rows", type=int, default=1000, 
+                        help="số document dùng cho cách index từng request (chậm)")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    df = synthesize_catalog(CATALOG.dataframe, num_rows=args.rows)
+    # khởi tạo với dataframe rỗng để __post_init__ không tự ingest
+    engine = ElasticQueryEngine(cloud_id=None, api_key=None, hosts=args.hosts,
+                                dataframe=df.iloc[:0], index_name="bench_ingest")
+    try:
+        def reset_index():
+            engine.client.indices.delete(index=engine.index_name, ignore_unavailable=True)
+            engine._create_index(df)
+
+        reset_index()
+        rate = bench_sequential(engine, df.iloc[:args.sequential_rows])
+        print(f"sequential index          : {rate:10.0f} docs/s")
+
+        for chunk_size in args.chunk_sizes:
+            for thread_count in args.threads:
+                reset_index()
+                rate = bench_bulk(engine, df, chunk_size, thread_count)
+                print(f"bulk chunk={chunk_size:<5} threads={thread_count:<2}: {rate:10.0f} docs/s")
+    finally:
+        engine.client.indices.delete(index=engine.index_name, ignore_unavailable=True)
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
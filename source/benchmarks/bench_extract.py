@@ -0,0 +1,79 @@
+"""
+Đo tỉ lệ câu hỏi được extractor theo luật xử lý (không cần gọi LLM) và độ trễ của 2 đường.
+
+    PYTHONPATH=source python -m benchmarks.bench_extract
+    PYTHONPATH=source python -m benchmarks.bench_extract --with-llm --type-client groq   # cần API key
+"""
+import time
+import argparse
+import numpy as np
+
+from config import ArgExtract
+from rule_extractor import extract_rule_based
+
+SAMPLE_QUERIES = [
+    "Tôi muốn mua điều hòa từ 10 đến 12 triệu",
+    "máy lạnh 12000btu dưới 15tr",
+    "điều hòa daikin 18000 btu giá bao nhiêu",
+    "nồi chiên không dầu rẻ nhất",
+    "bình nước nóng 20 lít",
+    "bình nước nóng công suất lớn nhất",
+    "máy sấy tóc 1200W Philips",
+    "ghế massage trên 20 triệu",
+    "máy lọc nước loại nào tốt",
+    "máy giặt 9 kg khoảng 5 triệu",
+    "so sánh máy giặt LG và máy giặt Aqua",
+    "nồi cơm điện nhẹ nhất",
+    "bếp từ đắt nhất",
+    "robot hút bụi tầm 7 triệu",
+    "đèn năng lượng mặt trời 100w",
+    "máy xay sinh tố dưới 1 triệu",
+    "ổ cắm thông minh wifi",
+    "cái nào lớn nhất",
+    "sản phẩm bán chạy nhất tuần này",
+    "nồi áp suất 5 lít",
+]
+
+
+def percentile(values, q) -> float:
+    return float(np.percentile(values, q)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--min-confidence", type=float, default=ArgExtract.min_confidence)
+    parser.add_argument("--with-llm", action="store_true")
+    parser.add_argument("--type-client", default="groq")
+    args = parser.parse_args()
+
+    latencies, hits = [], 0
+    for _ in range(args.repeat):
+        for query in SAMPLE_QUERIES:
+            start = time.perf_counter()
+            _, confidence = extract_rule_based(query)
+            latencies.append(time.perf_counter() - start)
+    for query in SAMPLE_QUERIES:
+        specifications, confidence = extract_rule_based(query)
+        hit = confidence >= args.min_confidence
+        hits += hit
+        print(f"{'FAST' if hit else 'LLM ':4} {confidence:.2f} {query!r} -> {specifications}")
+
+    print(f"\nfast path hit rate : {hits}/{len(SAMPLE_QUERIES)} ({hits / len(SAMPLE_QUERIES):.0%})")
+    print(f"rule latency       : p50={percentile(latencies, 50):.3f}ms p95={percentile(latencies, 95):.3f}ms")
+
+    if args.with_llm:
+        from extract_specifications import extract_info
+        llm_latencies = []
+        for query in SAMPLE_QUERIES:
+            start = time.perf_counter()
+            extract_info(query, type_client=args.type_client, use_fast_path=False)
+            llm_latencies.append(time.perf_counter() - start)
+        llm_p50 = percentile(llm_latencies, 50)
+        hit_rate = hits / len(SAMPLE_QUERIES)
+        print(f"llm latency        : p50={llm_p50:.1f}ms p95={percentile(llm_latencies, 95):.1f}ms")
+        print(f"expected p50 saving: {hit_rate * llm_p50:.1f}ms per query")
+
+
+if __name__ == "__main__":
+    main()
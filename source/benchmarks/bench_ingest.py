@@ -0,0 +1,101 @@
+"""
+So sánh ingest cả file (pd.read_excel rồi normalize_specifications) với IngestPipeline đọc theo chunk:
+    - parity: ghép các chunk lại phải ra cùng dataframe với cách đọc cả file
+    - bộ nhớ đỉnh (tracemalloc) và tốc độ của từng reader (xlsx, csv, parquet)
+    - throughput của sink khi fan-out tới EnsembleQueryEngine (Chroma cục bộ, embedder giả); Columnar và
+      Memmap dựng index từ cả catalog nên không nằm trong pipeline
+
+    PYTHONPATH=source python -m benchmarks.bench_ingest --size 20000 --chunk-size 1000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+from typing import Callable, Tuple
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from catalog import CATALOG
+from config import ArgChroma, ArgIngest
+from ingest import IngestPipeline, iter_chunks
+from utils import CANONICAL_COLUMNS, normalize_specifications
+from vectorstore import EnsembleQueryEngine
+from benchmarks.synthetic import synthesize_catalog
+
+COMPARE_COLUMNS = ["product_info_id", "group_product_name", "product_name", "lifecare_price",
+                   *(column for _, column in CANONICAL_COLUMNS.values())]
+
+
+def measure(fn: Callable[[], int]) -> Tuple[int, float, float]:
+    """(kết quả, giây, MB cấp phát đỉnh)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def check_parity(path: str, chunk_size: int) -> int:
+    full = normalize_specifications(pd.read_excel(path)).reset_index(drop=True)
+    streamed = pd.concat([normalize_specifications(chunk) for chunk in iter_chunks(path, chunk_size)],
+                         ignore_index=True)
+    mismatches = 0
+    for column in COMPARE_COLUMNS:
+        left, right = full[column], streamed[column]
+        if pd.api.types.is_numeric_dtype(left):
+            left, right = pd.to_numeric(left), pd.to_numeric(right)
+        mismatches += int((~((left == right) | (left.isna() & right.isna()))).sum())
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000, help="số dòng của catalog tổng hợp")
+    parser.add_argument("--chunk-size", type=int, default=ArgIngest.chunk_size)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    df = synthesize_catalog(CATALOG.dataframe, num_rows=args.size)
+    df = df.drop(columns=[column for _, column in CANONICAL_COLUMNS.values()])
+    paths = {"xlsx": os.path.join(workdir, "catalog.xlsx"),
+             "csv": os.path.join(workdir, "catalog.csv"),
+             "parquet": os.path.join(workdir, "catalog.parquet")}
+    df.to_excel(paths["xlsx"], index=False)
+    df.to_csv(paths["csv"], index=False)
+    df.to_parquet(paths["parquet"], index=False)
+    del df
+
+    print(f"rows: {args.size}, chunk_size: {args.chunk_size}")
+    print(f"parity xlsx (streamed vs read_excel): {check_parity(paths['xlsx'], args.chunk_size)} mismatches")
+
+    readers = {
+        "read_excel (full)": lambda: len(normalize_specifications(pd.read_excel(paths["xlsx"]))),
+        **{f"{name} (chunks)": (lambda path=path: sum(len(normalize_specifications(chunk))
+                                                       for chunk in iter_chunks(path, args.chunk_size)))
+           for name, path in paths.items()},
+    }
+    for name, reader in readers.items():
+        rows, elapsed, peak = measure(reader)
+        print(f"{name:<20} rows={rows:<7} {rows / elapsed:>9.0f} rows/s  peak={peak:8.1f} MB")
+
+    class BenchChroma(EnsembleQueryEngine):
+        config = ArgChroma(db_persist_path=os.path.join(workdir, "chroma"),
+                           bm25_index_path=os.path.join(workdir, "bm25"))
+
+    sinks = {"chroma": BenchChroma(embedder=DeterministicFakeEmbedding(size=384), df=CATALOG.dataframe.head(1))}
+    pipeline = IngestPipeline(sinks=sinks)
+    pipeline.config = ArgIngest(chunk_size=args.chunk_size)
+    stats, elapsed, peak = measure(lambda: pipeline.run(paths["xlsx"]))
+    print(f"pipeline xlsx -> {list(sinks)}: {elapsed:.2f}s, peak={peak:.1f} MB")
+    for name, sink_stats in stats.items():
+        print(f"  {name:<10} rows={sink_stats.rows} chunks={sink_stats.chunks} "
+              f"{sink_stats.rows_per_second:.0f} rows/s  {sink_stats.report}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
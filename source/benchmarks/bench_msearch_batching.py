@@ -0,0 +1,128 @@
+"""
+Đo độ trễ và thông lượng khi nhiều caller đồng thời search, gọi msearch trực tiếp
+so với gom qua MicroBatchDispatcher với các cửa sổ khác nhau.
+
+Mặc định backend trả về kết quả tính sẵn bằng ColumnarQueryEngine, chi phí chỉ gồm round trip giả lập
+(--rtt-ms, --per-query-ms) và giới hạn số request xử lý song song (--backend-concurrency, tương tự
+search thread pool của Elasticsearch).
+Có --hosts thì đo trên Elasticsearch thật.
+
+    PYTHONPATH=source python -m benchmarks.bench_msearch_batching --callers 64 --requests 20
+    PYTHONPATH=source python -m benchmarks.bench_msearch_batching --hosts http://localhost:9200 --windows 0 1 2 5
+"""
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from catalog import CATALOG
+from vectorstore.batching import MicroBatchDispatcher
+from vectorstore.columnar import ColumnarQueryEngine
+from benchmarks.parity_columnar import sample_demands
+
+
+class SimulatedBackend:
+    """Mỗi lần gọi tốn rtt_ms + per_query_ms cho từng truy vấn, tối đa concurrency lần gọi cùng lúc"""
+    def __init__(self, responses: Dict[str, Dict], rtt_ms: float, per_query_ms: float, concurrency: int):
+        self.responses = responses
+        self.rtt = rtt_ms / 1000
+        self.per_query = per_query_ms / 1000
+        self.slots = threading.Semaphore(concurrency)
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, queries: List[Dict]) -> List[Dict]:
+        with self._lock:
+            self.round_trips += 1
+        with self.slots:
+            time.sleep(self.rtt + self.per_query * len(queries))
+            return [self.responses[json.dumps(query, sort_keys=True)] for query in queries]
+
+
+def run(search: Callable, queries: List[Dict], callers: int, requests: int) -> Dict[str, float]:
+    latencies = []
+    lock = threading.Lock()
+
+    def caller(offset: int):
+        local = []
+        for i in range(requests):
+            query = queries[(offset * requests + i) % len(queries)]
+            start = time.perf_counter()
+            search([query])
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(caller, range(callers)))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "qps": len(latencies) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="số truy vấn tuần tự của mỗi caller")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.5, 2.0, 5.0])
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-inflight", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=5.0)
+    parser.add_argument("--per-query-ms", type=float, default=0.2)
+    parser.add_argument("--backend-concurrency", type=int, default=8)
+    parser.add_argument("--hosts", type=str, default=None)
+    args = parser.parse_args()
+
+    df = CATALOG.dataframe
+    columnar = ColumnarQueryEngine(df=df)
+    queries = [query for demands in sample_demands(df, 500, seed=0) for query in columnar._build_queries(demands)]
+
+    elastic = None
+    if args.hosts:
+        from vectorstore.elastic_search import ElasticQueryEngine
+        elastic = ElasticQueryEngine(cloud_id=None, api_key=None, dataframe=df, hosts=args.hosts)
+        backend_fn = elastic.bulk_search_products
+    else:
+        backend_fn = {json.dumps(query, sort_keys=True): columnar.execute(query) for query in queries}
+
+    def make_backend():
+        if elastic is not None:
+            return backend_fn
+        return SimulatedBackend(backend_fn, args.rtt_ms, args.per_query_ms, args.backend_concurrency)
+
+    print(f"callers={args.callers} requests/caller={args.requests} "
+          f"{'hosts=' + args.hosts if args.hosts else f'rtt={args.rtt_ms}ms backend_concurrency={args.backend_concurrency}'}")
+
+    backend = make_backend()
+    result = run(backend, queries, args.callers, args.requests)
+    round_trips = getattr(backend, "round_trips", args.callers * args.requests)
+    print(f"{'direct':>14}: p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+          f"p99={result['p99_ms']:.2f}ms qps={result['qps']:.0f} round_trips={round_trips}")
+
+    for window_ms in args.windows:
+        backend = make_backend()
+        dispatcher = MicroBatchDispatcher(search_fn=backend,
+                                          window_ms=window_ms,
+                                          max_batch_size=args.max_batch_size,
+                                          max_inflight=args.max_inflight)
+        result = run(dispatcher.search, queries, args.callers, args.requests)
+        stats = dispatcher.stats()
+        dispatcher.close()
+        print(f"{f'window={window_ms}ms':>14}: p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+              f"p99={result['p99_ms']:.2f}ms qps={result['qps']:.0f} round_trips={stats['batches']} "
+              f"avg_batch={stats['avg_batch_size']:.1f}")
+
+    if elastic is not None:
+        elastic.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Benchmark offline toàn bộ các bước của respose_chatbot với LLM, embedder giả và các engine local:
+    - route: agent chọn tool
+    - extract: extract_info (luật + LLM giả khi cần)
+    - retrieve: query của từng engine (columnar, qdrant :memory:, chroma local, elasticsearch nếu có --hosts)
+    - generate: LLM giả sinh câu trả lời
+    - end_to_end: stream_chatbot, kèm time to first token
+Với mỗi kích thước catalog (nhân bản từ 300productions.xlsx) đo tốc độ ingest, peak memory khi ingest
+và độ trễ retrieve của từng engine. Kết quả ghi ra json để so sánh giữa các commit.
+
+    PYTHONPATH=source python -m benchmarks.bench_pipeline --sizes 249 10000
+    PYTHONPATH=source python -m benchmarks.bench_pipeline --sizes 100000 1000000 --engines columnar qdrant
+    PYTHONPATH=source python -m benchmarks.bench_pipeline --compare data/bench/<file cũ>.json
+"""
+import os
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import gc
+import sys
+import json
+import time
+import shutil
+import resource
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.globals import set_llm_cache
+
+from catalog import CATALOG
+from config import ArgAnswerCache, ArgChroma
+from benchmarks.synthetic import synthesize_catalog
+from benchmarks.fakes import FakeDenseModel, FakeSparseModel
+from benchmarks.bench_extract import SAMPLE_QUERIES
+
+ENGINES = ("columnar", "qdrant", "chroma", "elasticsearch")
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies, dtype=np.float64)
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()) * 1000,
+        "p50_ms": float(np.percentile(values, 50)) * 1000,
+        "p95_ms": float(np.percentile(values, 95)) * 1000,
+        "p99_ms": float(np.percentile(values, 99)) * 1000,
+        "qps": float(len(values) / values.sum()) if values.sum() > 0 else 0.0,
+    }
+
+
+def timed(fn: Callable, inputs: List[Any], iterations: int) -> List[float]:
+    latencies = []
+    for _ in range(iterations):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def max_rss_mb() -> float:
+    # linux trả về KB, macOS trả về byte
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def bench_stages(questions: List[str], iterations: int) -> Dict[str, Dict[str, float]]:
+    """Các bước không phụ thuộc kích thước catalog"""
+    from main import route_question, build_prompt, stream_chatbot
+    from extract_specifications import extract_info
+    from registry import REGISTRY
+
+    llm = REGISTRY.get_llm(llm_type="openai")
+    results = {
+        "route": summarize(timed(route_question, questions, iterations)),
+        "extract": summarize(timed(lambda q: extract_info(query_user=q, type_client="openai"),
+                                   questions, iterations)),
+        "generate": summarize(timed(lambda q: llm.invoke(input=build_prompt(question=q, context="")),
+                                    questions, iterations)),
+    }
+
+    ttfts, latencies = [], []
+    for _ in range(iterations):
+        for question in questions:
+            done = list(stream_chatbot(None, question, "columnar", "openai"))[-1]
+            ttfts.append(done.data["ttft"] or done.data["latency"])
+            latencies.append(done.data["latency"])
+    results["end_to_end"] = summarize(latencies)
+    results["end_to_end_ttft"] = summarize(ttfts)
+    return results
+
+
+def build_engine(name: str, df, workdir: str, hosts: Optional[str]):
+    if name == "columnar":
+        from vectorstore.columnar import ColumnarQueryEngine
+        return ColumnarQueryEngine(df=df)
+
+    if name == "qdrant":
+        from vectorstore.qdrant import QdrantQueryEngine
+        return QdrantQueryEngine(url=":memory:", api_key=None, df=df,
+                                 dense_model=FakeDenseModel(), sparse_model=FakeSparseModel())
+
+    if name == "chroma":
+        from vectorstore.chroma import EnsembleQueryEngine
+        from registry import REGISTRY
+
+        class LocalEnsembleQueryEngine(EnsembleQueryEngine):
+            config = ArgChroma(db_persist_path=os.path.join(workdir, "chroma_db"),
+                               bm25_index_path=os.path.join(workdir, "bm25_index"))
+
+        return LocalEnsembleQueryEngine(embedder=REGISTRY.get_embedder(embedder_type="openai"), df=df)
+
+    if name == "elasticsearch":
+        from vectorstore.elastic_search import ElasticQueryEngine
+        engine = ElasticQueryEngine(cloud_id=None, api_key=None, hosts=hosts,
+                                    dataframe=df, index_name="bench_pipeline")
+        engine.client.indices.delete(index=engine.index_name, ignore_unavailable=True)
+        engine.upsert(df)
+        engine.client.indices.refresh(index=engine.index_name)
+        return engine
+    raise ValueError(f"Unknown engine: {name}")
+
+
+def bench_engine(name: str, df, requests: List[Dict[str, Any]], iterations: int, hosts: Optional[str]) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    engine = None
+    try:
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        engine = build_engine(name, df, workdir, hosts)
+        ingest_seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = timed(lambda request: engine.query(query=request["question"], demands=request["demands"]),
+                          requests, iterations)
+        return {
+            "rows": len(df),
+            "ingest_seconds": ingest_seconds,
+            "ingest_rows_per_s": len(df) / ingest_seconds if ingest_seconds else 0.0,
+            "ingest_peak_mem_mb": peak / 1024 ** 2,
+            "retrieve": summarize(latencies),
+        }
+    except Exception as e:
+        return {"rows": len(df), "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if engine is not None:
+            try:
+                if name == "elasticsearch":
+                    engine.client.indices.delete(index=engine.index_name, ignore_unavailable=True)
+                engine.close()
+            except Exception:
+                pass
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """In chênh lệch p50/p95 và tốc độ ingest so với 1 lần chạy trước"""
+    def delta(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\ncompare with {baseline['meta']['commit']} ({baseline['meta']['timestamp']})")
+    for stage, stats in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if old:
+            print(f"  {stage:<16} p50 {delta(stats['p50_ms'], old['p50_ms']):>8}  "
+                  f"p95 {delta(stats['p95_ms'], old['p95_ms']):>8}")
+    for engine, sizes in current["engines"].items():
+        for size, stats in sizes.items():
+            old = baseline.get("engines", {}).get(engine, {}).get(size)
+            if not old or "error" in old or "error" in stats:
+                continue
+            print(f"  {engine:<13} {size:>8}  retrieve p50 {delta(stats['retrieve']['p50_ms'], old['retrieve']['p50_ms']):>8}  "
+                  f"p95 {delta(stats['retrieve']['p95_ms'], old['retrieve']['p95_ms']):>8}  "
+                  f"ingest {delta(stats['ingest_rows_per_s'], old['ingest_rows_per_s']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[249, 10000])
+    parser.add_argument("--engines", nargs="+", default=["columnar", "qdrant", "chroma"], choices=ENGINES)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--hosts", type=str, default=None, help="Elasticsearch cho engine elasticsearch")
+    parser.add_argument("--output", type=str, default="data/bench")
+    parser.add_argument("--compare", type=str, default=None, help="file json của lần chạy trước")
+    args = parser.parse_args()
+
+    # đo chi phí thật của từng bước, không để cache trả lời thay
+    ArgAnswerCache.enabled = False
+    set_llm_cache(None)
+
+    from extract_specifications import extract_info
+    questions = SAMPLE_QUERIES
+    requests = [{"question": q, "demands": extract_info(query_user=q, type_client="openai")} for q in questions]
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "stages": bench_stages(questions, args.iterations),
+        "engines": {},
+    }
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<16} p50={stats['p50_ms']:8.3f}ms p95={stats['p95_ms']:8.3f}ms "
+              f"p99={stats['p99_ms']:8.3f}ms qps={stats['qps']:10.1f}")
+
+    base_df = CATALOG.dataframe
+    for size in args.sizes:
+        df = base_df if size == len(base_df) else synthesize_catalog(base_df, num_rows=size)
+        for engine in args.engines:
+            if engine == "elasticsearch" and not args.hosts:
+                continue
+            stats = bench_engine(engine, df, requests, args.iterations, args.hosts)
+            results["engines"].setdefault(engine, {})[str(size)] = stats
+            if "error" in stats:
+                print(f"{engine:<13} {size:>8} rows: FAILED {stats['error']}")
+            else:
+                print(f"{engine:<13} {size:>8} rows: ingest {stats['ingest_rows_per_s']:10.0f} rows/s "
+                      f"peak {stats['ingest_peak_mem_mb']:8.1f}MB  retrieve p50={stats['retrieve']['p50_ms']:.3f}ms "
+                      f"p95={stats['retrieve']['p95_ms']:.3f}ms p99={stats['retrieve']['p99_ms']:.3f}ms")
+    results["process"] = {"max_rss_mb": max_rss_mb()}
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"bench-{results['meta']['commit']}-"
+                                     f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nmax rss: {results['process']['max_rss_mb']:.1f}MB, results: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+So sánh hybrid search của QdrantQueryEngine khi filter trong từng prefetch (range_pushdown=True)
+với cách cũ (chỉ lọc group sau khi fusion) trên cùng bộ demands ngẫu nhiên:
+    - precision: tỉ lệ kết quả trả về thỏa group và mọi khoảng thông số của demands
+    - recall@k: số kết quả thỏa điều kiện / min(top_k, số sản phẩm thỏa điều kiện trong catalog)
+    - độ trễ p50/p95 của query
+Mặc định chạy Qdrant :memory: với embedder giả. Chế độ local không dùng payload index,
+muốn đo độ trễ có index thì chạy với --url của Qdrant server.
+
+    PYTHONPATH=source python -m benchmarks.bench_qdrant_filters --size 10000 --samples 200
+    PYTHONPATH=source python -m benchmarks.bench_qdrant_filters --url http://localhost:6333
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Set
+
+from catalog import CATALOG
+from config import ArgQdrant
+from utils import DEMAND_COLUMNS, normalize_specifications, parse_specification_range
+from vectorstore.qdrant import QdrantQueryEngine
+from benchmarks.fakes import FakeDenseModel, FakeSparseModel
+from benchmarks.synthetic import synthesize_catalog
+from benchmarks.parity_columnar import sample_demands
+
+MODES = {"post_filter": False, "pushdown": True}
+
+
+def relevant_ids(df: pd.DataFrame, demands: Dict[str, Any]) -> Set[Any]:
+    """Sản phẩm thỏa group và mọi khoảng thông số, tính thẳng trên dataframe"""
+    mask = (df["group_product_name"] == demands["group"]).to_numpy()
+    for dimension, column in DEMAND_COLUMNS.items():
+        if demands.get(dimension):
+            min_value, max_value = parse_specification_range(demands[dimension])
+            mask = mask & df[column].between(min_value, max_value).to_numpy()
+    return set(df.loc[mask, "product_info_id"])
+
+
+def question_of(demands: Dict[str, Any]) -> str:
+    return " ".join(str(value) for key, value in demands.items()
+                    if value and key in ("object", *DEMAND_COLUMNS) and value not in ("BIGGEST", "SMALLEST"))
+
+
+def run_mode(engine: QdrantQueryEngine, df: pd.DataFrame, samples: List[Dict[str, Any]],
+             range_pushdown: bool, top_k: int) -> Dict[str, float]:
+    engine.config = ArgQdrant(top_k=top_k, score_threshold=0.0, range_pushdown=range_pushdown)
+    precisions, recalls, latencies, empty = [], [], [], 0
+    for demands in samples:
+        relevant = relevant_ids(df, demands)
+        start = time.perf_counter()
+        records = engine.search_records(query=question_of(demands), demands=demands)
+        latencies.append(time.perf_counter() - start)
+
+        hits = sum(record["product_info_id"] in relevant for record in records)
+        empty += not records
+        precisions.append(hits / len(records) if records else float(not relevant))
+        if relevant:
+            recalls.append(hits / min(top_k, len(relevant)))
+    return {
+        "precision": float(np.mean(precisions)),
+        "recall_at_k": float(np.mean(recalls)) if recalls else float("nan"),
+        "empty_results": empty,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=None, help="nhân bản catalog tới số dòng này")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=ArgQdrant.top_k)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", type=str, default=":memory:")
+    parser.add_argument("--api-key", type=str, default=None)
+    args = parser.parse_args()
+
+    df = CATALOG.dataframe
+    if args.size and args.size != len(df):
+        df = synthesize_catalog(df, num_rows=args.size)
+    df = normalize_specifications(df)
+
+    engine = QdrantQueryEngine(url=args.url, api_key=args.api_key, df=df,
+                               index_name="bench_qdrant_filters",
+                               dense_model=FakeDenseModel(), sparse_model=FakeSparseModel())
+    samples = sample_demands(df, args.samples, args.seed)
+    # chạy 1 lượt để embedding của câu hỏi nằm sẵn trong cache, chỉ đo phần search
+    run_mode(engine, df, samples, range_pushdown=True, top_k=args.top_k)
+
+    print(f"rows: {len(df)}, samples: {len(samples)}, top_k: {args.top_k}, url: {args.url}")
+    for mode, range_pushdown in MODES.items():
+        stats = run_mode(engine, df, samples, range_pushdown=range_pushdown, top_k=args.top_k)
+        print(f"{mode:<12} precision={stats['precision']:.3f} recall@k={stats['recall_at_k']:.3f} "
+              f"empty={stats['empty_results']:<4} p50={stats['p50_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms")
+
+    if args.url != ":memory:":
+        engine.client.delete_collection(collection_name=engine.index_name)
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import zlib
+import numpy as np
+from typing import Iterable, Iterator, List
+
+TOKEN_SPACE = 1 << 20
+
+
+class FakeSparseEmbedding:
+    """Cùng interface với SparseEmbedding của fastembed (indices, values, as_object)"""
+    def __init__(self, indices: np.ndarray, values: np.ndarray):
+        self.indices = indices
+        self.values = values
+
+    def as_object(self):
+        return {"indices": self.indices.tolist(), "values": self.values.tolist()}
+
+
+class FakeDenseModel:
+    """
+    Thay cho fastembed.TextEmbedding khi benchmark: vector ngẫu nhiên seed theo crc32 của text,
+    cùng text luôn ra cùng vector và không cần tải model.
+    """
+    model_name = "fake-dense"
+
+    def __init__(self, size: int = 768):
+        self.size = size
+
+    def embed(self, documents: Iterable[str], batch_size: int = 256, **kwargs) -> Iterator[np.ndarray]:
+        for text in documents:
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            vector = rng.standard_normal(self.size).astype(np.float32)
+            yield vector / np.linalg.norm(vector)
+
+
+class FakeSparseModel:
+    """Thay cho fastembed.SparseTextEmbedding: bag of words với token được hash vào TOKEN_SPACE"""
+    model_name = "fake-sparse"
+
+    def embed(self, documents: Iterable[str], batch_size: int = 256, **kwargs) -> Iterator[FakeSparseEmbedding]:
+        for text in documents:
+            tokens: List[int] = [zlib.crc32(token.encode("utf-8")) % TOKEN_SPACE for token in text.lower().split()]
+            indices, counts = np.unique(np.asarray(tokens, dtype=np.int64), return_counts=True)
+            yield FakeSparseEmbedding(indices=indices, values=counts.astype(np.float32))
@@ -0,0 +1,149 @@
+"""
+Kiểm tra ColumnarQueryEngine trả về cùng kết quả với truy vấn do ElasticQueryBuilder tạo ra.
+
+Mặc định so với 1 bộ thực thi tham chiếu viết thẳng bằng python (match OR token, BM25 của Elasticsearch,
+range, sort), có --hosts thì so thêm với Elasticsearch thật.
+
+    PYTHONPATH=source python -m benchmarks.parity_columnar --samples 500
+    PYTHONPATH=source python -m benchmarks.parity_columnar --hosts http://localhost:9200
+"""
+import math
+import time
+import random
+import argparse
+import numpy as np
+import pandas as pd
+from collections import Counter
+from typing import Any, Dict, List
+
+from catalog import CATALOG
+from config import AragProduct
+from vectorstore.bm25_index import tokenize
+from vectorstore.columnar import ColumnarQueryEngine, ES_K1, ES_B
+
+SPEC_CHOICES = {
+    "price": ["", "", "BIGGEST", "SMALLEST", "dưới 5 triệu", "từ 5 đến 15 triệu", "khoảng 8 triệu", "trên 20 triệu"],
+    "power": ["", "", "", "BIGGEST", "SMALLEST", "1000W", "từ 500W đến 2000W", "12000 btu"],
+    "weight": ["", "", "", "BIGGEST", "SMALLEST", "5 kg", "từ 2 đến 10 kg"],
+    "volume": ["", "", "", "BIGGEST", "SMALLEST", "20 lít", "từ 1 đến 5 lít"],
+}
+
+
+class ReferenceExecutor:
+    """Thực thi truy vấn Elasticsearch từng dòng một, không dùng index, chỉ để đối chiếu"""
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        self.records = self.df.to_dict("records")
+        self.fields = {}
+        for name in ("group_product_name", "group_name"):
+            docs = [Counter(tokenize(str(value))) for value in self.df[name]]
+            doc_freq = Counter(token for doc in docs for token in doc)
+            avg_len = sum(sum(doc.values()) for doc in docs) / len(docs)
+            self.fields[name] = (docs, doc_freq, avg_len)
+
+    def _bm25(self, name: str, text: str, row: int) -> float:
+        docs, doc_freq, avg_len = self.fields[name]
+        doc, num_docs = docs[row], len(docs)
+        doc_len = sum(doc.values())
+        score = 0.0
+        for token in tokenize(text or ""):
+            tf = doc.get(token, 0)
+            if tf:
+                idf = math.log(1 + (num_docs - doc_freq[token] + 0.5) / (doc_freq[token] + 0.5))
+                score += idf * tf * (ES_K1 + 1) / (tf + ES_K1 * (1 - ES_B + ES_B * doc_len / avg_len))
+        return score
+
+    def execute(self, query: Dict[str, Any]) -> List[Any]:
+        hits = []
+        for row, record in enumerate(self.records):
+            score, matched = 0.0, True
+            for clause in query["query"]["bool"]["must"]:
+                if "match" in clause:
+                    (name, text), = clause["match"].items()
+                    field_score = self._bm25(name, text, row)
+                    matched &= field_score > 0
+                    score += field_score
+                else:
+                    (name, bounds), = clause["range"].items()
+                    value = record[name]
+                    matched &= not pd.isna(value) and bounds["gte"] <= value <= bounds.get("lte", float("inf"))
+                    score += 1.0
+            if matched:
+                hits.append((row, score))
+
+        if query.get("sort"):
+            (name, spec), = query["sort"][0].items()
+            sign = -1 if spec["order"] == "desc" else 1
+            # thiếu giá trị xếp cuối như Elasticsearch
+            hits.sort(key=lambda hit: (pd.isna(self.records[hit[0]][name]),
+                                       sign * np.nan_to_num(self.records[hit[0]][name]), hit[0]))
+        else:
+            hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        return [self.records[row]["product_info_id"] for row, _ in hits[:query["size"]]]
+
+
+def sample_demands(df: pd.DataFrame, num_samples: int, seed: int) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    groups = list(AragProduct.LIST_GROUP_NAME)
+    samples = []
+    for _ in range(num_samples):
+        group = rng.choice(groups)
+        names = df.loc[df["group_product_name"] == group, "product_name"].tolist() or [group]
+        words = tokenize(rng.choice(names))
+        start = rng.randrange(len(words)) if words else 0
+        obj = rng.choice([group, " ".join(words[start:start + 2]), rng.choice(names), "sản phẩm"])
+        demand = {"group": group, "object": obj}
+        demand.update({key: rng.choice(values) for key, values in SPEC_CHOICES.items()})
+        samples.append(demand)
+    return samples
+
+
+def ids_of(response: Dict) -> List[Any]:
+    return [hit["_source"]["product_info_id"] for hit in response["hits"]["hits"]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hosts", type=str, default=None, help="so sánh thêm với Elasticsearch thật")
+    args = parser.parse_args()
+
+    df = CATALOG.dataframe
+    engine = ColumnarQueryEngine(df=df)
+    reference = ReferenceExecutor(df)
+    elastic = None
+    if args.hosts:
+        from vectorstore.elastic_search import ElasticQueryEngine
+        elastic = ElasticQueryEngine(cloud_id=None, api_key=None, dataframe=df, hosts=args.hosts)
+        elastic.client.indices.refresh(index=elastic.index_name)
+
+    mismatches = {"reference": 0, "elasticsearch": 0}
+    latencies, num_queries = [], 0
+    for demands in sample_demands(df, args.samples, args.seed):
+        for query in engine._build_queries(demands):
+            num_queries += 1
+            start = time.perf_counter()
+            got = ids_of(engine.execute(query))
+            latencies.append(time.perf_counter() - start)
+
+            expected = reference.execute(query)
+            if got != expected:
+                mismatches["reference"] += 1
+                print(f"[reference] {demands}\n    columnar={got}\n    expected={expected}")
+
+            if elastic is not None:
+                expected = ids_of(elastic.bulk_search_products([query])[0])
+                if got != expected:
+                    mismatches["elasticsearch"] += 1
+                    print(f"[elasticsearch] {demands}\n    columnar={got}\n    elastic={expected}")
+
+    print(f"queries: {num_queries}, mismatches: {mismatches}")
+    print(f"columnar latency: p50={np.percentile(latencies, 50) * 1000:.3f}ms "
+          f"p95={np.percentile(latencies, 95) * 1000:.3f}ms")
+    if elastic is not None:
+        elastic.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from utils import CANONICAL_COLUMNS, normalize_specifications
+
+
+def synthesize_catalog(df: pd.DataFrame, num_rows: int, seed: int=0) -> pd.DataFrame:
+    """
+    Nhân bản catalog gốc lên num_rows sản phẩm để benchmark.
+    Mỗi bản sao có product_info_id mới, giá và số lượng bán được làm nhiễu ±20%
+    để các range filter và sort không trả về cùng 1 kết quả.
+    """
+    rng = np.random.default_rng(seed)
+    positions = np.resize(np.arange(len(df)), num_rows)
+    synthetic = df.iloc[positions].reset_index(drop=True)
+
+    copy_index = np.arange(num_rows) // len(df)
+    synthetic['product_info_id'] = np.arange(num_rows, dtype=np.int64) + 1
+    synthetic['product_name'] = synthetic['product_name'].astype(str) + np.where(
+        copy_index > 0, " #" + copy_index.astype(str), "")
+    synthetic['lifecare_price'] = (synthetic['lifecare_price'] * rng.uniform(0.8, 1.2, num_rows)).round(-3)
+    synthetic['sold_quantity'] = (synthetic['sold_quantity'] * rng.uniform(0.8, 1.2, num_rows)).astype(np.int64)
+    # giá đã bị làm nhiễu -> tính lại các cột chuẩn hóa
+    synthetic = synthetic.drop(columns=[column for _, column in CANONICAL_COLUMNS.values()], errors="ignore")
+    return normalize_specifications(synthetic)
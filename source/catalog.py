@@ -0,0 +1,134 @@
+import os
+import threading
+import pandas as pd
+from dataclasses import dataclass, field
+from hashlib import md5
+from typing import Any, Dict, List, Optional
+
+from config import AragProduct
+from utils import Logger, load_json, write_json, normalize_specifications
+
+LOGGER = Logger(name=__file__, log_file="catalog.log")
+# tăng khi cấu trúc snapshot thay đổi để snapshot cũ được dựng lại
+SNAPSHOT_VERSION = 2
+
+
+@dataclass
+class ProductCatalog:
+    """
+    Đọc file xlsx của catalog đúng 1 lần và lưu lại dưới dạng snapshot Parquet.
+    Các lần sau (kể cả ở worker khác) chỉ đọc snapshot, snapshot bị làm mới khi
+    file nguồn thay đổi (so sánh mtime/size, sau đó tới md5 nội dung). Mỗi lần truy cập
+    chỉ tốn 1 os.stat để phát hiện file nguồn đã bị sửa trong lúc process đang chạy.
+
+    >>> examples:
+        CATALOG.group_names     # chỉ đọc cột group_product_name
+        CATALOG.dataframe       # toàn bộ dataframe
+    """
+    source_path: str = AragProduct.DATA_PATH
+    snapshot_path: str = AragProduct.SNAPSHOT_PATH
+    _dataframe: Optional[pd.DataFrame] = field(default=None, init=False, repr=False)
+    _group_names: Optional[List[str]] = field(default=None, init=False, repr=False)
+    _fingerprint: Optional[str] = field(default=None, init=False, repr=False)
+    _stat: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.splitext(self.snapshot_path)[0] + ".meta.json"
+
+    @property
+    def fingerprint(self) -> str:
+        """md5 của file nguồn mà snapshot hiện tại được tạo ra từ đó"""
+        self._ensure_snapshot()
+        return self._fingerprint
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        if self._dataframe is None:
+            self._ensure_snapshot()
+            with self._lock:
+                if self._dataframe is None:
+                    self._dataframe = pd.read_parquet(self.snapshot_path, memory_map=True)
+        return self._dataframe
+
+    @property
+    def group_names(self) -> List[str]:
+        if self._group_names is None:
+            self._ensure_snapshot()
+            with self._lock:
+                if self._group_names is None:
+                    column = pd.read_parquet(self.snapshot_path, 
+                                             columns=['group_product_name'], 
+                                             memory_map=True)['group_product_name']
+                    self._group_names = pd.unique(column.dropna()).tolist()
+        return self._group_names
+
+    def refresh(self):
+        """Bỏ dữ liệu đang giữ trong bộ nhớ, lần truy cập sau sẽ kiểm tra lại snapshot"""
+        with self._lock:
+            self._dataframe = None
+            self._group_names = None
+            self._fingerprint = None
+            self._stat = None
+
+    def _source_stat(self) -> Dict[str, Any]:
+        stat = os.stat(self.source_path)
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    def _source_md5(self) -> str:
+        hasher = md5()
+        with open(self.source_path, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _ensure_snapshot(self):
+        if self._fingerprint is not None:
+            try:
+                if self._source_stat() == self._stat:
+                    return
+            except OSError:
+                return  # file nguồn tạm thời không đọc được, giữ snapshot hiện tại
+            LOGGER.log.info(f"Catalog source changed: {self.source_path}")
+            self.refresh()
+
+        with self._lock:
+            if self._fingerprint is not None:
+                return
+
+            stat = self._source_stat()
+            meta = load_json(self.meta_path)
+            if os.path.exists(self.snapshot_path) and meta and meta.get('version') == SNAPSHOT_VERSION:
+                if all(meta.get(key) == value for key, value in stat.items()):
+                    self._fingerprint, self._stat = meta['md5'], stat
+                    return
+
+                # mtime thay đổi nhưng nội dung có thể vẫn như cũ (copy, touch, checkout...)
+                source_md5 = self._source_md5()
+                if meta.get('md5') == source_md5:
+                    write_json(json_obj={**meta, **stat}, file_name=self.meta_path)
+                    self._fingerprint, self._stat = source_md5, stat
+                    return
+            else:
+                source_md5 = self._source_md5()
+
+            self._build_snapshot(stat=stat, source_md5=source_md5)
+            self._fingerprint, self._stat = source_md5, stat
+
+    def _build_snapshot(self, stat: Dict[str, Any], source_md5: str):
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+
+        # chuẩn hóa đơn vị thông số 1 lần tại đây, các engine dùng lại cột đã chuẩn hóa
+        df = normalize_specifications(pd.read_excel(self.source_path))
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        # ghi file tạm rồi rename để worker khác không đọc phải snapshot ghi dở
+        os.replace(tmp_path, self.snapshot_path)
+        write_json(json_obj={**stat, "md5": source_md5, "version": SNAPSHOT_VERSION}, file_name=self.meta_path)
+
+        self._dataframe = df
+        LOGGER.log.info(f"Build catalog snapshot: {self.snapshot_path} ({len(df)} rows)")
+
+
+CATALOG = ProductCatalog()
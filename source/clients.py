@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import httpx
+import threading
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Literal, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+
+from config import ArgClient, ArgLLM
+from utils import Logger
+
+LOGGER = Logger(name=__file__, log_file="clients.log")
+
+FAKE_ROUTES = [
+    ("product_order", r"đặt hàng|chốt đơn|thanh toán|giao hàng|vận chuyển|đơn hàng"),
+    ("general_info_search", r"bảo hành|đổi trả|hướng dẫn|còn hàng|hết hàng"),
+    ("search_web", r"hôm nay|tin tức|thời tiết|mới nhất"),
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model offline cho test và benchmark.
+    Khi được bind functions (agent chọn tool) thì trả về function_call theo từ khóa trong câu hỏi,
+    ngược lại trả về câu trả lời cố định dựa trên câu hỏi.
+    """
+    default_route: str = "product_search"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _route(self, text: str) -> str:
+        for tool_name, pattern in FAKE_ROUTES:
+            if re.search(pattern, text, re.IGNORECASE):
+                return tool_name
+        return self.default_route
+
+    def _respond(self, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        text = str(messages[-1].content)
+        if kwargs.get("functions"):
+            function_call = {"name": self._route(text), "arguments": "{}"}
+            return AIMessage(content="", additional_kwargs={"function_call": function_call})
+        return AIMessage(content=f"Câu trả lời cho: {text[:200]}")
+
+    def _generate(self, 
+                  messages: List[BaseMessage], 
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, 
+                  **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, **kwargs))])
+
+    def _stream(self, 
+                messages: List[BaseMessage], 
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, 
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message = self._respond(messages, **kwargs)
+        if message.additional_kwargs:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", 
+                                                             additional_kwargs=message.additional_kwargs))
+            return
+        for token in re.findall(r"\S+\s*", message.content):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeCompletionsClient:
+    """
+    Thay thế OpenAI/Groq client cho extract_info khi chạy offline.
+    Trả về function calling arguments với group rỗng và object là câu hỏi gốc.
+    """
+    def __init__(self, is_async: bool=False):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._acreate if is_async else self._create))
+
+    @staticmethod
+    def _response(messages: List[Dict[str, str]]) -> SimpleNamespace:
+        query = messages[-1]['content']
+        arguments = json.dumps({"group": "", "object": query, "price": "", "power": "", 
+                                "weight": "", "volume": "", "intent": ""}, ensure_ascii=False)
+        function = SimpleNamespace(name="get_specifications", arguments=arguments)
+        message = SimpleNamespace(content=None, tool_calls=[SimpleNamespace(function=function)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _create(self, messages: List[Dict[str, str]], **kwargs) -> SimpleNamespace:
+        return self._response(messages)
+
+    async def _acreate(self, messages: List[Dict[str, str]], **kwargs) -> SimpleNamespace:
+        return self._response(messages)
+
+
+@tool
+def fake_web_search(query: str) -> List[Dict[str, str]]:
+    """Search web offline: trả về 1 kết quả cố định"""
+    return [{"url": "https://example.com", "content": f"Kết quả tìm kiếm cho: {query}"}]
+
+
+@dataclass
+class ClientManager:
+    """
+    Nơi duy nhất tạo client cho các provider LLM: 1 connection pool httpx (keep-alive) dùng chung
+    cho OpenAI và Groq, timeout và retry/backoff lấy từ ArgClient.
+    provider="fake" (hoặc biến môi trường LLM_PROVIDER=fake) trả về các backend giả để test offline.
+
+    >>> examples:
+        CLIENTS.completion_client("groq").chat.completions.create(...)
+        CLIENTS.chat_model(llm_type="openai")
+    """
+    provider: Optional[str] = field(default_factory=lambda: os.getenv("LLM_PROVIDER"))
+    config: ArgClient = field(default_factory=ArgClient)
+    _clients: Dict[str, Any] = field(default_factory=dict, init=False, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, init=False, repr=False)
+
+    @property
+    def is_fake(self) -> bool:
+        return self.provider == "fake"
+
+    def _get(self, key: str, factory):
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory()
+        return client
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.config.timeout, connect=self.config.connect_timeout)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.config.max_connections,
+                            max_keepalive_connections=self.config.max_keepalive_connections,
+                            keepalive_expiry=self.config.keepalive_expiry)
+
+    @property
+    def http_client(self) -> httpx.Client:
+        return self._get("http", lambda: httpx.Client(timeout=self._timeout(), limits=self._limits()))
+
+    @property
+    def async_http_client(self) -> httpx.AsyncClient:
+        return self._get("async_http", lambda: httpx.AsyncClient(timeout=self._timeout(), limits=self._limits()))
+
+    def completion_client(self, type_client: Literal['groq', 'openai']):
+        """Client dạng OpenAI SDK (chat.completions.create) dùng cho function calling"""
+        if self.is_fake:
+            return self._get("fake_completion", FakeCompletionsClient)
+
+        def _factory():
+            kwargs = dict(http_client=self.http_client, 
+                          timeout=self._timeout(), 
+                          max_retries=self.config.max_retries)
+            if type_client == 'groq':
+                from groq import Groq
+                return Groq(**kwargs)
+            from openai import OpenAI
+            return OpenAI(**kwargs)
+
+        return self._get(f"completion:{type_client}", _factory)
+
+    def async_completion_client(self, type_client: Literal['groq', 'openai']):
+        if self.is_fake:
+            return self._get("fake_async_completion", lambda: FakeCompletionsClient(is_async=True))
+
+        def _factory():
+            kwargs = dict(http_client=self.async_http_client, 
+                          timeout=self._timeout(), 
+                          max_retries=self.config.max_retries)
+            if type_client == 'groq':
+                from groq import AsyncGroq
+                return AsyncGroq(**kwargs)
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(**kwargs)
+
+        return self._get(f"async_completion:{type_client}", _factory)
+
+    def chat_model(self, llm_type: Literal['groq', 'openai'], model_name: str=None) -> BaseChatModel:
+        if self.is_fake:
+            return self._get("fake_chat_model", FakeChatModel)
+
+        if model_name is None:
+            model_name = ArgLLM.openai_model if llm_type == 'openai' else ArgLLM.groq_model
+
+        def _factory():
+            kwargs = dict(model=model_name,
+                          http_client=self.http_client,
+                          http_async_client=self.async_http_client,
+                          timeout=self.config.timeout,
+                          max_retries=self.config.max_retries)
+            if llm_type == 'openai':
+                from langchain_openai import ChatOpenAI
+                return ChatOpenAI(**kwargs)
+            from langchain_groq import ChatGroq
+            return ChatGroq(**kwargs)
+
+        return self._get(f"chat_model:{llm_type}:{model_name}", _factory)
+
+    def embeddings(self, embedder_type: Literal['openai']):
+        if self.is_fake:
+            return DeterministicFakeEmbedding(size=self.config.fake_embedding_size)
+
+        if embedder_type == 'openai':
+            from langchain_openai import OpenAIEmbeddings
+            return OpenAIEmbeddings(model="text-embedding_ada-002",
+                                    http_client=self.http_client,
+                                    http_async_client=self.async_http_client,
+                                    timeout=self.config.timeout,
+                                    max_retries=self.config.max_retries)
+        return None
+
+    def web_search_tool(self, **kwargs):
+        """
+        Tool search web dùng chung. TavilySearchResults không nhận http client từ ngoài
+        nên chỉ đảm bảo tool được tạo 1 lần cho cả process.
+        """
+        if self.is_fake:
+            return fake_web_search
+
+        def _factory():
+            from langchain_community.tools.tavily_search import TavilySearchResults
+            return TavilySearchResults(**kwargs)
+
+        return self._get("web_search", _factory)
+
+    def close(self):
+        """Đóng pool đồng bộ. Pool async phải được đóng trong event loop của nó bằng aclose()"""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        if "http" in clients:
+            clients["http"].close()
+        async_http = clients.get("async_http")
+        if async_http is not None and not async_http.is_closed:
+            LOGGER.log.warning("Async HTTP client is still open, call aclose() from its event loop "
+                               "to release its connections")
+        LOGGER.log.info("Close LLM clients successfull!")
+
+    async def aclose(self):
+        async_http = self._clients.get("async_http")
+        if async_http is not None:
+            await async_http.aclose()
+        self.close()
+
+
+CLIENTS = ClientManager()
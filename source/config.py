@@ -1,12 +1,80 @@
-import pandas as pd
 from dataclasses import dataclass, field
+from typing import Literal, get_args
+
+SearchType = Literal["elasticsearch", "qdrant", "chroma", "columnar", "memmap"]
+LLMType = Literal["groq", "openai"]
+SEARCH_TYPES = get_args(SearchType)
+LLM_TYPES = get_args(LLMType)
+
+
+class _LazyGroupNames:
+    """Danh sách group sản phẩm, chỉ đọc từ snapshot của catalog ở lần truy cập đầu tiên"""
+    def __get__(self, instance, owner):
+        from catalog import CATALOG
+        return CATALOG.group_names
+
 
 @dataclass
 class AragProduct:
     DATA_PATH: str = "data/300productions.xlsx"
-    LIST_GROUP_NAME = pd.unique(pd.read_excel(DATA_PATH)['group_product_name'].tolist())
+    SNAPSHOT_PATH: str = "data/cache/300productions.parquet"
+    LIST_GROUP_NAME = _LazyGroupNames()
     CACHE_PATH: str = "data/cache/sqlite.db"
     
+@dataclass
+class ArgLLM:
+    openai_model: str = "gpt-4o-mini"
+    groq_model: str = "llama-3.3-70b-specdec"
+    
+@dataclass
+class ArgClient:
+    timeout: float = 30.0
+    connect_timeout: float = 5.0
+    max_retries: int = 3
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    fake_embedding_size: int = 768
+
+@dataclass
+class ArgExtract:
+    use_fast_path: bool = True
+    min_confidence: float = 0.7
+
+@dataclass
+class ArgAnswerCache:
+    enabled: bool = True
+    similarity_threshold: float = 0.92
+    ttl_seconds: float = 3600
+    max_entries: int = 1024
+
+@dataclass
+class ArgContext:
+    enabled: bool = True
+    token_budget: int = 1200
+    spec_snippet_tokens: int = 40
+    web_result_tokens: int = 200
+    tokenizer_encoding: str = "o200k_base"
+
+@dataclass
+class ArgIngest:
+    chunk_size: int = 1000  # số dòng đọc mỗi lần từ file nguồn
+    queue_size: int = 2  # số chunk tối đa chờ ở mỗi sink, sink chậm sẽ chặn việc đọc tiếp
+    sheet_name: str = None  # sheet của file xlsx, None là sheet đầu tiên
+
+@dataclass
+class ArgServer:
+    host: str = "0.0.0.0"
+    port: int = 8000
+    max_concurrency: int = 16
+    max_queue: int = 64
+    queue_timeout: float = 10.0
+    request_timeout: float = 120.0
+    max_body_bytes: int = 64 * 1024
+    search_type: str = "columnar"
+    llm_type: str = "openai"
+    warmup_search_types: tuple = ("columnar",)
+
 @dataclass
 class ArgQdrant:
     top_k: int=3
@@ -14,16 +82,45 @@ class ArgQdrant:
     score_threshold: float = 0.5
     is_with_payload: bool = True
     is_with_vector: bool = False
+    upsert_batch_size: int = 256
+    embed_workers: int = 2
+    upload_queue_size: int = 4
+    range_pushdown: bool = True  # filter group + khoảng thông số bên trong từng prefetch
 
 @dataclass 
 class ArgChroma:
     top_k: int=3
     db_persist_path: str="data/db/chroma_db"
+    bm25_index_path: str="data/db/bm25_index"
+    upsert_batch_size: int=512
     weights_ensemble: list = field(default_factory=lambda: [0.5, 0.5])
+    retriever_timeouts: list = field(default_factory=lambda: [0.5, 2.0])  # giây, theo thứ tự [bm25, mmr]
+    rrf_c: int = 60
+    fusion_workers: int = 16  # thread của mỗi retriever trong fusion, ~ số request đồng thời
     lambda_mult: float=0.25
     fetch_k: int=20
     score_threshold: float=0.75
 
+@dataclass
+class ArgMemmap:
+    top_k: int = 3
+    index_dir: str = "data/db/memmap_index"
+    dtype: str = "float16"  # "float16" hoặc "int8" (kèm scale theo dòng)
+    embed_batch_size: int = 256
+    block_rows: int = 65536  # số dòng mỗi lần nhân ma trận
+    ivf_min_rows: int = 50000  # group có từ ngần này dòng thì chia IVF, 0 để tắt
+    ivf_nprobe: int = 8
+    ivf_iterations: int = 10
+
 @dataclass
 class ArgsElastic:
-    top_k: int=3
\ No newline at end of file
+    top_k: int=3
+    bulk_chunk_size: int=500
+    bulk_thread_count: int=4
+    bulk_max_retries: int=3
+    bulk_initial_backoff: float=2
+    refresh_interval: str="1s"
+    micro_batching: bool=False
+    batch_window_ms: float=2.0
+    batch_max_size: int=64
+    batch_max_inflight: int=4
\ No newline at end of file
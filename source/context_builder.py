@@ -0,0 +1,161 @@
+import re
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from base import ProductHit, format_hits
+from config import ArgContext
+from telemetry import TELEMETRY
+from utils import Logger
+
+LOGGER = Logger(name=__file__, log_file="context_builder.log")
+CONTEXT_TOKENS = TELEMETRY.histogram("context_tokens", "Tokens of the context sent to the generation prompt",
+                                     buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+CONTEXT_SAVED = TELEMETRY.counter("context_tokens_saved_total", "Tokens removed by the context builder")
+
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# thông số trong demands -> (nhãn, thuộc tính của ProductHit, định dạng)
+DEMAND_FIELDS: Dict[str, Tuple[str, str, str]] = {
+    "power": ("Công suất", "power_w", "{:,.0f} W"),
+    "weight": ("Trọng lượng", "weight_kg", "{:g} kg"),
+    "volume": ("Dung tích", "volume_l", "{:g} lít"),
+}
+
+
+@lru_cache(maxsize=4)
+def _get_encoder(encoding: str):
+    """tiktoken nếu có và tải được bảng mã, ngược lại None để dùng cách đếm xấp xỉ"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding)
+    except Exception as e:
+        LOGGER.log.warning(f"tiktoken encoding [{encoding}] unavailable, using approximate token count: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, encoding: str = ArgContext.tokenizer_encoding) -> int:
+    encoder = _get_encoder(encoding)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding: str = ArgContext.tokenizer_encoding) -> str:
+    encoder = _get_encoder(encoding)
+    if encoder is not None:
+        tokens = encoder.encode(text)
+        return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens]) + "..."
+
+    for i, match in enumerate(_APPROX_TOKEN.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip() + "..."
+    return text
+
+
+@dataclass
+class BuiltContext:
+    """Context đã cắt theo token budget, kèm số token so với cách ghép nguyên văn trước đây"""
+    text: str
+    tokens: int
+    raw_tokens: int
+    num_products: int = 0
+    num_duplicates: int = 0
+    num_dropped: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.raw_tokens - self.tokens, 0)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@dataclass
+class ContextBuilder:
+    """
+    Ghép context cho prompt sinh câu trả lời:
+        - gộp sản phẩm trùng product_info_id từ các nguồn, giữ thứ tự xếp hạng
+        - chỉ giữ tên, mã, giá, số lượng đã bán và các thông số có trong demands (power, weight, volume),
+          specifications chỉ giữ 1 đoạn ngắn
+        - cắt kết quả search web và dừng thêm khi vượt token_budget
+
+    >>> examples:
+        built = CONTEXT_BUILDER.build(demands=demands, products=engine.search_records(query=question, demands=demands))
+        prompt = build_prompt(question, built.text)
+        built.saved_tokens
+    """
+    config = ArgContext()
+
+    def _format_product(self, index: int, hit: ProductHit, demands: Dict[str, Any]) -> str:
+        parts = [f"{index}. {hit.product_name or ''} (mã {hit.product_info_id})"]
+
+        if hit.price is not None:
+            parts.append(f"Giá: {hit.price:,.0f} đ")
+        if hit.sold_quantity is not None:
+            parts.append(f"Đã bán: {hit.sold_quantity}")
+
+        for key, (label, name, fmt) in DEMAND_FIELDS.items():
+            value = getattr(hit, name)
+            if demands.get(key) and value is not None:
+                parts.append(f"{label}: {fmt.format(value)}")
+
+        specifications = hit.specifications
+        if specifications and self.config.spec_snippet_tokens > 0:
+            parts.append("Thông số: " + truncate_tokens(str(specifications), self.config.spec_snippet_tokens,
+                                                        self.config.tokenizer_encoding))
+        return " - ".join(parts)
+
+    def build(self,
+              demands: Optional[Dict[str, Any]] = None,
+              products: Optional[List[ProductHit]] = None,
+              web_results: Optional[List[Dict[str, Any]]] = None) -> BuiltContext:
+        """
+        Args:
+            - demands: thông số được extract từ câu hỏi, quyết định field nào được giữ
+            - products: kết quả search_records của các engine, xếp hạng tốt nhất trước
+            - web_results: kết quả search web dạng {"content": ...}
+        Return:
+            - BuiltContext với text vừa token_budget
+        """
+        demands, products, web_results = demands or {}, products or [], web_results or []
+        encoding, budget = self.config.tokenizer_encoding, self.config.token_budget
+
+        seen, unique = set(), []
+        for hit in products:
+            key = str(hit.product_info_id or hit.product_name)
+            if key not in seen:
+                seen.add(key)
+                unique.append(hit)
+
+        # định dạng đầy đủ mà các engine trả về, chỉ dùng để tính số token tiết kiệm
+        raw_text = format_hits(products)
+        raw_text += "".join(result.get("content", "") + "\n" for result in web_results)
+
+        candidates = [self._format_product(i + 1, hit, demands) for i, hit in enumerate(unique)]
+        candidates += [truncate_tokens(result.get("content", ""), self.config.web_result_tokens, encoding)
+                       for result in web_results]
+
+        lines, used, dropped = [], 0, 0
+        for line in candidates:
+            tokens = count_tokens(line, encoding) + 1  # + xuống dòng
+            if used + tokens > budget:
+                dropped += 1
+                continue
+            lines.append(line)
+            used += tokens
+
+        built = BuiltContext(text="\n".join(lines),
+                             tokens=used,
+                             raw_tokens=count_tokens(raw_text, encoding),
+                             num_products=min(len(unique), len(lines)),
+                             num_duplicates=len(products) - len(unique),
+                             num_dropped=dropped)
+        CONTEXT_TOKENS.observe(built.tokens)
+        CONTEXT_SAVED.inc(built.saved_tokens)
+        LOGGER.log.info(f"Context {built.tokens} tokens (raw {built.raw_tokens}, saved {built.saved_tokens}), "
+                        f"{built.num_duplicates} duplicates, {built.num_dropped} dropped")
+        return built
+
+
+CONTEXT_BUILDER = ContextBuilder()
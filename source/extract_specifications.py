@@ -1,60 +1,114 @@
 import os
 import dotenv
-from openai import OpenAI
-from groq import Groq
-from typing import Literal
+from typing import Literal, Dict, Any, Optional
 from utils import parse_string_to_dict, Logger
-from prompt import PROMPT_SYSTEM, FUNC_CALL_TOOLS
+from prompt import PROMPT_SYSTEM, get_func_call_tools
+from clients import CLIENTS
+from config import ArgExtract
+from rule_extractor import extract_rule_based
+from telemetry import TELEMETRY
 
 dotenv.load_dotenv()
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-os.environ['GROQ_API_KEY'] = os.getenv("GROQ_API_KEY")
 
 
 LOGGER = Logger(name=__file__, log_file="extract_query.log")
+EXTRACT_PATH = TELEMETRY.counter("extract_path_total", "Specification extractions by path (rule or llm)")
 
 
-def extract_info(query_user: str,
-                 tools_calling: list[dict]=FUNC_CALL_TOOLS,
-                 prompt_sys: str=PROMPT_SYSTEM['extract_query'],
-                 type_client: Literal["groq", 'openai']="groq"):
-    
+def _build_request(query_user: str,
+                   tools_calling: list[dict],
+                   prompt_sys: str,
+                   type_client: Literal["groq", 'openai']) -> Dict[str, Any]:
+    if tools_calling is None:
+        tools_calling = get_func_call_tools()
+
     messages = [
         {'role': 'system', 'content': prompt_sys},
         {"role": "user", "content": query_user}]
 
-    try:
-        if type_client == 'groq':
-            client = Groq()
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-specdec",
-                messages=messages,
-                tools=tools_calling,
-                tool_choice="auto",  # auto is default, but we'll be explicit
-            )
-
-        else:
-            client = OpenAI()
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                tools=tools_calling,
-                tool_choice="auto",  # auto is default, but we'll be explicit
-            )
+    return dict(
+        model="llama-3.3-70b-specdec" if type_client == 'groq' else "gpt-4o",
+        messages=messages,
+        tools=tools_calling,
+        tool_choice="auto",  # auto is default, but we'll be explicit
+    )
 
-    except Exception as e:
-        LOGGER.log.error(f"An error occurred while create client: [{type_client}]. Error: {str(e)}")
 
+def _parse_response(response) -> Dict[str, Any]:
     arguments = response.choices[0].message.tool_calls[0].function.arguments
     
     specifications = parse_string_to_dict(arguments)
     return specifications
 
 
+def _fast_path(query_user: str, use_fast_path: bool, min_confidence: float) -> Optional[Dict[str, Any]]:
+    """Dùng extractor theo luật, trả về None nếu độ tin cậy thấp để fallback sang LLM"""
+    if not use_fast_path:
+        EXTRACT_PATH.inc(path="llm")
+        return None
+    specifications, confidence = extract_rule_based(query_user)
+    if confidence < min_confidence:
+        LOGGER.log.info(f"Fast path confidence {confidence} < {min_confidence}, fallback to LLM")
+        EXTRACT_PATH.inc(path="llm")
+        return None
+    EXTRACT_PATH.inc(path="rule")
+    return specifications
+
+
+@TELEMETRY.traced("extract")
+def extract_info(query_user: str,
+                 tools_calling: list[dict]=None,
+                 prompt_sys: str=PROMPT_SYSTEM['extract_query'],
+                 type_client: Literal["groq", 'openai']="groq",
+                 use_fast_path: bool=ArgExtract.use_fast_path,
+                 min_confidence: float=ArgExtract.min_confidence):
+    
+    specifications = _fast_path(query_user, use_fast_path, min_confidence)
+    if specifications is not None:
+        return specifications
+
+    request = _build_request(query_user, tools_calling, prompt_sys, type_client)
+
+    try:
+        client = CLIENTS.completion_client(type_client=type_client)
+        response = client.chat.completions.create(**request)
+
+    except Exception as e:
+        LOGGER.log.error(f"An error occurred while calling client: [{type_client}]. Error: {str(e)}")
+        raise
+
+    return _parse_response(response)
+
+
+@TELEMETRY.traced("extract")
+async def aextract_info(query_user: str,
+                        tools_calling: list[dict]=None,
+                        prompt_sys: str=PROMPT_SYSTEM['extract_query'],
+                        type_client: Literal["groq", 'openai']="groq",
+                        use_fast_path: bool=ArgExtract.use_fast_path,
+                        min_confidence: float=ArgExtract.min_confidence):
+    """Giống extract_info nhưng dùng client async của Groq/OpenAI"""
+    specifications = _fast_path(query_user, use_fast_path, min_confidence)
+    if specifications is not None:
+        return specifications
+
+    request = _build_request(query_user, tools_calling, prompt_sys, type_client)
+
+    try:
+        client = CLIENTS.async_completion_client(type_client=type_client)
+        response = await client.chat.completions.create(**request)
+
+    except Exception as e:
+        LOGGER.log.error(f"An error occurred while calling client: [{type_client}]. Error: {str(e)}")
+        raise
+
+    return _parse_response(response)
+
+
 def main():
     arguments = extract_info("Tôi muốn mua điều hòa từ 10 đến 12 triệu")
     for key, value in arguments.items():
         print(f"{key}: {value}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+import pandas as pd
+from queue import Queue
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+from answer_cache import ANSWER_CACHE
+from base import BaseRetriever, UpsertReport
+from config import ArgIngest
+from telemetry import TELEMETRY
+from utils import Logger, normalize_specifications
+
+LOGGER = Logger(name=__file__, log_file="ingest.log")
+INGEST_ROWS = TELEMETRY.counter("ingest_rows_total", "Rows delivered to each ingest sink")
+INGEST_FAILED = TELEMETRY.counter("ingest_failed_rows_total", "Rows an ingest sink failed to write")
+INGEST_CHUNK_LATENCY = TELEMETRY.histogram("ingest_chunk_seconds", "Time an ingest sink spends on one chunk")
+
+_DONE, _ABORT = object(), object()
+
+
+def iter_excel_chunks(path: str, chunk_size: int, sheet_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Đọc xlsx bằng openpyxl read-only: chỉ giữ 1 chunk dòng trong bộ nhớ, dòng đầu là header"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {i}" if name is None else str(name) for i, name in enumerate(header)]
+        # read-only mode có thể trả về các dòng trống ở cuối sheet
+        rows = (row for row in rows if any(value is not None for value in row))
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                return
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_csv_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def iter_parquet_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+
+def iter_chunks(path: str, chunk_size: int = ArgIngest.chunk_size,
+                sheet_name: Optional[str] = ArgIngest.sheet_name) -> Iterator[pd.DataFrame]:
+    """
+    Đọc file catalog theo từng chunk, chọn reader theo đuôi file (.xlsx, .csv, .parquet)
+
+    >>> examples:
+        for chunk in iter_chunks("data/300productions.xlsx", chunk_size=1000):
+            ...
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return iter_excel_chunks(path, chunk_size, sheet_name)
+    if extension == ".csv":
+        return iter_csv_chunks(path, chunk_size)
+    if extension in (".parquet", ".pq"):
+        return iter_parquet_chunks(path, chunk_size)
+    raise ValueError(f"Unsupported catalog format: {path}")
+
+
+@dataclass
+class SinkStats:
+    """Số dòng, thời gian xử lý và UpsertReport cộng dồn của 1 sink"""
+    name: str
+    rows: int = 0
+    chunks: int = 0
+    busy_seconds: float = 0.0
+    report: UpsertReport = field(default_factory=UpsertReport)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.busy_seconds if self.busy_seconds else 0.0
+
+
+@dataclass
+class IngestPipeline:
+    """
+    Ingest catalog theo từng chunk với bộ nhớ không đổi: mỗi chunk được đọc và chuẩn hóa đơn vị 1 lần
+    rồi chuyển tới mọi sink (engine) qua upsert_chunk, cuối cùng gọi finish_ingest của từng sink.
+        - mỗi sink chạy trên 1 thread riêng với queue có giới hạn: sink chậm chặn việc đọc (backpressure),
+          sink nhanh không phải chờ sink chậm xử lý xong từng chunk
+        - đọc file lỗi giữa chừng hoặc sink ghi lỗi 1 chunk thì finish_ingest(complete=False): sink chỉ dọn
+          trạng thái, không prune các sản phẩm chưa được ghi và không dựng lại index từ 1 phần catalog
+        - số dòng, số dòng lỗi và thời gian xử lý từng chunk của mỗi sink được ghi vào TELEMETRY
+        - chỉ nhận sink có streaming_ingest: engine dựng lại index trong bộ nhớ từ cả catalog
+          (ColumnarQueryEngine, MemmapVectorEngine) phải gom đủ catalog nên không giữ được bộ nhớ không đổi
+        - ANSWER_CACHE bị xóa sau khi ingest vì câu trả lời cũ dựa trên dữ liệu trước đó
+
+    >>> examples:
+        pipeline = IngestPipeline(sinks={"qdrant": qdrant_engine, "chroma": chroma_engine})
+        stats = pipeline.run("data/300productions.xlsx")
+        stats["qdrant"].rows_per_second, stats["qdrant"].report
+    """
+    sinks: Dict[str, BaseRetriever]
+    config = ArgIngest()
+
+    def __post_init__(self):
+        not_streaming = [name for name, sink in self.sinks.items() if not sink.streaming_ingest]
+        if not_streaming:
+            raise ValueError(f"Sinks {not_streaming} do not support streamed ingest, call their upsert() "
+                             f"with the full catalog instead")
+
+    def _consume(self, name: str, sink: BaseRetriever, queue: Queue, stats: SinkStats):
+        while True:
+            chunk = queue.get()
+            finished = chunk is _DONE or chunk is _ABORT
+            start = time.perf_counter()
+            try:
+                if finished:
+                    complete = chunk is _DONE and stats.report.failed == 0
+                    if not complete:
+                        reason = "source read failed" if chunk is _ABORT else f"{stats.report.failed} rows failed"
+                        LOGGER.log.warning(f"Ingest to {name} is incomplete ({reason}), finishing without prune")
+                    stats.report.merge(sink.finish_ingest(complete=complete) or UpsertReport())
+                else:
+                    report = sink.upsert_chunk(chunk) or UpsertReport()
+                    stats.report.merge(report)
+                    stats.rows += len(chunk)
+                    stats.chunks += 1
+                    INGEST_ROWS.inc(len(chunk), sink=name)
+                    INGEST_FAILED.inc(report.failed, sink=name)
+            except Exception as e:
+                failed = 0 if finished else len(chunk)
+                stats.report.failed += failed
+                stats.report.errors.append({"sink": name, "error": str(e)})
+                INGEST_FAILED.inc(failed, sink=name)
+                LOGGER.log.error(f"Ingest sink {name} failed: {type(e).__name__}: {str(e)}")
+            elapsed = time.perf_counter() - start
+            stats.busy_seconds += elapsed
+            if finished:
+                return
+            INGEST_CHUNK_LATENCY.observe(elapsed, sink=name)
+
+    @TELEMETRY.traced("ingest")
+    def run(self, source: Union[str, Iterable[pd.DataFrame]]) -> Dict[str, SinkStats]:
+        """
+        Args:
+            - source: đường dẫn file catalog (.xlsx, .csv, .parquet) hoặc iterable các chunk dataframe
+        Return:
+            - SinkStats của từng sink
+        """
+        chunks = iter_chunks(source, self.config.chunk_size, self.config.sheet_name) \
+            if isinstance(source, str) else iter(source)
+        stats = {name: SinkStats(name=name) for name in self.sinks}
+        queues = {name: Queue(maxsize=self.config.queue_size) for name in self.sinks}
+        workers = [threading.Thread(target=self._consume, args=(name, sink, queues[name], stats[name]),
+                                    name=f"ingest-{name}", daemon=True)
+                   for name, sink in self.sinks.items()]
+        for worker in workers:
+            worker.start()
+
+        start, rows, end_marker = time.perf_counter(), 0, _ABORT
+        try:
+            for chunk in chunks:
+                chunk = normalize_specifications(chunk)
+                rows += len(chunk)
+                for queue in queues.values():
+                    queue.put(chunk)
+            end_marker = _DONE
+        finally:
+            for queue in queues.values():
+                queue.put(end_marker)
+            for worker in workers:
+                worker.join()
+            # dữ liệu của các engine đã đổi (kể cả khi chỉ 1 phần) -> câu trả lời đã cache có thể sai
+            ANSWER_CACHE.invalidate()
+
+        elapsed = time.perf_counter() - start
+        for name, sink_stats in stats.items():
+            LOGGER.log.info(f"Ingest {name}: {sink_stats.rows}/{rows} rows in {sink_stats.chunks} chunks, "
+                            f"{sink_stats.rows_per_second:.0f} rows/s, {sink_stats.report.failed} failed")
+        LOGGER.log.info(f"Ingest finished: {rows} rows to {len(self.sinks)} sinks in {elapsed:.2f}s")
+        return stats
@@ -1,60 +1,414 @@
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 import pandas as pd
-from models import create_llm, create_embedder
 from agent import agent
 from tools import search
-from extract_specifications import extract_info
-from vectorstore import (ElasticQueryEngine, 
-                         QdrantQueryEngine,
-                         EnsembleQueryEngine)
-from config import AragProduct
-from typing import Literal
+from extract_specifications import extract_info, aextract_info
+from registry import REGISTRY
+from catalog import CATALOG
+from answer_cache import ANSWER_CACHE
+from telemetry import TELEMETRY
+from context_builder import CONTEXT_BUILDER, BuiltContext
+from config import ArgAnswerCache, ArgContext, SearchType, LLMType
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Literal, Optional, Tuple
 
+# thread pool cho nhánh extract + retrieval chạy song song với bước chọn tool
+SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative")
+
+CHAT_TTFT = TELEMETRY.histogram("chat_ttft_seconds", "Time to first answer token of streamed answers")
+CHAT_LATENCY = TELEMETRY.histogram("chat_latency_seconds", "Total latency of streamed answers")
+
+
+def build_prompt(question: str, context) -> str:
+    return f"""Trả lời câu hỏi: {question} dựa vào thông tin được cung cấp: 
+    context: {context}         
+    """
+
+
+def _question_embedding(question: str, llm_type: LLMType) -> Optional[List[float]]:
+    """Embedding của câu hỏi cho semantic cache, None nếu provider không có embedder"""
+    embedder = REGISTRY.get_embedder(embedder_type=llm_type)
+    return embedder.embed_query(question) if embedder is not None else None
+
+
+def lookup_answer(question: str, 
+                  demands: Dict[str, Any], 
+                  llm_type: LLMType) -> Optional[str]:
+    if not ArgAnswerCache.enabled:
+        return None
+    return ANSWER_CACHE.lookup(question=question, 
+                               demands=demands, 
+                               embedding=_question_embedding(question, llm_type),
+                               fingerprint=CATALOG.fingerprint)
+
+
+def store_answer(question: str, 
+                 demands: Dict[str, Any], 
+                 answer: str, 
+                 llm_type: LLMType):
+    if not ArgAnswerCache.enabled:
+        return
+    ANSWER_CACHE.store(question=question, 
+                       demands=demands, 
+                       answer=answer,
+                       embedding=_question_embedding(question, llm_type),
+                       fingerprint=CATALOG.fingerprint)
+
+
+def _check_cancelled(cancelled: Optional[threading.Event]):
+    if cancelled is not None and cancelled.is_set():
+        raise CancelledError()
+
+
+def retrieve_product_context(df: Optional[pd.DataFrame], 
+                             question: str, 
+                             search_type: SearchType, 
+                             llm_type: LLMType,
+                             cancelled: Optional[threading.Event]=None) -> Tuple[Dict[str, Any], Any, Optional[str]]:
+    """
+    Extract thông số từ câu hỏi rồi search ngay khi có demands.
+    Trả về (demands, context, cached_answer), cached_answer khác None thì không cần search và generate.
+    cancelled: cờ của nhánh speculative, được kiểm tra giữa các bước extract, lookup cache và search
+    """
+    demands = extract_info(query_user=question, 
+                           type_client=llm_type)
+    _check_cancelled(cancelled)
+    cached_answer = lookup_answer(question, demands, llm_type)
+    if cached_answer is not None:
+        return demands, None, cached_answer
+    _check_cancelled(cancelled)
+
+    search_engine = REGISTRY.get_engine(search_type=search_type, 
+                                        df=df, 
+                                        embedder_type=llm_type)
+    with TELEMETRY.span("retrieve", component=search_type):
+        if not ArgContext.enabled:
+            return demands, search_engine.query(query=question, demands=demands), None
+        records = search_engine.search_records(query=question, demands=demands)
+    return demands, CONTEXT_BUILDER.build(demands=demands, products=records), None
+
+
+async def aretrieve_product_context(df: Optional[pd.DataFrame], 
+                                    question: str, 
+                                    search_type: SearchType, 
+                                    llm_type: LLMType) -> Tuple[Dict[str, Any], Any, Optional[str]]:
+    demands = await aextract_info(query_user=question, 
+                                  type_client=llm_type)
+    cached_answer = await asyncio.to_thread(lookup_answer, question, demands, llm_type)
+    if cached_answer is not None:
+        return demands, None, cached_answer
+
+    search_engine = await REGISTRY.aget_engine(search_type=search_type, 
+                                               df=df, 
+                                               embedder_type=llm_type)
+    with TELEMETRY.span("retrieve", component=search_type):
+        if not ArgContext.enabled:
+            return demands, await search_engine.aquery(query=question, demands=demands), None
+        records = await search_engine.asearch_records(query=question, demands=demands)
+    return demands, CONTEXT_BUILDER.build(demands=demands, products=records), None
 
-def respose_chatbot(df: pd.DataFrame, 
-                    question: str, 
-                    search_type: Literal["elasticsearch", "qdrant", "chroma"], 
-                    llm_type: Literal['groq', 'openai']): 
-
-    tool_result = agent.invoke({"input": question, 
-                                "intermediate_steps": []})
-    tool_name = tool_result.tool
-
-    llm = create_llm(llm_type=llm_type)
-    embedder = create_embedder(embedder_type=llm_type)
-
-    if search_type == 'elasticsearch': 
-        search_engine = ElasticQueryEngine(cloud_id=os.getenv("ELASTIC_CLOUD_ID"), 
-                                            api_key=os.getenv("ELASTIC_API_KEY"), 
-                                            dataframe=df)
-    elif search_type == 'qdrant':
-        search_engine = QdrantQueryEngine(url=os.getenv("QDRANT_CLOUD_ID"), 
-                                           api_key=os.getenv("QDRANT_API_KEY"), 
-                                           df=df)
-    else: 
-        search_engine = EnsembleQueryEngine(embedder=embedder, 
-                                            df=df)
 
+@dataclass
+class ChatEvent:
+    """
+    Sự kiện của luồng trả lời dạng stream:
+        - tool: tool được agent chọn
+        - context: demands và context lấy được, có trước khi LLM sinh token đầu tiên
+        - token: 1 đoạn câu trả lời
+        - done: câu trả lời đầy đủ, time to first token (ttft) và tổng thời gian (latency) tính bằng giây
+    """
+    type: Literal["tool", "context", "token", "done"]
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+def _done_event(answer: str, tool_name: str, cached: bool, ttft: Optional[float], start: float) -> ChatEvent:
+    latency = time.perf_counter() - start
+    CHAT_LATENCY.observe(latency, cached=cached)
+    if ttft is not None:
+        CHAT_TTFT.observe(ttft, cached=cached)
+    return ChatEvent("done", {"answer": answer, "tool": tool_name, "cached": cached,
+                              "ttft": ttft, "latency": latency})
+
+
+def _context_event(demands: Optional[Dict[str, Any]], context: Any) -> ChatEvent:
+    if isinstance(context, BuiltContext):
+        return ChatEvent("context", {"demands": demands, "context": context.text, "tokens": context.tokens,
+                                     "saved_tokens": context.saved_tokens})
+    return ChatEvent("context", {"demands": demands, "context": context})
+
+
+def _web_context(results: List[Dict]) -> Any:
+    if ArgContext.enabled:
+        return CONTEXT_BUILDER.build(web_results=results)
     context = ""
+    for result in results:
+        context += result['content'] + "\n"
+    return context
+
+
+def route_question(question: str, retrieval=None) -> str:
+    """Agent chọn tool cho câu hỏi, hủy nhánh speculative nếu agent lỗi"""
+    try:
+        with TELEMETRY.span("route") as span:
+            tool_result = agent.invoke({"input": question, 
+                                        "intermediate_steps": []})
+            span.set(tool=tool_result.tool)
+    except BaseException:
+        if retrieval is not None:
+            retrieval.cancel()
+        raise
+    return tool_result.tool
+
+
+def gather_context(df: Optional[pd.DataFrame], 
+                   question: str, 
+                   search_type: SearchType, 
+                   llm_type: LLMType,
+                   tool_name: str,
+                   retrieval=None) -> Tuple[Optional[Dict[str, Any]], Any, Optional[str]]:
+    """Trả về (demands, context, cached_answer) theo tool đã chọn"""
+    if tool_name == "product_search": 
+        if retrieval is not None:
+            return retrieval.result()
+        return retrieve_product_context(df, question, search_type, llm_type)
+
+    if retrieval is not None:
+        retrieval.cancel()  # đang chạy thì dừng ở bước kế tiếp
+
     if tool_name == 'search_web': 
-        for result in search.invoke({"query": question}):
-            context += result['content'] + "\n"
-    else: 
-        demands =  extract_info(query_user=question, 
-                                type_client=llm_type)
-        if tool_name == "product_search": 
-            context = search_engine.query(demands=demands)
-        elif tool_name == 'product_order': 
-            context = None
-        else: 
-            context = None
-
-    prompt =  f"""Trả lời câu hỏi: {question} dựa vào thông tin được cung cấp: 
-    context: {context}         
+        return None, _web_context(search.invoke({"query": question})), None
+    return None, None, None
+
+
+async def aroute_question(question: str, retrieval=None) -> str:
+    try:
+        with TELEMETRY.span("route") as span:
+            tool_result = await agent.ainvoke({"input": question, 
+                                               "intermediate_steps": []})
+            span.set(tool=tool_result.tool)
+    except BaseException:
+        if retrieval is not None:
+            retrieval.cancel()
+        raise
+    return tool_result.tool
+
+
+async def agather_context(df: Optional[pd.DataFrame], 
+                          question: str, 
+                          search_type: SearchType, 
+                          llm_type: LLMType,
+                          tool_name: str,
+                          retrieval=None) -> Tuple[Optional[Dict[str, Any]], Any, Optional[str]]:
+    if tool_name == "product_search": 
+        if retrieval is not None:
+            return await retrieval
+        return await aretrieve_product_context(df, question, search_type, llm_type)
+
+    if retrieval is not None:
+        retrieval.cancel()
+
+    if tool_name == 'search_web': 
+        return None, _web_context(await search.ainvoke({"query": question})), None
+    return None, None, None
+
+
+@dataclass
+class SpeculativeRetrieval:
     """
+    Future của nhánh speculative kèm cờ cancel: Future.cancel() không dừng được task đã chạy,
+    cờ cancelled được retrieve_product_context kiểm tra giữa các bước
+    """
+    future: Future
+    cancelled: threading.Event
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self) -> Tuple[Dict[str, Any], Any, Optional[str]]:
+        return self.future.result()
+
+
+def _start_retrieval(df, question, search_type, llm_type, speculative: bool) -> Optional[SpeculativeRetrieval]:
+    if not speculative:
+        return None
+    cancelled = threading.Event()
+    future = SPECULATIVE_POOL.submit(retrieve_product_context, 
+                                     df, question, search_type, llm_type, cancelled)
+    return SpeculativeRetrieval(future=future, cancelled=cancelled)
+
+
+def _astart_retrieval(df, question, search_type, llm_type, speculative: bool):
+    if not speculative:
+        return None
+    retrieval = asyncio.create_task(
+        aretrieve_product_context(df, question, search_type, llm_type))
+    # lỗi của task bị bỏ đi không được log thành "exception was never retrieved"
+    retrieval.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return retrieval
+
+
+def respose_chatbot(df: Optional[pd.DataFrame], 
+                    question: str, 
+                    search_type: SearchType, 
+                    llm_type: LLMType,
+                    speculative: bool=True): 
+    """
+    speculative: chạy extract_info + retrieval song song với bước chọn tool,
+        kết quả bị bỏ đi nếu tool được chọn không phải product_search.
+    """
+    retrieval = _start_retrieval(df, question, search_type, llm_type, speculative)
+    tool_name = route_question(question, retrieval)
+    llm = REGISTRY.get_llm(llm_type=llm_type)
+
+    demands, context, cached_answer = gather_context(df, question, search_type, llm_type, tool_name, retrieval)
+    if cached_answer is not None:
+        print(cached_answer)
+        return cached_answer
+
+    prompt = build_prompt(question=question, context=context)
     print(prompt)
 
-    response = llm.invoke(input=prompt)
+    with TELEMETRY.span("generate", component=llm_type):
+        response = llm.invoke(input=prompt)
     print(response.content)
+
+    if demands is not None:
+        store_answer(question, demands, response.content, llm_type)
+    return response.content
+
+
+async def arespose_chatbot(df: Optional[pd.DataFrame], 
+                           question: str, 
+                           search_type: SearchType, 
+                           llm_type: LLMType,
+                           speculative: bool=True) -> str:
+    """
+    Phiên bản async của respose_chatbot: các lời gọi LLM, search web và search engine
+    đều được await nên 1 process có thể phục vụ nhiều hội thoại cùng lúc.
+
+    speculative: extract_info + retrieval chạy cùng lúc với agent chọn tool,
+        task bị cancel ngay khi tool được chọn không phải product_search.
+    """
+    retrieval = _astart_retrieval(df, question, search_type, llm_type, speculative)
+    tool_name = await aroute_question(question, retrieval)
+    llm = await REGISTRY.aget_llm(llm_type=llm_type)
+
+    demands, context, cached_answer = await agather_context(df, question, search_type, llm_type, 
+                                                            tool_name, retrieval)
+    if cached_answer is not None:
+        return cached_answer
+
+    prompt = build_prompt(question=question, context=context)
+    with TELEMETRY.span("generate", component=llm_type):
+        response = await llm.ainvoke(input=prompt)
+
+    if demands is not None:
+        await asyncio.to_thread(store_answer, question, demands, response.content, llm_type)
+    return response.content
+
+
+def stream_chatbot(df: Optional[pd.DataFrame], 
+                   question: str, 
+                   search_type: SearchType, 
+                   llm_type: LLMType,
+                   speculative: bool=True) -> Iterator[ChatEvent]:
+    """
+    Giống respose_chatbot nhưng trả về từng sự kiện ngay khi có: tool, context rồi các token
+    của câu trả lời, cuối cùng là done kèm ttft và latency.
+
+    >>> examples:
+        for event in stream_chatbot(None, "điều hòa 12000btu giá rẻ", "columnar", "openai"):
+            if event.type == "token":
+                print(event.data["text"], end="", flush=True)
+    """
+    start = time.perf_counter()
+    retrieval = _start_retrieval(df, question, search_type, llm_type, speculative)
+    try:
+        tool_name = route_question(question, retrieval)
+        yield ChatEvent("tool", {"tool": tool_name})
+
+        llm = REGISTRY.get_llm(llm_type=llm_type)
+        demands, context, cached_answer = gather_context(df, question, search_type, llm_type, tool_name, retrieval)
+    finally:
+        # consumer dừng sớm (vd: đóng generator sau event tool) thì không để nhánh speculative chạy tiếp
+        if retrieval is not None and not retrieval.done():
+            retrieval.cancel()
+    yield _context_event(demands, context)
+
+    if cached_answer is not None:
+        ttft = time.perf_counter() - start
+        yield ChatEvent("token", {"text": cached_answer})
+        yield _done_event(cached_answer, tool_name, True, ttft, start)
+        return
+
+    chunks, ttft = [], None
+    span, generate_start = TELEMETRY.start_span("generate", component=llm_type), time.perf_counter()
+    for chunk in llm.stream(input=build_prompt(question=question, context=context)):
+        if not chunk.content:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        chunks.append(chunk.content)
+        yield ChatEvent("token", {"text": chunk.content})
+    span.set(num_chunks=len(chunks))
+    TELEMETRY.record(span, time.perf_counter() - generate_start)
+
+    answer = "".join(chunks)
+    if demands is not None:
+        store_answer(question, demands, answer, llm_type)
+    yield _done_event(answer, tool_name, False, ttft, start)
+
+
+async def astream_chatbot(df: Optional[pd.DataFrame], 
+                          question: str, 
+                          search_type: SearchType, 
+                          llm_type: LLMType,
+                          speculative: bool=True) -> AsyncIterator[ChatEvent]:
+    """Phiên bản async của stream_chatbot"""
+    start = time.perf_counter()
+    retrieval = _astart_retrieval(df, question, search_type, llm_type, speculative)
+    try:
+        tool_name = await aroute_question(question, retrieval)
+        yield ChatEvent("tool", {"tool": tool_name})
+
+        llm = await REGISTRY.aget_llm(llm_type=llm_type)
+        demands, context, cached_answer = await agather_context(df, question, search_type, llm_type, 
+                                                                tool_name, retrieval)
+    finally:
+        # consumer dừng sớm (vd: client ngắt kết nối) thì không để nhánh speculative chạy tiếp
+        if retrieval is not None and not retrieval.done():
+            retrieval.cancel()
+    yield _context_event(demands, context)
+
+    if cached_answer is not None:
+        ttft = time.perf_counter() - start
+        yield ChatEvent("token", {"text": cached_answer})
+        yield _done_event(cached_answer, tool_name, True, ttft, start)
+        return
+
+    chunks, ttft = [], None
+    span, generate_start = TELEMETRY.start_span("generate", component=llm_type), time.perf_counter()
+    async for chunk in llm.astream(input=build_prompt(question=question, context=context)):
+        if not chunk.content:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        chunks.append(chunk.content)
+        yield ChatEvent("token", {"text": chunk.content})
+    span.set(num_chunks=len(chunks))
+    TELEMETRY.record(span, time.perf_counter() - generate_start)
+
+    answer = "".join(chunks)
+    if demands is not None:
+        await asyncio.to_thread(store_answer, question, demands, answer, llm_type)
+    yield _done_event(answer, tool_name, False, ttft, start)
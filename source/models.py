@@ -1,25 +1,45 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_groq import ChatGroq
+import os
 from langchain_community.callbacks.manager import get_openai_callback
 from langchain_community.cache import SQLiteCache
-from typing import Literal, Dict
+from langchain_core.embeddings import Embeddings
+from typing import Literal, Dict, List
 from config import AragProduct
+from clients import CLIENTS
+from utils import EmbeddingCache, EMBEDDING_CACHE
+from telemetry import TELEMETRY
 import langchain 
 
+os.makedirs(os.path.dirname(AragProduct.CACHE_PATH), exist_ok=True)
 langchain.llm_cache = SQLiteCache(database_path=AragProduct.CACHE_PATH)
 
 
-def create_llm(llm_type: Literal['groq', 'openai'], model_name: str):
+def create_llm(llm_type: Literal['groq', 'openai'], model_name: str=None):
     
-    if llm_type == 'openai':
-        llm = ChatOpenAI(model=model_name)
-    else:
-        llm = ChatGroq(model=model_name)
-
+    llm = CLIENTS.chat_model(llm_type=llm_type, model_name=model_name)
     return llm
 
 
+class CachedEmbeddings(Embeddings):
+    """Bọc 1 embedder, embed_query đi qua EmbeddingCache còn embed_documents giữ nguyên"""
+
+    def __init__(self, embedder: Embeddings, model_name: str, cache: EmbeddingCache=EMBEDDING_CACHE):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache = cache
+
+    @TELEMETRY.traced("embed")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_documents(texts)
+
+    @TELEMETRY.traced("embed")
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_dense(model_name=self.model_name, 
+                                    text=text, 
+                                    compute=self.embedder.embed_query).tolist()
+
+
 def create_embedder(embedder_type: Literal['openai']):
-    if embedder_type == 'openai': 
-        embedder = OpenAIEmbeddings(model="text-embedding_ada-002")
-        return embedder
\ No newline at end of file
+    embedder = CLIENTS.embeddings(embedder_type=embedder_type)
+    if embedder is not None: 
+        model_name = getattr(embedder, "model", type(embedder).__name__)
+        return CachedEmbeddings(embedder=embedder, model_name=model_name)
\ No newline at end of file
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from config import AragProduct
 
 PROMPT_TOOLS = {
@@ -18,50 +19,62 @@ PROMPT_TOOLS = {
                 hoặc những câu hỏi mang tính real-time"""
 }
 
-FUNC_CALL_TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_specifications",
-            "description": """Lấy ra loại hoặc tên sản phẩm và các thông số kỹ thuật của sản phẩm có trong câu hỏi. Sử dụng khi câu hỏi có thông tin về 1 trong các các thông số [loại hoặc tên sản phẩm,  giá, cân nặng, công suất hoặc dung tích]""",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "group": {
-                        "type": "string",
-                        "description": f"""lấy ra nhóm sản phẩm có trong câu hỏi từ list: {AragProduct.LIST_GROUP_NAME}. 
-                        Chỉ trả ra tên group có trong list đã cho trước"""
-                    },
-                    "object": {
-                        "type": "string",
-                        "description": "tên hoặc loại sản phẩm có trong câu hỏi. Ví dụ: điều hòa, điều hòa MDV 9000BTU, máy giặt LG ...",
-                    },
-                    "price": {
-                        "type": "string",
-                        "description": "giá của sản phẩm có trong câu hỏi. Ví dụ : 1 triệu, 1000đ, ...",
-                    },
-                    "power": {
-                        "type": "string", 
-                        "description": "công suất của sản phẩm có trong câu hỏi. Ví dụ : 5W, 9000BTU, ...",
-                    },  
-                    "weight": {
-                        "type": "string", 
-                        "description": "cân nặng của sản phẩm có trong câu hỏi. Ví dụ : 1 cân, 10kg, 20 gam, ..."
-                    },
-                    "volume": {
-                        "type": "string", 
-                        "description": "dung tích của sản phẩm có trong câu hỏi. Ví dụ : 1 lít, 3 mét khối ..."
+
+@lru_cache(maxsize=1)
+def get_func_call_tools() -> list[dict]:
+    """Tạo schema function calling, danh sách group chỉ được đọc ở lần gọi đầu tiên"""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": "get_specifications",
+                "description": """Lấy ra loại hoặc tên sản phẩm và các thông số kỹ thuật của sản phẩm có trong câu hỏi. Sử dụng khi câu hỏi có thông tin về 1 trong các các thông số [loại hoặc tên sản phẩm,  giá, cân nặng, công suất hoặc dung tích]""",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "group": {
+                            "type": "string",
+                            "description": f"""lấy ra nhóm sản phẩm có trong câu hỏi từ list: {AragProduct.LIST_GROUP_NAME}. 
+                            Chỉ trả ra tên group có trong list đã cho trước"""
+                        },
+                        "object": {
+                            "type": "string",
+                            "description": "tên hoặc loại sản phẩm có trong câu hỏi. Ví dụ: điều hòa, điều hòa MDV 9000BTU, máy giặt LG ...",
+                        },
+                        "price": {
+                            "type": "string",
+                            "description": "giá của sản phẩm có trong câu hỏi. Ví dụ : 1 triệu, 1000đ, ...",
+                        },
+                        "power": {
+                            "type": "string", 
+                            "description": "công suất của sản phẩm có trong câu hỏi. Ví dụ : 5W, 9000BTU, ...",
+                        },  
+                        "weight": {
+                            "type": "string", 
+                            "description": "cân nặng của sản phẩm có trong câu hỏi. Ví dụ : 1 cân, 10kg, 20 gam, ..."
+                        },
+                        "volume": {
+                            "type": "string", 
+                            "description": "dung tích của sản phẩm có trong câu hỏi. Ví dụ : 1 lít, 3 mét khối ..."
+                        },
+                        "intent": {
+                            "type": "string",
+                            "description": "ý định của người dùng khi hỏi câu hỏi. Ví dụ: mua, tìm hiểu, so sánh, ..."
+                        }
                     },
-                    "intent": {
-                        "type": "string",
-                        "description": "ý định của người dùng khi hỏi câu hỏi. Ví dụ: mua, tìm hiểu, so sánh, ..."
-                    }
+                    "required": ["group", "object", "price", "power", "weight", "volume", "intent"],
                 },
-                "required": ["group", "object", "price", "power", "weight", "volume", "intent"],
             },
-        },
-    }
-]
+        }
+    ]
+
+
+def __getattr__(name: str):
+    # giữ tương thích với `from prompt import FUNC_CALL_TOOLS` mà không phải đọc catalog lúc import
+    if name == "FUNC_CALL_TOOLS":
+        return get_func_call_tools()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 PROMPT_SYSTEM = {
     "extract_query": '''Bạn là 1 chuyên gia extract thông tin từ câu hỏi. 
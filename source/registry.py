@@ -0,0 +1,164 @@
+import os
+import asyncio
+import threading
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Literal, Optional
+
+from models import create_llm, create_embedder
+from catalog import CATALOG
+from config import SearchType, LLMType
+from clients import CLIENTS
+from vectorstore import (ElasticQueryEngine,
+                         QdrantQueryEngine,
+                         EnsembleQueryEngine,
+                         ColumnarQueryEngine,
+                         MemmapVectorEngine)
+from utils import Logger, EMBEDDING_CACHE
+
+LOGGER = Logger(name=__file__, log_file="registry.log")
+# factory trả về None (vd: không có embedder cho groq) vẫn được cache
+_MISSING = object()
+# chỉ các engine này dùng embedder, các engine khác dùng chung 1 instance cho mọi embedder_type
+EMBEDDER_SEARCH_TYPES = ("chroma", "memmap")
+
+
+@dataclass
+class EngineRegistry:
+    """
+    Pool dùng chung trong toàn process cho LLM, embedder và search engine.
+    Mỗi cấu hình chỉ được khởi tạo 1 lần (lazy) rồi tái sử dụng cho các câu hỏi sau.
+
+    >>> examples:
+        registry.get_llm(llm_type="openai")
+        registry.get_engine(search_type="qdrant", df=df)
+        await registry.aget_engine(search_type="chroma", df=df, embedder_type="openai")
+    """
+    _instances: Dict[str, Any] = field(default_factory=dict, init=False, repr=False)
+    _locks: Dict[str, threading.Lock] = field(default_factory=dict, init=False, repr=False)
+    _guard: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Trả về instance theo key, chỉ gọi factory 1 lần kể cả khi nhiều thread cùng gọi"""
+        instance = self._instances.get(key, _MISSING)
+        if instance is not _MISSING:
+            return instance
+
+        with self._key_lock(key):
+            instance = self._instances.get(key, _MISSING)
+            if instance is _MISSING:
+                LOGGER.log.info(f"Build instance: [{key}]")
+                instance = factory()
+                self._instances[key] = instance
+        return instance
+
+    async def aget_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Giống get_or_create nhưng việc khởi tạo chạy trong thread để không chặn event loop"""
+        instance = self._instances.get(key, _MISSING)
+        if instance is not _MISSING:
+            return instance
+        return await asyncio.to_thread(self.get_or_create, key, factory)
+
+    def get_llm(self, llm_type: LLMType, model_name: str=None):
+        return self.get_or_create(key=f"llm:{llm_type}:{model_name}",
+                                  factory=lambda: create_llm(llm_type=llm_type, model_name=model_name))
+
+    async def aget_llm(self, llm_type: LLMType, model_name: str=None):
+        return await self.aget_or_create(key=f"llm:{llm_type}:{model_name}",
+                                         factory=lambda: create_llm(llm_type=llm_type, model_name=model_name))
+
+    def get_embedder(self, embedder_type: Literal['openai']):
+        return self.get_or_create(key=f"embedder:{embedder_type}",
+                                  factory=lambda: create_embedder(embedder_type=embedder_type))
+
+    def get_engine(self,
+                   search_type: SearchType,
+                   df: Optional[pd.DataFrame]=None,
+                   embedder_type: LLMType='openai'):
+        """
+        Engine được định danh theo search_type, thêm embedder_type với engine có dùng embedder.
+        Dataframe chỉ được dùng ở lần khởi tạo đầu tiên, mặc định lấy từ CATALOG.
+        """
+        key = f"engine:{search_type}:{embedder_type}" if search_type in EMBEDDER_SEARCH_TYPES \
+            else f"engine:{search_type}"
+        return self.get_or_create(key=key,
+                                  factory=lambda: self._build_engine(search_type, df, embedder_type))
+
+    async def aget_engine(self,
+                          search_type: SearchType,
+                          df: Optional[pd.DataFrame]=None,
+                          embedder_type: LLMType='openai'):
+        return await asyncio.to_thread(self.get_engine, search_type, df, embedder_type)
+
+    def _build_engine(self, search_type: str, df: Optional[pd.DataFrame], embedder_type: str):
+        if df is None:
+            df = CATALOG.dataframe
+
+        if search_type == 'elasticsearch':
+            return ElasticQueryEngine(cloud_id=os.getenv("ELASTIC_CLOUD_ID"),
+                                      api_key=os.getenv("ELASTIC_API_KEY"),
+                                      dataframe=df)
+        elif search_type == 'qdrant':
+            return QdrantQueryEngine(url=os.getenv("QDRANT_CLOUD_ID"),
+                                     api_key=os.getenv("QDRANT_API_KEY"),
+                                     df=df)
+        elif search_type == 'columnar':
+            return ColumnarQueryEngine(df=df)
+        elif search_type == 'memmap':
+            return MemmapVectorEngine(embedder=self.get_embedder(embedder_type=embedder_type),
+                                      df=df)
+        elif search_type == 'chroma':
+            return EnsembleQueryEngine(embedder=self.get_embedder(embedder_type=embedder_type),
+                                       df=df)
+        raise ValueError(f"Unknown search_type: {search_type!r}")
+
+    def warmup(self,
+               df: Optional[pd.DataFrame]=None,
+               search_types: tuple=("elasticsearch", "qdrant", "chroma"),
+               llm_type: LLMType='openai'):
+        """Khởi tạo trước các engine và model để câu hỏi đầu tiên không phải chờ"""
+        self.get_llm(llm_type=llm_type)
+        for search_type in search_types:
+            self.get_engine(search_type=search_type, df=df, embedder_type=llm_type)
+        LOGGER.log.info(f"Warmup done: {sorted(self._instances)}")
+
+    async def awarmup(self, *args, **kwargs):
+        await asyncio.to_thread(self.warmup, *args, **kwargs)
+
+    async def ashutdown(self):
+        """Đóng các kết nối async (phải gọi trong event loop đã dùng chúng) rồi shutdown"""
+        for key, instance in list(self._instances.items()):
+            aclose = getattr(instance, "aclose", None)
+            if not callable(aclose):
+                continue
+            try:
+                await aclose()
+            except Exception as e:
+                LOGGER.log.error(f"An error occurred while closing [{key}]. Error: {str(e)}")
+        await CLIENTS.aclose()
+        await asyncio.to_thread(self.shutdown)
+
+    def shutdown(self):
+        """Đóng kết nối của các instance đang giữ và xóa pool"""
+        with self._guard:
+            instances, self._instances = self._instances, {}
+            self._locks = {}
+
+        for key, instance in instances.items():
+            close = getattr(instance, "close", None)
+            if not callable(close):
+                continue
+            try:
+                close()
+            except Exception as e:
+                LOGGER.log.error(f"An error occurred while closing [{key}]. Error: {str(e)}")
+        EMBEDDING_CACHE.close()
+        CLIENTS.close()
+        LOGGER.log.info("Registry shutdown successfull!")
+
+
+REGISTRY = EngineRegistry()
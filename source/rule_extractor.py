@@ -0,0 +1,172 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from config import AragProduct
+from utils import parse_number
+
+# tên gọi khác của 1 số group, chỉ dùng khi group tương ứng có trong catalog
+GROUP_SYNONYMS = {
+    "máy lạnh": "điều hòa",
+    "điều hoà": "điều hòa",
+    "bàn là": "bàn ủi, máy sấy tóc",
+    "bình nóng lạnh": "bình nước nóng",
+    "máy nước nóng": "bình nước nóng",
+    "ấm siêu tốc": "bình đun nước",
+    "ấm đun": "bình đun nước",
+    "lò nướng": "lò vi sóng , lò nướng",
+    "ổ cắm": "công tắc, ổ cắm thông minh",
+    "camera": "thiết bị camera",
+    "webcam": "thiết bị webcam",
+    "wifi": "thiết bị wifi",
+    "ghế massage": "ghế massage daikiosan",
+}
+
+NUMBER = r"\d+(?:[.,]\d+)*"
+RANGE_PATTERNS = {
+    "price": re.compile(rf"(?:(?:từ|khoảng|tầm|dưới|trên|tối đa|không quá)\s*)?{NUMBER}\s*"
+                        rf"(?:(?:-|đến|tới)\s*{NUMBER}\s*)?(?:triệu|tr|nghìn|ngàn|k|đồng|đ|vnd)\b"),
+    "power": re.compile(rf"(?:(?:từ|khoảng|tầm|dưới|trên)\s*)?{NUMBER}\s*(?:(?:-|đến|tới)\s*{NUMBER}\s*)?"
+                        rf"(?:kw|w|btu|hp)\b"),
+    "weight": re.compile(rf"(?:(?:từ|khoảng|tầm|dưới|trên)\s*)?{NUMBER}\s*(?:(?:-|đến|tới)\s*{NUMBER}\s*)?"
+                         rf"(?:kg|ký|cân|gam|g)\b"),
+    "volume": re.compile(rf"(?:(?:từ|khoảng|tầm|dưới|trên)\s*)?{NUMBER}\s*(?:(?:-|đến|tới)\s*{NUMBER}\s*)?"
+                         rf"(?:lít|l|ml)\b"),
+}
+UPPER_BOUND = re.compile(r"^(?:dưới|tối đa|không quá)\s*")
+
+SUPERLATIVES = [
+    ("price", "SMALLEST", re.compile(r"rẻ nhất|giá thấp nhất")),
+    ("price", "BIGGEST", re.compile(r"đắt nhất|giá cao nhất|cao cấp nhất")),
+    ("power", "BIGGEST", re.compile(r"(?:công suất|mạnh)\s*(?:lớn|cao)? ?nhất|mạnh nhất")),
+    ("power", "SMALLEST", re.compile(r"công suất\s*(?:nhỏ|thấp) nhất|tiết kiệm điện nhất")),
+    ("weight", "SMALLEST", re.compile(r"nhẹ nhất")),
+    ("weight", "BIGGEST", re.compile(r"nặng nhất")),
+    ("volume", "BIGGEST", re.compile(r"dung tích\s*(?:lớn|to) nhất")),
+    ("volume", "SMALLEST", re.compile(r"dung tích\s*(?:nhỏ|bé) nhất")),
+]
+# "lớn nhất", "to nhất"... không rõ thông số nào -> để LLM quyết định
+AMBIGUOUS_SUPERLATIVE = re.compile(r"(?:lớn|to|nhỏ|bé|cao|thấp) nhất")
+
+INTENTS = [
+    ("so sánh", re.compile(r"so sánh|khác nhau|hơn\b")),
+    ("mua", re.compile(r"\bmua\b|đặt|lấy\b|cần\b")),
+    ("tìm hiểu", re.compile(r"là gì|thế nào|như nào|nào tốt|có tốt|tốt không|tư vấn|tìm hiểu")),
+]
+OBJECT_STOP = re.compile(rf"\s(?:từ|dưới|trên|khoảng|tầm|giá|có|loại|công suất|dung tích|nặng|"
+                         rf"nhẹ|rẻ|đắt|tối đa|không quá|cho|để|nào|{NUMBER})\b")
+DIGITS = re.compile(r"\d")
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text).lower()).strip()
+
+
+@lru_cache(maxsize=1)
+def _group_aliases() -> List[Tuple[str, str]]:
+    """Danh sách (alias, group) sắp xếp alias dài trước để "máy sấy tóc" thắng "máy sấy" """
+    groups = [str(group) for group in AragProduct.LIST_GROUP_NAME]
+    aliases = {}
+    for group in groups:
+        aliases[_normalize(group)] = group
+        for part in group.split(","):
+            if part.strip():
+                aliases.setdefault(_normalize(part), group)
+    for alias, group in GROUP_SYNONYMS.items():
+        if group in groups:
+            aliases.setdefault(alias, group)
+    return sorted(aliases.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def _find_groups(text: str) -> List[Tuple[str, int, int]]:
+    """Tìm các group trong câu, trả về (group, start, end) không chồng lấn nhau"""
+    found, taken = [], []
+    for alias, group in _group_aliases():
+        for match in re.finditer(rf"(?<!\w){re.escape(alias)}(?!\w)", text):
+            if any(match.start() < end and start < match.end() for start, end in taken):
+                continue
+            taken.append(match.span())
+            found.append((group, match.start(), match.end()))
+    return sorted(found, key=lambda item: item[1])
+
+
+def _range_value(raw: str) -> Optional[str]:
+    """
+    Chuẩn hóa "dưới 5 triệu" thành "0 đến 5 triệu" để parse_specification_range ra đúng khoảng,
+    "trên 5 triệu" được giữ nguyên (parse_specification_range hiểu là không có cận trên).
+    Trả về None khi có số không parse được, để câu hỏi được chuyển cho LLM.
+    """
+    raw = raw.strip()
+    try:
+        for number in re.findall(NUMBER, raw):
+            parse_number(number)
+    except ValueError:
+        return None
+    if UPPER_BOUND.match(raw):
+        return "0 đến " + UPPER_BOUND.sub("", raw)
+    return raw
+
+
+def extract_rule_based(query_user: str) -> Tuple[Dict[str, str], float]:
+    """
+    Extract thông số từ câu hỏi bằng luật, không gọi LLM.
+    Trả về dictionary cùng dạng với parse_string_to_dict và độ tin cậy trong [0, 1].
+
+    >>> extract_rule_based("Tôi muốn mua điều hòa từ 10 đến 12 triệu")
+    ({'group': 'điều hòa', 'object': 'điều hòa', 'price': 'từ 10 đến 12 triệu', ...}, 0.9)
+    """
+    text = _normalize(query_user)
+    result = {"group": "", "object": "", "price": "", "power": "", 
+              "weight": "", "volume": "", "intent": ""}
+
+    groups = _find_groups(text)
+    if not groups:
+        return result, 0.0
+
+    group, start, end = groups[0]
+    result["group"] = group
+    alias = text[start:end]
+
+    consumed, unparsed = text, False
+    for name, pattern in RANGE_PATTERNS.items():
+        match = pattern.search(consumed)
+        if match:
+            value = _range_value(match.group(0))
+            unparsed = unparsed or value is None
+            result[name] = value or ""
+            consumed = consumed[:match.start()] + " " + consumed[match.end():]
+
+    ambiguous = False
+    for name, keyword, pattern in SUPERLATIVES:
+        match = pattern.search(consumed)
+        if match and not result[name]:
+            result[name] = keyword
+            consumed = consumed[:match.start()] + " " + consumed[match.end():]
+    if AMBIGUOUS_SUPERLATIVE.search(consumed):
+        ambiguous = True
+
+    # object = tên group và phần tên phía sau (hãng, model) sau khi đã bỏ các thông số
+    consumed = re.sub(r"\s+", " ", consumed)
+    tail = consumed[consumed.find(alias):]
+    stop = OBJECT_STOP.search(tail, len(alias))
+    result["object"] = (tail[:stop.start()] if stop else tail).strip(" ?.,!")
+
+    for intent, pattern in INTENTS:
+        if pattern.search(text):
+            result["intent"] = intent
+            break
+
+    confidence = 0.9
+    # còn số không thuộc thông số nào (model, đơn vị lạ...) -> có thể thiếu thông tin
+    if DIGITS.search(consumed.replace(result["object"], "")):
+        confidence -= 0.4
+    if ambiguous:
+        confidence -= 0.3
+    # số như "1.500.00" không rõ phân tách hàng nghìn hay thập phân
+    if unparsed:
+        confidence -= 0.5
+    # nhiều sản phẩm trong 1 câu (so sánh) không biểu diễn được bằng 1 object
+    if len({found[0] for found in groups}) > 1 or result["intent"] == "so sánh":
+        confidence -= 0.3
+    return result, round(max(confidence, 0.0), 2)
@@ -0,0 +1,397 @@
+"""
+HTTP service cho chatbot, viết trực tiếp trên ASGI nên chạy được với bất kỳ ASGI server nào.
+
+    POST /chat          {"question": "...", "search_type": "columnar", "llm_type": "openai"} -> JSON
+    POST /chat/stream   như /chat, trả về Server-Sent Events: tool, context, token, done
+    GET  /healthz       liveness, luôn 200 khi process còn chạy
+    GET  /readyz        readiness, 200 khi warmup xong và chưa shutdown
+    GET  /metrics       metrics dạng text của Prometheus
+
+    PYTHONPATH=source uvicorn server:app --port 8000
+    LLM_PROVIDER=fake PYTHONPATH=source python source/server.py     # chạy offline với LLM giả
+"""
+import json
+import asyncio
+import numpy as np
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import ArgServer, SEARCH_TYPES, LLM_TYPES
+from utils import Logger
+from telemetry import TELEMETRY
+
+LOGGER = Logger(name=__file__, log_file="server.log")
+HTTP_REQUESTS = TELEMETRY.counter("http_requests_total", "HTTP requests by path and status")
+ADMISSION_DROPS = TELEMETRY.counter("admission_dropped_total", "Requests rejected (queue full) or shed (queue timeout)")
+
+
+class Overloaded(Exception):
+    """Hàng đợi đầy hoặc chờ quá queue_timeout, request bị từ chối thay vì xếp hàng vô hạn"""
+
+
+@dataclass
+class AdmissionController:
+    """
+    Giới hạn số request xử lý cùng lúc (max_concurrency) và số request được chờ (max_queue).
+    Hàng đợi đầy thì từ chối ngay, chờ quá queue_timeout thì bị shed.
+
+    >>> examples:
+        admission = AdmissionController(max_concurrency=16, max_queue=64, queue_timeout=10)
+        async with admission.slot():
+            ...
+    """
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float
+
+    def __post_init__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.shed = 0
+
+    async def acquire(self):
+        # đếm cả request đang chờ lấy semaphore, semaphore.locked() chưa phản ánh các request này
+        if self.active + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            ADMISSION_DROPS.inc(reason="rejected")
+            raise Overloaded("request queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            ADMISSION_DROPS.inc(reason="shed")
+            raise Overloaded(f"waited more than {self.queue_timeout}s in queue")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self.active, "waiting": self.waiting,
+                "rejected": self.rejected, "shed": self.shed}
+
+
+def _json_default(value: Any):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _event_fields(event: Any) -> Tuple[str, Dict[str, Any]]:
+    """Nhận ChatEvent của main hoặc dict {"type", "data"} (backend giả khi test)"""
+    if isinstance(event, dict):
+        return event["type"], event.get("data", {})
+    return event.type, event.data
+
+
+def _sse_message(event_type: str, data: Any) -> Dict[str, Any]:
+    return {"type": "http.response.body",
+            "body": b"event: " + event_type.encode() + b"\ndata: " + _dumps(data) + b"\n\n",
+            "more_body": True}
+
+
+async def _default_chat(question: str, search_type: str, llm_type: str) -> str:
+    from main import arespose_chatbot
+    return await arespose_chatbot(None, question, search_type, llm_type)
+
+
+def _default_stream(question: str, search_type: str, llm_type: str) -> AsyncIterator:
+    from main import astream_chatbot
+    return astream_chatbot(None, question, search_type, llm_type)
+
+
+async def _default_warmup():
+    from registry import REGISTRY
+    await REGISTRY.awarmup(search_types=ArgServer.warmup_search_types,
+                           llm_type=ArgServer.llm_type)
+
+
+async def _default_shutdown():
+    from registry import REGISTRY
+    await REGISTRY.ashutdown()
+
+
+@dataclass
+class ChatService:
+    """
+    ASGI app của chatbot. Các backend được inject để test với LLM và retriever giả:
+        - chat_fn(question, search_type, llm_type) -> câu trả lời
+        - stream_fn(question, search_type, llm_type) -> async iterator các sự kiện
+        - warmup_fn() chạy nền khi khởi động, readyz trả 503 cho tới khi xong
+        - shutdown_fn() chạy khi tắt, sau khi các request đang xử lý kết thúc
+
+    >>> examples:
+        app = ChatService(chat_fn=fake_chat, stream_fn=fake_stream, warmup_fn=None)
+    """
+    chat_fn: Callable[[str, str, str], Awaitable[str]] = _default_chat
+    stream_fn: Callable[[str, str, str], AsyncIterator] = _default_stream
+    warmup_fn: Optional[Callable[[], Awaitable[Any]]] = _default_warmup
+    shutdown_fn: Optional[Callable[[], Awaitable[Any]]] = _default_shutdown
+    config: ArgServer = field(default_factory=ArgServer)
+
+    def __post_init__(self):
+        self.admission: Optional[AdmissionController] = None
+        self.ready = False
+        self.warmup_error: Optional[str] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def _get_admission(self) -> AdmissionController:
+        # tạo trong event loop đang chạy
+        if self.admission is None:
+            self.admission = AdmissionController(max_concurrency=self.config.max_concurrency,
+                                                 max_queue=self.config.max_queue,
+                                                 queue_timeout=self.config.queue_timeout)
+        return self.admission
+
+    async def startup(self):
+        self._get_admission()
+        if self.warmup_fn is None:
+            self.ready = True
+            return
+        self._warmup_task = asyncio.create_task(self._warmup())
+
+    async def _warmup(self):
+        try:
+            await self.warmup_fn()
+            self.ready = True
+            LOGGER.log.info("Warmup done, service is ready")
+        except Exception as e:
+            self.warmup_error = str(e)
+            LOGGER.log.error(f"Warmup failed: {str(e)}")
+
+    async def shutdown(self, drain_timeout: float = 30.0):
+        """Ngừng nhận request mới, chờ request đang chạy xong rồi đóng kết nối"""
+        self.ready = False
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+
+        admission = self._get_admission()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout
+        while (admission.active or admission.waiting) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self.shutdown_fn is not None:
+            await self.shutdown_fn()
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                    await send({"type": "lifespan.startup.complete"})
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await self.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                except Exception as e:
+                    await send({"type": "lifespan.shutdown.failed", "message": str(e)})
+                return
+
+    async def _http(self, scope: Dict, receive: Callable, send: Callable):
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        routes = {
+            "/healthz": ("GET", self._healthz),
+            "/readyz": ("GET", self._readyz),
+            "/metrics": ("GET", self._metrics),
+            "/chat": ("POST", self._chat),
+            "/chat/stream": ("POST", self._chat_stream),
+        }
+        if path not in routes:
+            return await self._send_json(send, 404, {"error": "not found"})
+        allowed, handler = routes[path]
+        if method != allowed:
+            return await self._send_json(send, 405, {"error": "method not allowed"},
+                                         headers=[(b"allow", allowed.encode())])
+
+        status = {}
+        async def tracked_send(message: Dict):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # span gốc của request, các span route/extract/retrieve/generate bên trong dùng chung trace_id
+        with TELEMETRY.span("http", component=path) as span:
+            try:
+                await handler(scope, receive, tracked_send)
+            except Exception as e:
+                LOGGER.log.error(f"An error occurred while handling {method} {path}: {str(e)}")
+                if "code" not in status:
+                    await self._send_json(tracked_send, 500, {"error": "internal error"})
+            finally:
+                span.set(http_status=status.get("code", 499))
+                HTTP_REQUESTS.inc(path=path, status=status.get("code", 499))
+
+    async def _send_json(self, send: Callable, status: int, payload: Any, headers: List[Tuple[bytes, bytes]] = ()):
+        body = _dumps(payload)
+        await send({"type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                                (b"content-length", str(len(body)).encode()),
+                                *headers]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _healthz(self, scope: Dict, receive: Callable, send: Callable):
+        await self._send_json(send, 200, {"status": "alive"})
+
+    async def _readyz(self, scope: Dict, receive: Callable, send: Callable):
+        payload = {"status": "ready" if self.ready else "not ready", **self._get_admission().stats()}
+        if self.warmup_error:
+            payload["error"] = self.warmup_error
+        await self._send_json(send, 200 if self.ready else 503, payload)
+
+    async def _metrics(self, scope: Dict, receive: Callable, send: Callable):
+        body = TELEMETRY.render_prometheus().encode("utf-8")
+        await send({"type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _read_request(self, receive: Callable) -> Dict[str, Any]:
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("client disconnected")
+            body += message.get("body", b"")
+            if len(body) > self.config.max_body_bytes:
+                raise ValueError("request body too large")
+            if not message.get("more_body"):
+                break
+
+        request = json.loads(body or b"{}")
+        if not isinstance(request, dict) or not str(request.get("question", "")).strip():
+            raise ValueError("field 'question' is required")
+        # giá trị lạ sẽ tạo và cache 1 engine mới trong REGISTRY
+        search_type = request.get("search_type", self.config.search_type)
+        if search_type not in SEARCH_TYPES:
+            raise ValueError(f"field 'search_type' must be one of {list(SEARCH_TYPES)}")
+        llm_type = request.get("llm_type", self.config.llm_type)
+        if llm_type not in LLM_TYPES:
+            raise ValueError(f"field 'llm_type' must be one of {list(LLM_TYPES)}")
+        return {"question": str(request["question"]),
+                "search_type": search_type,
+                "llm_type": llm_type}
+
+    async def _admit(self, receive: Callable, send: Callable) -> Optional[Dict[str, Any]]:
+        """Kiểm tra ready và đọc body, trả về None nếu đã gửi response lỗi"""
+        if not self.ready:
+            await self._send_json(send, 503, {"error": "service is not ready"},
+                                  headers=[(b"retry-after", b"1")])
+            return None
+        try:
+            return await self._read_request(receive)
+        except ConnectionError:
+            return None
+        except ValueError as e:  # gồm cả json.JSONDecodeError
+            await self._send_json(send, 400, {"error": str(e)})
+            return None
+
+    async def _overloaded(self, send: Callable, error: Overloaded):
+        LOGGER.log.warning(f"Reject request: {str(error)}")
+        await self._send_json(send, 503, {"error": str(error)}, headers=[(b"retry-after", b"1")])
+
+    async def _chat(self, scope: Dict, receive: Callable, send: Callable):
+        request = await self._admit(receive, send)
+        if request is None:
+            return
+        try:
+            async with self._get_admission().slot():
+                answer = await asyncio.wait_for(
+                    self.chat_fn(request["question"], request["search_type"], request["llm_type"]),
+                    timeout=self.config.request_timeout)
+        except Overloaded as e:
+            return await self._overloaded(send, e)
+        except asyncio.TimeoutError:
+            return await self._send_json(send, 504, {"error": "request timed out"})
+        await self._send_json(send, 200, {"answer": answer})
+
+    async def _chat_stream(self, scope: Dict, receive: Callable, send: Callable):
+        request = await self._admit(receive, send)
+        if request is None:
+            return
+        admission = self._get_admission()
+        try:
+            await admission.acquire()
+        except Overloaded as e:
+            return await self._overloaded(send, e)
+
+        try:
+            stream = asyncio.create_task(self._send_events(request, send))
+            disconnect = asyncio.create_task(self._wait_disconnect(receive))
+            # client ngắt kết nối thì hủy luôn phần sinh câu trả lời; quá request_timeout thì _send_events
+            # tự dừng và gửi event error trước khi đóng stream
+            done, _ = await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (stream, disconnect):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(stream, disconnect, return_exceptions=True)
+            if stream in done and stream.exception() is not None:
+                LOGGER.log.error(f"An error occurred while streaming: {str(stream.exception())}")
+        finally:
+            admission.release()
+
+    async def _wait_disconnect(self, receive: Callable):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _send_events(self, request: Dict[str, Any], send: Callable):
+        await send({"type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                (b"cache-control", b"no-cache"),
+                                (b"x-accel-buffering", b"no")]})
+        try:
+            await asyncio.wait_for(self._forward_events(request, send), timeout=self.config.request_timeout)
+        except asyncio.TimeoutError:
+            LOGGER.log.warning(f"Stream timed out after {self.config.request_timeout}s")
+            await send(_sse_message("error", {"error": "timeout"}))
+        except Exception as e:
+            await send(_sse_message("error", {"error": str(e)}))
+            raise
+        finally:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _forward_events(self, request: Dict[str, Any], send: Callable):
+        async for event in self.stream_fn(request["question"], request["search_type"], request["llm_type"]):
+            await send(_sse_message(*_event_fields(event)))
+
+
+app = ChatService()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=ArgServer.host, port=ArgServer.port)
@@ -0,0 +1,218 @@
+import json
+import time
+import uuid
+import asyncio
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils import Logger
+
+TRACE_LOGGER = Logger(name="trace", log_file="trace.log")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+@dataclass
+class Counter:
+    name: str
+    help: str
+
+    def __post_init__(self):
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+@dataclass
+class Histogram:
+    """Histogram với bucket cố định như Prometheus, observe chỉ tăng bộ đếm nên rất rẻ"""
+    name: str
+    help: str
+    buckets: Tuple[float, ...] = LATENCY_BUCKETS
+
+    def __post_init__(self):
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(_label_key(labels), ()))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {self._sums[key]:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    component: str = ""
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+_CURRENT_SPAN: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Telemetry:
+    """
+    Span theo từng bước (route, extract, retrieve, generate, embed, upsert), histogram độ trễ và counter,
+    xuất ra dạng text của Prometheus. Span kết thúc được ghi vào logs/trace.log qua hàng đợi nên
+    không chặn request.
+
+    >>> examples:
+        with TELEMETRY.span("retrieve", component="columnar") as span:
+            span.set(num_products=3)
+        TELEMETRY.counter("chat_requests_total", "...").inc(status="200")
+        TELEMETRY.render_prometheus()
+    """
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.stage_latency = self.histogram("stage_latency_seconds", "Latency of each pipeline stage")
+        self.stage_errors = self.counter("stage_errors_total", "Pipeline stages that raised an exception")
+
+    def _get_metric(self, name: str, factory: Callable):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, factory())
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_metric(name, lambda: Counter(name=name, help=help or name))
+
+    def histogram(self, name: str, help: str = "", buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_metric(name, lambda: Histogram(name=name, help=help or name, buckets=buckets))
+
+    @contextmanager
+    def span(self, name: str, component: str = "", **attributes) -> Iterator[Span]:
+        span = self.start_span(name, component=component, **attributes)
+        token = _CURRENT_SPAN.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            span.set(error=f"{type(e).__name__}: {e}")
+            self.stage_errors.inc(stage=name, component=component)
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            self.record(span, time.perf_counter() - start)
+
+    def start_span(self, name: str, component: str = "", **attributes) -> Span:
+        """
+        Span không gắn vào context, dùng cho đoạn code không bọc được bằng with (vd: generator
+        stream token), kết thúc bằng record(span, duration).
+        """
+        parent = _CURRENT_SPAN.get()
+        return Span(name=name,
+                    trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+                    span_id=uuid.uuid4().hex[:16],
+                    parent_id=parent.span_id if parent else None,
+                    component=component,
+                    attributes=attributes)
+
+    def record(self, span: Span, duration: float):
+        """Ghi độ trễ của span vào histogram và đưa 1 dòng json vào trace log"""
+        self.stage_latency.observe(duration, stage=span.name, component=span.component)
+        TRACE_LOGGER.log.info(json.dumps({
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "component": span.component,
+            "status": span.status,
+            "duration_ms": round(duration * 1000, 3),
+            **span.attributes,
+        }, ensure_ascii=False, default=str))
+
+    def traced(self, name: str, component: Optional[str] = None):
+        """Decorator bọc hàm (sync hoặc async) trong 1 span, component mặc định là tên class chứa hàm"""
+        def decorator(fn: Callable):
+            qualname = fn.__qualname__.split(".")
+            span_component = component if component is not None else (
+                qualname[-2] if len(qualname) > 1 else fn.__module__)
+
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name, component=span_component):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, component=span_component):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+TELEMETRY = Telemetry()
@@ -4,10 +4,8 @@ from pydantic import Field
 from typing import Annotated
 dotenv.load_dotenv()
 from langchain.tools import BaseTool
-from langchain_community.tools.tavily_search import TavilySearchResults
 from prompt import PROMPT_TOOLS
-
-os.environ["TAVILY_API_KEY"] = os.getenv("TAVILY_API_KEY")
+from clients import CLIENTS
 
 class ProductSearchTool(BaseTool):
     name: Annotated[str, Field(description="Tool name")] = "product_search"
@@ -30,7 +28,7 @@ class GeneralInfoTool(BaseTool):
         pass
 
 
-search = TavilySearchResults(
+search = CLIENTS.web_search_tool(
     name="search_web", 
     description = PROMPT_TOOLS['search_web'], 
     max_results=3, 
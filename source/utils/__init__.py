@@ -1,3 +1,5 @@
 from .logger import Logger
-from .util_retriever import parse_string_to_dict, parse_specification_range
-from .utilize import write_json, load_json, compute_args_hash
\ No newline at end of file
+from .util_retriever import (parse_string_to_dict, parse_specification_range, parse_number, normalize_specifications,
+                             UNIT_FACTORS, CANONICAL_COLUMNS, DEMAND_COLUMNS)
+from .utilize import write_json, load_json, compute_args_hash, compute_mdhash_id
+from .embedding_cache import EmbeddingCache, EMBEDDING_CACHE, normalize_text
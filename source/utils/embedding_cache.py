@@ -0,0 +1,126 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .utilize import compute_args_hash
+
+SparseVector = Tuple[np.ndarray, np.ndarray]  # (indices, values)
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa câu hỏi trước khi tạo key: NFC, chữ thường, gộp khoảng trắng"""
+    text = unicodedata.normalize("NFC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@dataclass
+class EmbeddingCache:
+    """
+    Cache embedding của câu query: LRU trong bộ nhớ đặt trước 1 store SQLite trên đĩa.
+    Key = compute_args_hash(model_name, kind, normalize_text(text)), hỗ trợ cả vector dense và sparse.
+
+    >>> examples:
+        cache.get_dense("jina", "Điều hòa  12 triệu", compute=lambda text: model.embed(text))
+        cache.get_sparse("bm25", "điều hòa 12 triệu", compute=lambda text: (indices, values))
+        cache.stats()   # {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'hit_rate': 0.5}
+    """
+    path: Optional[str] = "data/cache/embeddings.db"
+    max_items: int = 4096
+    memory_hits: int = field(default=0, init=False)
+    disk_hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    _memory: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _conn: Optional[sqlite3.Connection] = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, payload BLOB)")
+        return self._conn
+
+    def _remember(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _get(self, 
+             key: str, 
+             compute: Callable[[], Any], 
+             dumps: Callable[[Any], bytes], 
+             loads: Callable[[bytes], Any]) -> Any:
+        with self._lock:
+            if key in self._memory:
+                self.memory_hits += 1
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+            conn = self._connection()
+            row = conn.execute("SELECT payload FROM embeddings WHERE key = ?", (key,)).fetchone() if conn else None
+            if row is not None:
+                self.disk_hits += 1
+                value = loads(row[0])
+                self._remember(key, value)
+                return value
+            self.misses += 1
+
+        # tính embedding ngoài lock để các query khác không phải chờ model
+        value = compute()
+        with self._lock:
+            self._remember(key, value)
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("INSERT OR REPLACE INTO embeddings (key, payload) VALUES (?, ?)", (key, dumps(value)))
+                conn.commit()
+        return value
+
+    def get_dense(self, model_name: str, text: str, compute: Callable[[str], Any]) -> np.ndarray:
+        key = compute_args_hash(model_name, "dense", normalize_text(text))
+        return self._get(key=key,
+                         compute=lambda: np.asarray(compute(text), dtype=np.float32),
+                         dumps=lambda vector: vector.tobytes(),
+                         loads=lambda payload: np.frombuffer(payload, dtype=np.float32))
+
+    def get_sparse(self, model_name: str, text: str, compute: Callable[[str], SparseVector]) -> SparseVector:
+        def _compute() -> SparseVector:
+            indices, values = compute(text)
+            return np.asarray(indices, dtype=np.int32), np.asarray(values, dtype=np.float32)
+
+        def _loads(payload: bytes) -> SparseVector:
+            # int32 và float32 cùng 4 byte -> nửa đầu là indices, nửa sau là values
+            half = len(payload) // 2
+            return np.frombuffer(payload[:half], dtype=np.int32), np.frombuffer(payload[half:], dtype=np.float32)
+
+        key = compute_args_hash(model_name, "sparse", normalize_text(text))
+        return self._get(key=key,
+                         compute=_compute,
+                         dumps=lambda vector: vector[0].tobytes() + vector[1].tobytes(),
+                         loads=_loads)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+EMBEDDING_CACHE = EmbeddingCache()
@@ -1,19 +1,100 @@
 import sys
+import queue
+import atexit
+import threading
 from pathlib import Path
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 sys.path.append(str(Path(__file__).parent))
 
 class LoggingConfig:
     ROOT_DIR = Path(__file__).parent.parent # cd to root folder
     LOG_DIR = ROOT_DIR / "logs"
-LoggingConfig.LOG_DIR.mkdir(parents=True, exist_ok=True) # create logs folder in src 
+    MAX_BYTES = 10 * 1024 * 1024
+    BACKUP_COUNT = 5
+LoggingConfig.LOG_DIR.mkdir(parents=True, exist_ok=True) # create logs folder in src
+
+STDOUT = "<stdout>"
+
+
+class _RouterHandler(logging.Handler):
+    """
+    Chạy trong thread của QueueListener: ghi record ra file tương ứng với record.log_target.
+    Mỗi file chỉ có 1 RotatingFileHandler dùng chung cho mọi logger.
+    """
+    def __init__(self):
+        super().__init__()
+        self._handlers = {}
+
+    def _get_handler(self, target: str) -> logging.Handler:
+        handler = self._handlers.get(target)
+        if handler is None:
+            if target == STDOUT:
+                handler = logging.StreamHandler(sys.stdout)
+            else:
+                handler = RotatingFileHandler(filename=target,
+                                              maxBytes=LoggingConfig.MAX_BYTES,
+                                              backupCount=LoggingConfig.BACKUP_COUNT,
+                                              encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+            self._handlers[target] = handler
+        return handler
+
+    def emit(self, record: logging.LogRecord):
+        self._get_handler(getattr(record, "log_target", STDOUT)).handle(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+
+class _TargetFilter(logging.Filter):
+    def __init__(self, target: str):
+        super().__init__()
+        self.target = target
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.log_target = self.target
+        return True
+
+
+class _LogQueue:
+    """1 hàng đợi và 1 thread ghi log cho cả process, khởi động ở lần dùng đầu tiên"""
+    def __init__(self):
+        self.queue: "queue.Queue" = queue.Queue(-1)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = QueueListener(self.queue, _RouterHandler())
+                    self._listener.start()
+                    atexit.register(self.stop)
+
+    def stop(self):
+        """Ghi hết các record còn trong hàng đợi rồi dừng thread"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._listener = None
+
+
+LOG_QUEUE = _LogQueue()
 
 
 class Logger:
+    """
+    Logger không chặn luồng xử lý: record được đưa vào hàng đợi, 1 thread nền ghi ra file/stdout.
+    Tạo Logger nhiều lần với cùng name không gắn thêm handler.
+    """
     def __init__(self,
-                 name="", 
+                 name="",
                  log_level: str=logging.INFO,
                  log_file=None):
         self.log = logging.getLogger(name=name)
@@ -21,24 +102,11 @@ class Logger:
 
     def get_logger(self, log_level: str, log_file: str):
         self.log.setLevel(level=log_level)
-        self._init_formatter()
-
-        if log_file is not None: # if log_file exist
-            self._add_file_handler(log_file=LoggingConfig.LOG_DIR/log_file)
-        else: # print log to console
-            self._add_stream_handler()
-    
-    def _init_formatter(self):
-        self.formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-    
-    def _add_stream_handler(self):
-        stream_handler = logging.StreamHandler(sys.stdout)
-        stream_handler.setFormatter(self.formatter)
-        self.log.addHandler(stream_handler)
-    
-    def _add_file_handler(self, log_file: Path):
-        file_handler = RotatingFileHandler(filename=log_file, maxBytes=10000, backupCount=10)
-        file_handler.setFormatter(self.formatter)
-        self.log.addHandler(file_handler)
\ No newline at end of file
+        if any(isinstance(handler, QueueHandler) for handler in self.log.handlers):
+            return
+
+        target = str(LoggingConfig.LOG_DIR / log_file) if log_file is not None else STDOUT
+        LOG_QUEUE.start()
+        handler = QueueHandler(LOG_QUEUE.queue)
+        handler.addFilter(_TargetFilter(target))
+        self.log.addHandler(handler)
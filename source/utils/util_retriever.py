@@ -1,7 +1,12 @@
 import ast
+import math
 import re 
+from functools import lru_cache
 from typing import Dict, Any, Literal, Tuple 
 
+import numpy as np
+import pandas as pd
+
 def parse_string_to_dict(input_string: str) -> Dict[str, Any]:
     """
         Nhận string từ function calling trả về, xử lí string và đưa về dạng dictionary chứa thông tin của các thông số kĩ thuật.
@@ -24,44 +29,112 @@ def parse_string_to_dict(input_string: str) -> Dict[str, Any]:
     except (SyntaxError, ValueError) as e:
         raise ValueError(f"Error: Invalid input string - {str(e)}")
     
-def parse_specification_range(specification: str):
+# đơn vị -> (thông số, hệ số đổi về đơn vị chuẩn: VND, W, kg, lít)
+UNIT_FACTORS: Dict[str, Tuple[str, float]] = {
+    "triệu": ("price", 1e6), "tr": ("price", 1e6), "t": ("price", 1e6),
+    "nghìn": ("price", 1e3), "k": ("price", 1e3), "đ": ("price", 1.0), "vnd": ("price", 1.0),
+    "kw": ("power", 1000.0), "w": ("power", 1.0), "hp": ("power", 745.7), "btu": ("power", 0.293071),
+    "kg": ("weight", 1.0), "g": ("weight", 0.001),
+    "lít": ("volume", 1.0), "l": ("volume", 1.0), "ml": ("volume", 0.001),
+}
+# cột gốc -> (thông số, cột chuẩn hóa mà các engine filter)
+CANONICAL_COLUMNS: Dict[str, Tuple[str, str]] = {
+    "lifecare_price": ("price", "price_vnd"),
+    "power": ("power", "power_w"),
+    "weight": ("weight", "weight_kg"),
+    "volume": ("volume", "volume_l"),
+}
+# thông số trong demands -> cột chuẩn hóa
+DEMAND_COLUMNS: Dict[str, str] = {dimension: column for dimension, column in CANONICAL_COLUMNS.values()}
+
+_UNITS = "|".join(sorted(map(re.escape, UNIT_FACTORS), key=len, reverse=True))
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+UNIT_PATTERN = re.compile(rf"(?<!\w)(?:\d+(?:[.,]\d+)*\s*)?({_UNITS})(?!\w)", re.IGNORECASE)
+# giá trị kèm đơn vị ngay sau từ khóa của thông số trong cột specifications
+SPEC_PATTERNS: Dict[str, re.Pattern] = {
+    dimension: re.compile(rf"(?:{keywords})[^:\d]{{0,30}}:?\s*(\d+(?:[.,]\d+)*)\s*({_UNITS})(?!\w)", re.IGNORECASE)
+    for dimension, keywords in (("power", "công suất"),
+                                ("weight", "trọng lượng|khối lượng"),
+                                ("volume", "dung tích"))
+}
+_THOUSANDS = re.compile(r"\d{1,3}(?:([.,])\d{3})(?:\1\d{3})*")
+# "trên 20 triệu", "từ 12.000 btu trở lên"... -> khoảng không có cận trên
+_LOWER_BOUND = re.compile(r"^\s*(?:trên|hơn|tối thiểu|ít nhất)(?!\w)|(?<!\w)trở lên(?!\w)", re.IGNORECASE)
+
+
+def parse_number(text: str) -> float:
+    """
+    "12.000" / "12,000" -> 12000 (phân tách hàng nghìn), "1.8" / "0,98" -> số thập phân.
     """
-    Phân tích chuỗi thông số kỹ thuật và trả về khoảng giá trị min_value, max_value.
+    if _THOUSANDS.fullmatch(text) and not text.startswith("0"):
+        return float(text.replace(",", "").replace(".", ""))
+    return float(text.replace(",", "."))
+
+
+@lru_cache(maxsize=4096)
+def parse_specification_range(specification: str) -> Tuple[float, float]:
+    """
+    Phân tích chuỗi thông số kỹ thuật và trả về khoảng giá trị min_value, max_value
+    theo đơn vị chuẩn (VND, W, kg, lít) của các cột price_vnd, power_w, weight_kg, volume_l.
     Args:
         - specification: Chuỗi thông số kỹ thuật cần xử lý.
     Returns:
-        - Tuple (min_value, max_value): Khoảng giá trị tìm kiếm.
+        - Tuple (min_value, max_value): Khoảng giá trị tìm kiếm, cận dưới ("trên 20 triệu")
+          cho max_value = inf.
     """
+    numbers = [parse_number(num) for num in NUMBER_PATTERN.findall(specification)]
+    units = UNIT_PATTERN.findall(specification)
+    # Lấy đơn vị cuối cùng làm đơn vị chung, không có đơn vị thì giữ nguyên giá trị
+    factor = UNIT_FACTORS[units[-1].lower()][1] if units else 1.0
+    converted_numbers = [num * factor for num in numbers]
 
-    # Step 1: Trích xuất số và đơn vị
-    number_pattern = r"(?P<number>\d+(?:,\d+)*)"  # Pattern để trích xuất số
-    unit_pattern = r"(?P<unit>triệu|nghìn|tr|k|kg|l|lít|kw|w|t|btu)\b"  # Pattern để trích xuất đơn vị
-
-    numbers = [float(num.replace(',', '')) for num in re.findall(number_pattern, specification)]
-    units = re.findall(unit_pattern, specification, re.IGNORECASE)
-    unit = units[-1].lower() if units else None  # Lấy đơn vị cuối cùng làm đơn vị chung
-
-    # Step 2: Chuyển đổi số dựa trên đơn vị
-    def convert_number_with_unit(number, unit) -> float:
-        """Chuyển đổi một số dựa trên đơn vị."""
-        if unit in ['triệu', 'tr', 't']:
-            return number * 1000000
-        elif unit in ['nghìn', 'k']:
-            return number * 1000
-        elif unit in ['kw']:
-            return number * 1000
-        return number  # Không có đơn vị, giữ nguyên giá trị
-
-    converted_numbers = [convert_number_with_unit(num, unit) for num in numbers]
-
-    # Step 3: Xây dựng khoảng giá trị
     if not converted_numbers:
         return 0, 999999999  # Giá trị mặc định nếu không có số nào
 
+    if len(converted_numbers) == 1 and _LOWER_BOUND.search(specification):
+        return converted_numbers[0], math.inf
     if len(converted_numbers) == 1:
         # Nếu chỉ có một số, tạo khoảng ±20%
         value = converted_numbers[0]
         return value * 0.8, value * 1.2
-    else:
-        # Nếu có nhiều số, lấy khoảng giữa số nhỏ nhất và lớn nhất
-        return min(converted_numbers), max(converted_numbers)
\ No newline at end of file
+    # Nếu có nhiều số, lấy khoảng giữa số nhỏ nhất và lớn nhất
+    return min(converted_numbers), max(converted_numbers)
+
+
+def _row_factor(dimension: str, raw: float, specification: str) -> float:
+    """
+    Hệ số đổi giá trị của cột gốc về đơn vị chuẩn, dựa vào đơn vị ghi trong specifications.
+    Chỉ áp dụng khi số trong specifications đúng là giá trị của cột gốc (vd: "công suất: 12.000 btu"
+    với power = 12000), ngược lại coi cột gốc đã ở đơn vị chuẩn.
+    """
+    for number, unit in SPEC_PATTERNS[dimension].findall(specification):
+        if abs(parse_number(number) - raw) <= 0.01 * abs(raw):
+            return UNIT_FACTORS[unit.lower()][1]
+    return 1.0
+
+
+def normalize_specifications(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Thêm các cột chuẩn hóa price_vnd, power_w, weight_kg, volume_l (float, thiếu giá trị là NaN)
+    từ các cột gốc. Chạy 1 lần lúc ingest, dataframe đã có đủ cột thì trả về nguyên vẹn.
+
+    >>> examples:
+        df = normalize_specifications(pd.read_excel(path))
+        df[df.power_w.between(*parse_specification_range("12000 btu"))]
+    """
+    if all(column in df.columns for _, column in CANONICAL_COLUMNS.values()):
+        return df
+
+    df = df.copy()
+    specifications = df["specifications"].fillna("").astype(str) if "specifications" in df.columns else None
+    for source, (dimension, column) in CANONICAL_COLUMNS.items():
+        raw = pd.to_numeric(df[source], errors="coerce").astype("float64") if source in df.columns \
+            else pd.Series(np.nan, index=df.index)
+        # cột gốc dùng 0 cho thông số không có
+        values = raw.where(raw > 0)
+        if dimension != "price" and specifications is not None:
+            factors = [_row_factor(dimension, value, spec) if value == value else 1.0
+                       for value, spec in zip(values.to_numpy(), specifications.to_numpy())]
+            values = values * np.asarray(factors, dtype=np.float64)
+        df[column] = values.to_numpy()
+    return df
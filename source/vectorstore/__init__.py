@@ -1,3 +1,5 @@
 from .chroma import EnsembleQueryEngine
 from .qdrant import QdrantQueryEngine
-from .elastic_search import ElasticQueryEngine
\ No newline at end of file
+from .elastic_search import ElasticQueryEngine
+from .columnar import ColumnarQueryEngine
+from .memmap import MemmapVectorEngine
\ No newline at end of file
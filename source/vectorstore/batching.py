@@ -0,0 +1,128 @@
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from utils import Logger
+
+LOGGER = Logger(name=__file__, log_file="batching.log")
+
+_STOP = object()
+
+
+@dataclass
+class MicroBatchDispatcher:
+    """
+    Gom các truy vấn từ nhiều caller đồng thời trong 1 cửa sổ thời gian ngắn thành 1 lần
+    gọi search_fn (msearch), rồi trả kết quả về đúng future của từng caller.
+    Batch được gửi khi đủ max_batch_size hoặc hết window_ms kể từ truy vấn đầu tiên của batch,
+    tối đa max_inflight batch chạy cùng lúc.
+
+    >>> examples:
+        dispatcher = MicroBatchDispatcher(search_fn=engine.bulk_search_products, window_ms=2)
+        responses = dispatcher.search([query_1, query_2])
+        responses = await dispatcher.asearch([query_1])
+        dispatcher.close()
+    """
+    search_fn: Callable[[List[Dict]], List[Dict]]
+    window_ms: float = 2.0
+    max_batch_size: int = 64
+    max_inflight: int = 4
+
+    def __post_init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="msearch")
+        self._inflight = threading.BoundedSemaphore(self.max_inflight)
+        self._num_batches = 0
+        self._num_queries = 0
+
+    def submit(self, query: Dict) -> Future:
+        """Đưa 1 truy vấn vào hàng đợi, trả về future chứa response tương ứng"""
+        future: Future = Future()
+        # kiểm tra closed và put cùng 1 lock với close() để không có truy vấn nào nằm sau _STOP
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatchDispatcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="msearch-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put((query, future))
+        return future
+
+    def search(self, queries: List[Dict]) -> List[Dict]:
+        futures = [self.submit(query) for query in queries]
+        return [future.result() for future in futures]
+
+    async def asearch(self, queries: List[Dict]) -> List[Dict]:
+        futures = [asyncio.wrap_future(self.submit(query)) for query in queries]
+        return list(await asyncio.gather(*futures))
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.perf_counter() + self.window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = self._collect(item)
+            # chờ khi đã đủ max_inflight batch đang chạy, trong lúc đó truy vấn mới tiếp tục dồn vào hàng đợi
+            self._inflight.acquire()
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List):
+        try:
+            responses = self.search_fn([query for query, _ in batch])
+            if len(responses) != len(batch):
+                raise RuntimeError(f"search_fn returned {len(responses)} responses for {len(batch)} queries")
+            for (_, future), response in zip(batch, responses):
+                future.set_result(response)
+        except Exception as e:
+            LOGGER.log.error(f"Micro-batch of {len(batch)} queries failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._num_batches += 1
+                self._num_queries += len(batch)
+            self._inflight.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self._num_batches,
+                "queries": self._num_queries,
+                "avg_batch_size": self._num_queries / self._num_batches if self._num_batches else 0.0,
+            }
+
+    def close(self):
+        """Xử lý nốt các truy vấn đã submit rồi dừng, submit sau khi close sẽ raise RuntimeError"""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,221 @@
+import os
+import re
+import numpy as np
+from scipy import sparse
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever as LCBaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+from utils import Logger, load_json, write_json, compute_mdhash_id
+
+LOGGER = Logger(name=__file__, log_file="bm25_index.log")
+
+ALL_GROUPS = "__all__"
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _json_value(value: Any) -> Any:
+    """Đưa giá trị numpy về kiểu python để ghi được ra json"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+@dataclass
+class _Partition:
+    """
+    Ma trận trọng số BM25 (doc x term) dạng CSC của 1 group.
+    Mỗi cột là posting list của 1 term nên query chỉ đọc các cột của term có trong câu hỏi.
+    """
+    weights: sparse.csc_matrix
+    doc_ids: np.ndarray
+
+
+@dataclass
+class BM25Index:
+    """
+    Inverted index BM25 dựng sẵn, chia partition theo group_product_name và lưu ra đĩa.
+    IDF và độ dài trung bình được tính trong từng group, tương đương với việc lọc theo group
+    rồi mới chấm điểm BM25.
+
+    >>> examples:
+        index = BM25Index.build(documents, fingerprint=...)
+        index.save("data/db/bm25_index")
+        index = BM25Index.load("data/db/bm25_index")
+        index.search("điều hòa 12000 btu", group="điều hòa", k=3)
+    """
+    documents: List[Document]
+    vocabulary: Dict[str, int]
+    partitions: Dict[str, _Partition]
+    fingerprint: str = ""
+    k1: float = 1.5
+    b: float = 0.75
+
+    @staticmethod
+    def compute_fingerprint(documents: List[Document]) -> str:
+        return compute_mdhash_id("\x1e".join(doc.page_content for doc in documents))
+
+    @classmethod
+    def build(cls, 
+              documents: List[Document], 
+              group_key: Optional[str] = "group_product_name",
+              k1: float = 1.5, 
+              b: float = 0.75) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        rows, cols = [], []
+        for doc_id, doc in enumerate(documents):
+            for token in tokenize(doc.page_content):
+                rows.append(doc_id)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        # ma trận tần suất term, các cặp (doc, term) trùng nhau được cộng dồn
+        term_freq = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                      shape=(len(documents), len(vocabulary)))
+
+        groups: Dict[str, List[int]] = {ALL_GROUPS: list(range(len(documents)))}
+        if group_key:
+            for doc_id, doc in enumerate(documents):
+                groups.setdefault(str(doc.metadata.get(group_key)), []).append(doc_id)
+
+        partitions = {
+            group: cls._build_partition(term_freq, np.asarray(doc_ids, dtype=np.int64), k1, b)
+            for group, doc_ids in groups.items()
+        }
+        return cls(documents=documents, 
+                   vocabulary=vocabulary, 
+                   partitions=partitions,
+                   fingerprint=cls.compute_fingerprint(documents), 
+                   k1=k1, 
+                   b=b)
+
+    @staticmethod
+    def _build_partition(term_freq: sparse.csr_matrix, doc_ids: np.ndarray, k1: float, b: float) -> _Partition:
+        group_tf = term_freq[doc_ids]
+        tf = group_tf.tocoo()
+        num_docs = len(doc_ids)
+        doc_len = np.asarray(group_tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if num_docs else 0.0
+
+        doc_freq = np.bincount(tf.col, minlength=term_freq.shape[1])
+        idf = np.log((num_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1.0)
+
+        norm = k1 * (1.0 - b + b * doc_len / avg_len) if avg_len else np.full(num_docs, k1)
+        data = idf[tf.col] * tf.data * (k1 + 1.0) / (tf.data + norm[tf.row])
+
+        weights = sparse.csc_matrix((data.astype(np.float32), (tf.row, tf.col)), shape=tf.shape)
+        return _Partition(weights=weights, doc_ids=doc_ids)
+
+    def scores(self, query: str, group: Optional[str] = None, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Điểm BM25 của câu hỏi cho từng document trong partition của group.
+
+        Args:
+            - query: câu hỏi
+            - group: partition cần chấm điểm, None là toàn bộ documents
+            - rows: chỉ chấm điểm các vị trí này trong partition
+        Return:
+            - mảng điểm theo thứ tự của partition (hoặc của rows), 0 nếu không khớp term nào
+        """
+        partition = self.partitions.get(group if group else ALL_GROUPS)
+        if partition is None:
+            return np.zeros(0 if rows is None else len(rows), dtype=np.float32)
+
+        weights = partition.weights if rows is None else partition.weights[rows]
+        term_ids = [self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary]
+        if not term_ids:
+            return np.zeros(weights.shape[0], dtype=np.float32)
+
+        term_ids, counts = np.unique(term_ids, return_counts=True)
+        return weights[:, term_ids] @ counts.astype(np.float32)
+
+    def search(self, query: str, group: Optional[str] = None, k: int = 3) -> List[Document]:
+        partition = self.partitions.get(group if group else ALL_GROUPS)
+        if partition is None:
+            return []
+
+        scores = self.scores(query, group=group)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self.documents[doc_id] for doc_id in partition.doc_ids[candidates]]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        groups = list(self.partitions)
+        arrays = {}
+        for i, group in enumerate(groups):
+            partition = self.partitions[group]
+            arrays.update({
+                f"p{i}_data": partition.weights.data,
+                f"p{i}_indices": partition.weights.indices,
+                f"p{i}_indptr": partition.weights.indptr,
+                f"p{i}_shape": np.asarray(partition.weights.shape),
+                f"p{i}_doc_ids": partition.doc_ids,
+            })
+        np.savez(os.path.join(path, "postings.npz"), **arrays)
+
+        write_json(json_obj={
+            "fingerprint": self.fingerprint,
+            "k1": self.k1,
+            "b": self.b,
+            "groups": groups,
+            "vocabulary": self.vocabulary,
+            "documents": [
+                {"page_content": doc.page_content, 
+                 "metadata": {key: _json_value(value) for key, value in doc.metadata.items()}}
+                for doc in self.documents
+            ],
+        }, file_name=os.path.join(path, "index.json"))
+        LOGGER.log.info(f"Save BM25 index to: {path}")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        meta = load_json(os.path.join(path, "index.json"))
+        postings_path = os.path.join(path, "postings.npz")
+        if not meta or not os.path.exists(postings_path):
+            return None
+
+        partitions = {}
+        with np.load(postings_path) as arrays:
+            for i, group in enumerate(meta['groups']):
+                weights = sparse.csc_matrix(
+                    (arrays[f"p{i}_data"], arrays[f"p{i}_indices"], arrays[f"p{i}_indptr"]),
+                    shape=tuple(arrays[f"p{i}_shape"]))
+                partitions[group] = _Partition(weights=weights, doc_ids=arrays[f"p{i}_doc_ids"])
+
+        return cls(documents=[Document(**doc) for doc in meta['documents']],
+                   vocabulary=meta['vocabulary'],
+                   partitions=partitions,
+                   fingerprint=meta['fingerprint'],
+                   k1=meta['k1'],
+                   b=meta['b'])
+
+    @classmethod
+    def load_or_build(cls, path: str, documents: List[Document], **kwargs) -> "BM25Index":
+        """Dùng index đã lưu nếu vẫn khớp với documents hiện tại, ngược lại build lại và lưu"""
+        index = cls.load(path)
+        if index is not None and index.fingerprint == cls.compute_fingerprint(documents):
+            LOGGER.log.info(f"Load BM25 index from: {path}")
+            return index
+
+        index = cls.build(documents, **kwargs)
+        index.save(path)
+        return index
+
+
+class BM25IndexRetriever(LCBaseRetriever):
+    """LangChain retriever trên BM25Index, chỉ chấm điểm trong partition của group"""
+    index: Any
+    group: Optional[str] = None
+    k: int = 3
+
+    def _get_relevant_documents(self, 
+                                query: str, 
+                                *, 
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search(query=query, group=self.group, k=self.k)
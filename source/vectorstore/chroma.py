@@ -1,17 +1,18 @@
 import os
+import time
 import pandas as pd
-from uuid import uuid4
 from typing import List, Dict, Any
 from dataclasses import dataclass
 from langchain_core.documents import Document
 from langchain_community.vectorstores import Chroma
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.embeddings import Embeddings
 
-from base import BaseRetriever
-from utils import Logger
+from base import BaseRetriever, UpsertReport, ProductHit, PRODUCT_FIELDS, format_hits
+from utils import Logger, compute_mdhash_id, normalize_specifications
 from config import ArgChroma
+from telemetry import TELEMETRY
+from .bm25_index import BM25Index, BM25IndexRetriever
+from .fusion import FusionRetriever
 
 LOGGER = Logger(name=__file__, log_file="chroma_retriever.log")
 
@@ -35,38 +36,143 @@ class EnsembleQueryEngine(BaseRetriever):
             embedding_function=self.embedder, 
             persist_directory=self.config.db_persist_path
         )
-        self.documents = self.upsert()
+        self.upsert()
 
-    def upsert(self):
-        documents = []
-        for _, row in self.df.iterrows():
+    @staticmethod
+    def _metadata_value(value: Any) -> Any:
+        """Chroma chỉ nhận metadata kiểu str, int, float, bool"""
+        if hasattr(value, "item"):
+            value = value.item()
+        return "" if value is None or value != value else value
+
+    def _build_documents(self, df: pd.DataFrame) -> Dict[str, Document]:
+        """
+        Tạo document cho từng dòng, id = product_info_id + md5 nội dung của dòng.
+        Dòng không đổi sẽ giữ nguyên id nên không phải embed lại.
+        """
+        documents = {}
+        for row in df.to_dict(orient="records"):
             content = (
                 f"Tên sản phẩm: '{row['product_name']}'\n"
                 f"Mã sản phẩm: {row['product_info_id']}\n"
                 f"Giá: {row['lifecare_price']}\n"
                 f"Thông số kỹ thuật: {row['specifications']}\n"
             )
-            metadata = {col: row[col] for col in row.index} 
-            documents.append(Document(page_content=content, metadata=metadata))
-        
-        ids = [str(uuid4()) for _ in range(len(documents))]
-        
-        if not os.path.exists(self.config.db_persist_path):
-            return self.client.from_documents(
-                ids=ids,
-                documents=documents,
-                embedding=self.embeder,
-                persist_directory=self.config.db_persist_path
-            )
-        LOGGER.log.info(msg="Upsert data to vector db successfull!")
+            # chỉ lưu các field cần cho kết quả, không mang theo mọi cột của dataframe
+            metadata = {col: self._metadata_value(row[col]) for col in PRODUCT_FIELDS if col in row}
+            doc_id = compute_mdhash_id(content=content + str(metadata), 
+                                       prefix=f"{row['product_info_id']}-")
+            documents[doc_id] = Document(page_content=content, metadata=metadata)
         return documents
+
+    @TELEMETRY.traced("upsert")
+    def upsert(self, df: pd.DataFrame=None) -> UpsertReport:
+        """
+        Đồng bộ tăng dần dataframe vào Chroma: chỉ embed các dòng mới hoặc đã thay đổi,
+        xóa các sản phẩm không còn trong dataframe.
+        """
+        start = time.perf_counter()
+        documents = self._build_documents(normalize_specifications(self.df if df is None else df))
+        existing_ids = set(self.client.get(include=[])['ids'])
+
+        new_ids = [doc_id for doc_id in documents if doc_id not in existing_ids]
+        stale_ids = [doc_id for doc_id in existing_ids if doc_id not in documents]
+
+        batch_size = self.config.upsert_batch_size
+        for i in range(0, len(new_ids), batch_size):
+            batch_ids = new_ids[i: i + batch_size]
+            self.client.add_documents(documents=[documents[doc_id] for doc_id in batch_ids], 
+                                      ids=batch_ids)
+        for i in range(0, len(stale_ids), batch_size):
+            self.client.delete(ids=stale_ids[i: i + batch_size])
+
+        # cùng product_info_id nhưng khác hash -> sản phẩm được cập nhật
+        stale_products = {doc_id.split("-", 1)[0] for doc_id in stale_ids}
+        updated = sum(doc_id.split("-", 1)[0] in stale_products for doc_id in new_ids)
+        report = UpsertReport(added=len(new_ids) - updated,
+                              updated=updated,
+                              deleted=len(stale_ids) - updated,
+                              unchanged=len(documents) - len(new_ids),
+                              elapsed=time.perf_counter() - start)
+
+        self.documents = list(documents.values())
+        self.bm25_index = BM25Index.load_or_build(path=self.config.bm25_index_path, 
+                                                  documents=self.documents)
+        LOGGER.log.info(msg=f"Upsert data to vector db successfull! {report}")
+        return report
+
+    def upsert_chunk(self, df: pd.DataFrame) -> UpsertReport:
+        """
+        Upsert 1 chunk của catalog đang được stream: chỉ so sánh với các id của chunk,
+        không xóa gì. Sản phẩm không còn trong catalog bị xóa ở finish_ingest.
+        """
+        start = time.perf_counter()
+        documents = self._build_documents(normalize_specifications(df))
+        if not hasattr(self, "_ingested_ids"):
+            self._ingested_ids, self._ingested_products, self._failed_products = set(), set(), set()
+        # sản phẩm của chunk được giữ lại khi prune cho tới khi bản mới được ghi xong:
+        # ghi lỗi thì bản cũ (khác hash) không bị coi là stale
+        chunk_products = {doc_id.split("-", 1)[0] for doc_id in documents}
+        self._failed_products.update(chunk_products)
+
+        existing_ids = set(self.client.get(ids=list(documents), include=[])['ids'])
+        new_ids = [doc_id for doc_id in documents if doc_id not in existing_ids]
+        # cùng product_info_id nhưng khác hash -> sản phẩm được cập nhật
+        product_ids = list({documents[doc_id].metadata['product_info_id'] for doc_id in new_ids})
+        stored_products = {doc_id.split("-", 1)[0] for doc_id in self.client.get(
+            where={"product_info_id": {"$in": product_ids}}, include=[])['ids']} if product_ids else set()
+        updated = sum(doc_id.split("-", 1)[0] in stored_products for doc_id in new_ids)
+
+        batch_size = self.config.upsert_batch_size
+        for i in range(0, len(new_ids), batch_size):
+            batch_ids = new_ids[i: i + batch_size]
+            self.client.add_documents(documents=[documents[doc_id] for doc_id in batch_ids], 
+                                      ids=batch_ids)
+        self._ingested_ids.update(documents)
+        self._ingested_products.update(chunk_products)
+        self._failed_products.difference_update(chunk_products)
+        return UpsertReport(added=len(new_ids) - updated,
+                            updated=updated,
+                            unchanged=len(documents) - len(new_ids),
+                            elapsed=time.perf_counter() - start)
+
+    def finish_ingest(self, complete: bool=True) -> UpsertReport:
+        """
+        Xóa các document không có trong lần ingest vừa rồi và dựng lại BM25 index.
+        Ingest không trọn vẹn (complete=False) thì không xóa gì, chỉ dựng lại BM25.
+        """
+        start = time.perf_counter()
+        ingested_ids = getattr(self, "_ingested_ids", set())
+        ingested_products = getattr(self, "_ingested_products", set())
+        failed_products = getattr(self, "_failed_products", set())
+        self._ingested_ids, self._ingested_products, self._failed_products = set(), set(), set()
+
+        stale_ids = [doc_id for doc_id in self.client.get(include=[])['ids'] 
+                     if doc_id not in ingested_ids and doc_id.split("-", 1)[0] not in failed_products] \
+            if complete else []
+        batch_size = self.config.upsert_batch_size
+        for i in range(0, len(stale_ids), batch_size):
+            self.client.delete(ids=stale_ids[i: i + batch_size])
+
+        stored = self.client.get(include=["documents", "metadatas"])
+        self.documents = [Document(page_content=content, metadata=metadata)
+                          for content, metadata in zip(stored['documents'], stored['metadatas'])]
+        self.bm25_index = BM25Index.load_or_build(path=self.config.bm25_index_path, 
+                                                  documents=self.documents)
+        # bản cũ của sản phẩm được cập nhật đã tính vào updated ở upsert_chunk
+        report = UpsertReport(deleted=sum(doc_id.split("-", 1)[0] not in ingested_products for doc_id in stale_ids),
+                              elapsed=time.perf_counter() - start)
+        LOGGER.log.info(msg=f"Finish streamed ingest: {len(stale_ids)} stale documents removed, "
+                            f"{len(self.documents)} documents indexed for BM25")
+        return report
     
 
-    def _create_bm25_retriever(self) -> BM25Retriever:
-        """Create BM25 retriever"""
-        retriever = BM25Retriever.from_documents(self.documents)
-        retriever.k = self.config.top_k
-        return retriever
+    def _create_bm25_retriever(self, filter_search: Dict[str, Any]=None) -> BM25IndexRetriever:
+        """Create BM25 retriever on the prebuilt index, restricted to the filtered group"""
+        group = filter_search.get("group_product_name") if filter_search else None
+        return BM25IndexRetriever(index=self.bm25_index, 
+                                  group=group, 
+                                  k=self.config.top_k)
     
     def _create_mmr_retriever(self, filter_search: Dict[str, Any]=None) -> Chroma: 
         """
@@ -123,20 +229,27 @@ class EnsembleQueryEngine(BaseRetriever):
         FOR SIMILAR ALGORITHM: 
             score_threshold: Minimum relevance threshold for similarity_score_threshold
         
-        weights_ensemble: weights for each search type [similarity, bm25, mmr]
+        weights_ensemble: weights for each search type [bm25, mmr]
+        retriever_timeouts: deadline of each search type in seconds, a late one is left out of the fusion
         top_k: Amount of documents to return (Default: 3)
         filter_search: Filter by document metadata
         """
-        bm25_retriever = self._create_bm25_retriever()
+        bm25_retriever = self._create_bm25_retriever(filter_search=filter_search)
 
         # vanilla_retriever = self._create_vanilla_retriever(top_k=top_k,
         #                                                    score_threshold=score_threshold,
         #                                                    filter_search=filter_search)
         mmr_retriever = self._create_mmr_retriever(filter_search=filter_search)
 
-        ensemble_retriever=  EnsembleRetriever(
-            retrievers=[ bm25_retriever, mmr_retriever],
-            weights=self.config.weights_ensemble
+        # bm25 và mmr chạy song song, gộp bằng weighted RRF
+        ensemble_retriever = FusionRetriever(
+            retrievers=[bm25_retriever, mmr_retriever],
+            weights=self.config.weights_ensemble,
+            timeouts=self.config.retriever_timeouts,
+            names=["bm25", "mmr"],
+            c=self.config.rrf_c,
+            top_k=self.config.top_k,
+            max_workers=self.config.fusion_workers
         )
         return ensemble_retriever
     
@@ -161,15 +274,23 @@ class EnsembleQueryEngine(BaseRetriever):
         Returns:
             Relevant context for the query
         """
-        filter_search = None
-        if demands is not None:
-            filter_search = self._create_filter_search(demands=demands)
+        return format_hits(self.search_records(query=query, demands=demands))
+
+    async def aquery(self, 
+                     query: str, 
+                     demands: Dict[str, Any]=None):
+        return format_hits(await self.asearch_records(query=query, demands=demands))
 
+    def search_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        filter_search = self._create_filter_search(demands=demands) if demands is not None else None
         retriever = self._build_ensemble_retriever(filter_search=filter_search)
         LOGGER.log.info("Create ensemble retriever successfull!")
+        return [ProductHit.from_record(doc.metadata) for doc in retriever.invoke(input=query)]
 
-        contents = retriever.invoke(input=query)
-        return "\n".join(doc.page_content for doc in contents)
+    async def asearch_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        filter_search = self._create_filter_search(demands=demands) if demands is not None else None
+        retriever = self._build_ensemble_retriever(filter_search=filter_search)
+        return [ProductHit.from_record(doc.metadata) for doc in await retriever.ainvoke(input=query)]
 
     def _drop_db(self, path_db: str):
         os.remove(path=path_db)
\ No newline at end of file
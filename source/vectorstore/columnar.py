@@ -0,0 +1,199 @@
+import time
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+from base import BaseRetriever, UpsertReport
+from utils import Logger, normalize_specifications
+from config import ArgsElastic
+from telemetry import TELEMETRY
+from vectorstore.bm25_index import BM25Index
+from vectorstore.elastic_search import ElasticQueryBuilder
+
+LOGGER = Logger(name=__file__, log_file="columnar_retriever.log")
+
+NUMERIC_FIELDS = ("price_vnd", "power_w", "weight_kg", "volume_l", "lifecare_price", "sold_quantity")
+TEXT_FIELDS = ("group_product_name", "group_name")
+# tham số BM25 mặc định của Elasticsearch
+ES_K1, ES_B = 1.2, 0.75
+
+
+@dataclass
+class _GroupIndex:
+    """
+    Các dòng của 1 group_product_name, mỗi trường số có 1 bản sắp xếp tăng dần
+    để lọc khoảng bằng binary search.
+    """
+    rows: np.ndarray
+    sorted_values: Dict[str, np.ndarray] = field(default_factory=dict)
+    sorted_rows: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def range_rows(self, field_name: str, gte: float, lte: float) -> np.ndarray:
+        values = self.sorted_values[field_name]
+        start = np.searchsorted(values, gte, side="left")
+        end = np.searchsorted(values, lte, side="right")
+        return self.sorted_rows[field_name][start:end]
+
+
+@dataclass
+class ColumnarQueryEngine(ElasticQueryBuilder, BaseRetriever):
+    """
+    Tìm kiếm sản phẩm trên các cột NumPy trong bộ nhớ, cùng ngữ nghĩa với ElasticQueryEngine:
+    dùng chung ElasticQueryBuilder để tạo truy vấn rồi thực thi truy vấn đó tại chỗ.
+        - match: BM25 (k1=1.2, b=0.75) trên từng field text, khớp khi có ít nhất 1 token chung
+        - range: binary search trên mảng đã sắp xếp của từng group
+        - sort: theo field số (thiếu giá trị xếp cuối) hoặc theo điểm, hòa điểm xếp theo thứ tự dòng
+
+    >>> examples:
+        engine = ColumnarQueryEngine(df=df)
+        out_text, products_info = engine.query(demands={"group": "điều hòa", "object": "điều hòa",
+                                                        "price": "10 - 15 triệu", ...})
+    """
+    df: pd.DataFrame
+    config = ArgsElastic()
+    streaming_ingest = False  # index nằm trong bộ nhớ, dựng từ cả dataframe
+
+    def __post_init__(self):
+        self.upsert(self.df)
+
+    @TELEMETRY.traced("upsert")
+    def upsert(self, df: pd.DataFrame=None) -> UpsertReport:
+        """Dựng lại toàn bộ các cột và index từ dataframe"""
+        start = time.perf_counter()
+        df = self.df if df is None else df
+        num_before = len(getattr(self, "_frame", ()))
+
+        frame = normalize_specifications(df).reset_index(drop=True)
+        self._frame = frame
+        self._columns = {name: frame[name].to_numpy(dtype=np.float64) for name in NUMERIC_FIELDS}
+        # mảng của từng cột để lấy _source theo dòng mà không tạo Series
+        self._values = {name: frame[name].to_numpy() for name in frame.columns}
+        self._text_indexes = {
+            name: BM25Index.build([Document(page_content=str(value)) for value in frame[name]],
+                                  group_key=None, k1=ES_K1, b=ES_B)
+            for name in TEXT_FIELDS
+        }
+
+        codes, _ = pd.factorize(frame["group_product_name"])
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        self._groups = [self._build_group(rows) for rows in np.split(order, boundaries) if len(rows)]
+        # mọi dòng trong 1 group có cùng group_product_name nên chỉ cần chấm điểm 1 dòng đại diện
+        self._group_repr = np.asarray([group.rows[0] for group in self._groups], dtype=np.int64)
+
+        report = UpsertReport(added=len(frame),
+                              deleted=num_before,
+                              elapsed=time.perf_counter() - start)
+        LOGGER.log.info(f"Build columnar index: {len(frame)} rows, {len(self._groups)} groups "
+                        f"in {report.elapsed:.3f}s")
+        return report
+
+    def upsert_chunk(self, df: pd.DataFrame) -> UpsertReport:
+        raise NotImplementedError(f"{type(self).__name__} rebuilds its whole index on upsert, "
+                                  f"call upsert() with the full catalog instead of streaming chunks")
+
+    def _build_group(self, rows: np.ndarray) -> _GroupIndex:
+        group = _GroupIndex(rows=rows)
+        for name in NUMERIC_FIELDS:
+            values = self._columns[name][rows]
+            order = np.argsort(values, kind="stable")  # NaN được xếp cuối nên không lọt vào khoảng nào
+            group.sorted_values[name] = values[order]
+            group.sorted_rows[name] = rows[order]
+        return group
+
+    def _candidate_groups(self, matches: List[Tuple[str, str]]) -> List[_GroupIndex]:
+        group_text = [text for name, text in matches if name == "group_product_name"]
+        if not group_text:
+            return self._groups
+
+        matched = np.ones(len(self._groups), dtype=bool)
+        for text in group_text:
+            matched &= self._text_indexes["group_product_name"].scores(text or "", rows=self._group_repr) > 0
+        return [group for group, keep in zip(self._groups, matched) if keep]
+
+    def _filter_ranges(self, group: _GroupIndex, ranges: List[Tuple[str, float, float]]) -> np.ndarray:
+        if not ranges:
+            return group.rows
+
+        # khoảng đầu tiên dùng binary search, các khoảng sau lọc trên tập đã thu hẹp
+        name, gte, lte = ranges[0]
+        rows = group.range_rows(name, gte, lte)
+        for name, gte, lte in ranges[1:]:
+            values = self._columns[name][rows]
+            rows = rows[(values >= gte) & (values <= lte)]
+        return rows
+
+    def execute(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Thực thi 1 truy vấn do ElasticQueryBuilder tạo ra.
+
+        Args:
+            - query: truy vấn dạng Elasticsearch (bool.must gồm match/range, sort, size)
+        Return:
+            - response cùng cấu trúc với 1 phần tử trong kết quả msearch của Elasticsearch
+        """
+        matches, ranges = [], []
+        for clause in query["query"]["bool"]["must"]:
+            if "match" in clause:
+                matches.extend(clause["match"].items())
+            elif "range" in clause:
+                for name, bounds in clause["range"].items():
+                    ranges.append((name, bounds.get("gte", -np.inf), bounds.get("lte", np.inf)))
+
+        candidates = [self._filter_ranges(group, ranges) for group in self._candidate_groups(matches)]
+        rows = np.sort(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.int64)
+
+        scores = np.zeros(len(rows), dtype=np.float32)
+        for name, text in matches:
+            field_scores = self._text_indexes[name].scores(text or "", rows=rows)
+            keep = field_scores > 0
+            rows, scores = rows[keep], scores[keep] + field_scores[keep]
+        scores += len(ranges)  # mỗi range trong must đóng góp điểm hằng 1.0 như Elasticsearch
+
+        if query.get("sort"):
+            (name, spec), = query["sort"][0].items()
+            values = self._columns[name][rows]
+            key = -values if spec.get("order") == "desc" else values
+            order = np.lexsort((rows, np.where(np.isnan(key), np.inf, key)))
+        else:
+            order = np.lexsort((rows, -scores))
+        order = order[:query.get("size", self.config.top_k)]
+
+        hits = [{"_id": str(self._frame.at[row, "product_info_id"]),
+                 "_score": None if query.get("sort") else float(scores[i]),
+                 "_source": self._source(row, query.get("_source"))}
+                for i, row in zip(order, rows[order])]
+        return {"hits": {"total": {"value": len(rows)}, "hits": hits}}
+
+    def _source(self, row: int, includes: Optional[List[str]]=None) -> Dict[str, Any]:
+        """Document của 1 dòng, chỉ gồm các field trong includes (_source của truy vấn) nếu có"""
+        names = self._values if includes is None else [name for name in includes if name in self._values]
+        source = {}
+        for name in names:
+            value = self._values[name][row]
+            value = value.item() if hasattr(value, "item") else value
+            source[name] = None if value is None or value != value else value
+        return source
+
+    def bulk_search_products(self, queries: List[Dict]) -> List[Dict]:
+        return [self.execute(query) for query in queries]
+
+    def query(self, demands: Dict[str, Any], query: str=None) -> Tuple[str, List[Dict]]:
+        """
+        Hàm này dùng để search thông tin sản phẩm trên các cột trong bộ nhớ.
+
+        Args:
+            - demands: dictionary chứa thông tin cần search
+            - query: câu hỏi gốc, không dùng vì truy vấn được tạo từ demands
+        Returns:
+            - trả về câu trả lời và list chứa thông tin sản phẩm
+        """
+        queries = self._build_queries(demands)
+        if len(queries) < 1:
+            return None, []
+        LOGGER.log.info(f"queries: {queries}")
+
+        results = self._search(queries)
+        return self._parse_results(results)
@@ -1,68 +1,33 @@
 import ast
+import math
+import time
+import asyncio
+import threading
 import pandas as pd
 from collections import defaultdict
-from typing import Dict, List, Tuple, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Tuple, Optional, Any, Iterator
 from dataclasses import dataclass
-from elasticsearch import Elasticsearch
-from base import BaseRetriever
-from utils import parse_specification_range, Logger
+from elasticsearch import Elasticsearch, AsyncElasticsearch, helpers
+from base import BaseRetriever, UpsertReport, ProductHit, PRODUCT_FIELDS, format_hits
+from utils import parse_specification_range, normalize_specifications, DEMAND_COLUMNS, Logger
 from config import AragProduct, ArgsElastic
+from telemetry import TELEMETRY
+from vectorstore.batching import MicroBatchDispatcher
 
 LOGGER = Logger(name=__file__, log_file="elastic_retriever.log")
-LIST_GROUP_PRODUCT = AragProduct.LIST_GROUP_NAME
+# tăng khi các field được index thay đổi (vd: thêm cột chuẩn hóa) để index cũ được dựng lại
+SCHEMA_VERSION = 2
 
 
-@dataclass
-class ElasticQueryEngine(BaseRetriever):
-    cloud_id: str
-    api_key: str
-    dataframe: pd.DataFrame
-    index_name: str="elastic_retriever"
-    timeout: int=30
+class ElasticQueryBuilder:
+    """
+    Tạo truy vấn Elasticsearch từ demands và định dạng kết quả trả về.
+    Không phụ thuộc vào client nên được dùng chung cho các engine cần cùng ngữ nghĩa truy vấn.
+    """
     config = ArgsElastic()
 
-    def __post_init__(self):
-        self.client = Elasticsearch(
-            cloud_id=self.cloud_id,
-            api_key=self.api_key,
-            timeout=self.timeout
-        )
-
-        if self._count_data() <= 0:
-            self.upsert()
-
-    def _count_data(self):
-        num_data = self.client.count(index=self.index_name)['count']
-        return num_data
-
-    def upsert(self):
-        # mapping data type pandas to els 
-        dtype_mapping = {
-            'int64': 'integer',
-            'float64': 'float',
-            'object': 'text' 
-        }
-        column_mapping = {"properties": 
-                          {col: {"type": dtype_mapping[str(dtype)]} 
-                           for col, dtype in self.dataframe.dtypes.items()}
-        }
-        try:
-            if not self.client.indices.exists(index=self.index_name):
-                self.client.indices.create(index=self.index_name, body={"mappings": column_mapping})
-                # Index documents
-                for i, row in self.dataframe.iterrows():
-                    doc = {col: row[col] for col in row.index}
-
-                    self.client.index(index=self.index_name, id=i, document=doc)
-
-                self.client.indices.refresh(index=self.index_name)
-
-                LOGGER.log.info("Upsert data to Elastic search client successfull!")
-            else:
-                pass
-        except Exception as e:
-            LOGGER.log.error(f"An error occurred while connecting to Elastic Search: {str(e)}")
-        
     def create_filter_range(self, field: str, value: str) -> Dict:
         """
         Hàm này tạo ra filter range cho câu query.
@@ -74,12 +39,12 @@ class ElasticQueryEngine(BaseRetriever):
             - trả về dictionary chứa thông tin filter range
         """
         min_value, max_value = parse_specification_range(value)
+        bounds = {"gte": min_value}
+        if max_value != math.inf:  # "trên 20 triệu" không có cận trên
+            bounds["lte"] = max_value
         range_filter = {
             "range": {
-                field: {
-                    "gte": min_value,
-                    "lte": max_value
-                }
+                field: bounds
             }
         }
         return range_filter
@@ -125,13 +90,16 @@ class ElasticQueryEngine(BaseRetriever):
                     ]
                 }
             },
-            "size": self.config.top_k
+            "size": self.config.top_k,
+            # chỉ lấy các field cần cho kết quả, không kéo cả document về
+            "_source": list(PRODUCT_FIELDS)
         }
 
-        for field, value in [('lifecare_price', price), 
-                             ('power', power), 
-                             ('weight', weight), 
-                             ('volume', volume)]:
+        # filter và sort trên các cột đã chuẩn hóa đơn vị lúc ingest (VND, W, kg, lít)
+        for field, value in [(DEMAND_COLUMNS['price'], price), 
+                             (DEMAND_COLUMNS['power'], power), 
+                             (DEMAND_COLUMNS['weight'], weight), 
+                             (DEMAND_COLUMNS['volume'], volume)]:
 
             if value:  # Nếu có thông số cần filter
                 if "BIGGEST" in value:
@@ -153,6 +121,303 @@ class ElasticQueryEngine(BaseRetriever):
             ]
         return query
 
+    def _build_queries(self, demands: Dict[str, Any]) -> List[Dict]:
+        group_product = demands.get("group", '')
+
+        queries = []
+        if group_product in AragProduct.LIST_GROUP_NAME:
+            query = self.create_elastic_query(
+                group_product, 
+                demands.get("object"), 
+                demands.get("price"), 
+                demands.get('power'), 
+                demands.get('weight'), 
+                demands.get('volume')
+            )
+            queries.append(query)
+        return queries
+
+    def _search(self, queries: List[Dict]) -> List[Dict]:
+        return self.bulk_search_products(queries)
+
+    async def _asearch(self, queries: List[Dict]) -> List[Dict]:
+        return await asyncio.to_thread(self._search, queries)
+
+    def _batch_plan(self, list_demands: List[Dict[str, Any]]) -> Tuple[List[Dict], List[int]]:
+        """Gộp truy vấn của nhiều demands, kèm số truy vấn của từng demands để tách kết quả"""
+        queries, sizes = [], []
+        for demands in list_demands:
+            demand_queries = self._build_queries(demands)
+            queries.extend(demand_queries)
+            sizes.append(len(demand_queries))
+        return queries, sizes
+
+    def _split_results(self, results: List[Dict], sizes: List[int]) -> List[Tuple[str, List[Dict]]]:
+        outputs, start = [], 0
+        for size in sizes:
+            outputs.append(self._parse_results(results[start: start + size]) if size else (None, []))
+            start += size
+        return outputs
+
+    def query_batch(self, list_demands: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict]]]:
+        """
+        Search nhiều demands (vd: câu hỏi nhắc tới nhiều sản phẩm) trong 1 lần msearch.
+
+        Args:
+            - list_demands: list các dictionary chứa thông tin cần search
+        Returns:
+            - list (câu trả lời, list thông tin sản phẩm) theo thứ tự của list_demands
+        """
+        queries, sizes = self._batch_plan(list_demands)
+        if not queries:
+            return [(None, [])] * len(list_demands)
+        LOGGER.log.info(f"queries: {queries}")
+        return self._split_results(self._search(queries), sizes)
+
+    async def aquery_batch(self, list_demands: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict]]]:
+        queries, sizes = self._batch_plan(list_demands)
+        if not queries:
+            return [(None, [])] * len(list_demands)
+        LOGGER.log.info(f"queries: {queries}")
+        return self._split_results(await self._asearch(queries), sizes)
+
+    def search_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        queries = self._build_queries(demands or {})
+        if not queries:
+            return []
+        return self._hits(self._search(queries))
+
+    async def asearch_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        queries = self._build_queries(demands or {})
+        if not queries:
+            return []
+        return self._hits(await self._asearch(queries))
+
+    @staticmethod
+    def _hits(results: List[Dict]) -> List[ProductHit]:
+        return [ProductHit.from_record(hit['_source'], score=hit.get('_score'))
+                for result in results for hit in result['hits']['hits']]
+
+    def _parse_results(self, results: List[Dict]) -> Tuple[str, List[Dict]]:
+        hits = self._hits(results)
+        products_info = [{"product_info_id": hit.product_info_id,
+                          "product_name": hit.product_name,
+                          "file_path": hit.file_path} for hit in hits]
+        return format_hits(hits), products_info
+
+    def format_output_structure(self, index: int, product_details: Dict):
+        return ProductHit.from_record(product_details).format(index)
+
+
+@dataclass
+class ElasticQueryEngine(ElasticQueryBuilder, BaseRetriever):
+    cloud_id: str
+    api_key: str
+    dataframe: pd.DataFrame
+    index_name: str="elastic_retriever"
+    timeout: int=30
+    hosts: Optional[str]=None
+    config = ArgsElastic()
+
+    def __post_init__(self):
+        self._async_client: Optional[AsyncElasticsearch] = None
+        self._dispatcher: Optional[MicroBatchDispatcher] = None
+        if self.hosts:
+            self.client = Elasticsearch(
+                hosts=self.hosts,
+                api_key=self.api_key,
+                request_timeout=self.timeout
+            )
+        else:
+            self.client = Elasticsearch(
+                cloud_id=self.cloud_id,
+                api_key=self.api_key,
+                request_timeout=self.timeout
+            )
+
+        if self._count_data() > 0 and self._schema_version() != SCHEMA_VERSION:
+            # index cũ không có price_vnd, power_w... nên range filter và sort không khớp document nào
+            LOGGER.log.info(f"Index {self.index_name} has schema {self._schema_version()}, "
+                            f"rebuilding for schema {SCHEMA_VERSION}")
+            self.client.indices.delete(index=self.index_name)
+        if self._count_data() <= 0:
+            self.upsert()
+
+        if self.config.micro_batching:
+            self._dispatcher = MicroBatchDispatcher(search_fn=self.bulk_search_products,
+                                                    window_ms=self.config.batch_window_ms,
+                                                    max_batch_size=self.config.batch_max_size,
+                                                    max_inflight=self.config.batch_max_inflight)
+
+    def _get_async_client(self) -> AsyncElasticsearch:
+        """AsyncElasticsearch được tạo ở lần gọi async đầu tiên, trong event loop đang chạy"""
+        if self._async_client is None:
+            if self.hosts:
+                self._async_client = AsyncElasticsearch(hosts=self.hosts, 
+                                                        api_key=self.api_key, 
+                                                        request_timeout=self.timeout)
+            else:
+                self._async_client = AsyncElasticsearch(cloud_id=self.cloud_id, 
+                                                        api_key=self.api_key, 
+                                                        request_timeout=self.timeout)
+        return self._async_client
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.close()
+        self.client.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def _schema_version(self) -> Optional[int]:
+        mappings = self.client.indices.get_mapping(index=self.index_name)[self.index_name]["mappings"]
+        return mappings.get("_meta", {}).get("schema_version")
+
+    def _count_data(self):
+        if not self.client.indices.exists(index=self.index_name):
+            return 0
+        num_data = self.client.count(index=self.index_name)['count']
+        return num_data
+
+    def _create_index(self, dataframe: pd.DataFrame):
+        # mapping data type pandas to els 
+        dtype_mapping = {
+            'int64': 'integer',
+            'float64': 'float',
+            'object': 'text' 
+        }
+        column_mapping = {"_meta": {"schema_version": SCHEMA_VERSION},
+                          "properties": 
+                          {col: {"type": dtype_mapping.get(str(dtype), 'text')} 
+                           for col, dtype in dataframe.dtypes.items()}
+        }
+        if not self.client.indices.exists(index=self.index_name):
+            self.client.indices.create(index=self.index_name, body={"mappings": column_mapping})
+
+    def _generate_actions(self, dataframe: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+        # NaN không serialize được sang JSON hợp lệ -> đổi thành None
+        records = dataframe.astype(object).where(dataframe.notna(), None).to_dict(orient="records")
+        for doc in records:
+            yield {"_index": self.index_name, "_id": doc['product_info_id'], "_source": doc}
+
+    def _bulk_chunk(self, actions: List[Dict[str, Any]]) -> Tuple[int, List[Dict]]:
+        """Gửi 1 chunk bằng bulk API, tự retry các document bị 429 với backoff tăng dần"""
+        success, errors = 0, []
+        for ok, item in helpers.streaming_bulk(client=self.client,
+                                               actions=actions,
+                                               chunk_size=len(actions),
+                                               max_retries=self.config.bulk_max_retries,
+                                               initial_backoff=self.config.bulk_initial_backoff,
+                                               raise_on_error=False,
+                                               raise_on_exception=False):
+            if ok:
+                success += 1
+            else:
+                errors.append(item)
+        return success, errors
+
+    def bulk_index(self, 
+                   dataframe: pd.DataFrame, 
+                   chunk_size: int=None, 
+                   thread_count: int=None,
+                   manage_refresh: bool=True) -> UpsertReport:
+        """
+        Index dataframe bằng bulk API, nhiều chunk được gửi song song.
+        Số chunk đang chờ bị giới hạn (backpressure) nên không phải giữ toàn bộ request trong bộ nhớ.
+        Refresh bị tắt trong lúc load và bật lại khi xong.
+
+        Args:
+            - dataframe: dữ liệu cần index
+            - chunk_size: số document mỗi bulk request (mặc định ArgsElastic.bulk_chunk_size)
+            - thread_count: số request gửi song song (mặc định ArgsElastic.bulk_thread_count)
+            - manage_refresh: tắt/bật refresh quanh lần index này, False khi caller tự quản lý
+        Return:
+            - UpsertReport chứa số document thành công và lỗi của từng document
+        """
+        chunk_size = chunk_size or self.config.bulk_chunk_size
+        thread_count = thread_count or self.config.bulk_thread_count
+
+        start = time.perf_counter()
+        report = UpsertReport()
+        in_flight = threading.BoundedSemaphore(thread_count * 2)
+        report_lock = threading.Lock()
+
+        def _collect(future):
+            in_flight.release()
+            try:
+                success, errors = future.result()
+            except Exception as e:
+                success, errors = 0, [{"error": str(e)}]
+            with report_lock:
+                report.added += success
+                report.failed += len(errors)
+                report.errors.extend(errors)
+
+        if manage_refresh:
+            self._pause_refresh()
+        try:
+            actions = self._generate_actions(dataframe)
+            with ThreadPoolExecutor(max_workers=thread_count) as executor:
+                while True:
+                    chunk = list(islice(actions, chunk_size))
+                    if not chunk:
+                        break
+                    in_flight.acquire()
+                    executor.submit(self._bulk_chunk, chunk).add_done_callback(_collect)
+        finally:
+            if manage_refresh:
+                self._resume_refresh()
+
+        report.elapsed = time.perf_counter() - start
+        for error in report.errors[:10]:
+            LOGGER.log.error(f"Bulk index failed: {error}")
+        return report
+
+    def _pause_refresh(self):
+        self.client.indices.put_settings(index=self.index_name, 
+                                         settings={"index": {"refresh_interval": "-1"}})
+
+    def _resume_refresh(self):
+        self.client.indices.put_settings(index=self.index_name, 
+                                         settings={"index": {"refresh_interval": self.config.refresh_interval}})
+        self.client.indices.refresh(index=self.index_name)
+
+    @TELEMETRY.traced("upsert")
+    def upsert(self, dataframe: pd.DataFrame=None) -> UpsertReport:
+        dataframe = normalize_specifications(self.dataframe if dataframe is None else dataframe)
+        try:
+            self._create_index(dataframe)
+            report = self.bulk_index(dataframe)
+            LOGGER.log.info(f"Upsert data to Elastic search client successfull! {report.added} docs in "
+                            f"{report.elapsed:.2f}s, {report.failed} failed")
+            return report
+        except Exception as e:
+            LOGGER.log.error(f"An error occurred while connecting to Elastic Search: {str(e)}")
+            return UpsertReport(failed=len(dataframe), errors=[{"error": str(e)}])
+
+    def upsert_chunk(self, dataframe: pd.DataFrame) -> UpsertReport:
+        """Index 1 chunk của catalog đang được stream, refresh chỉ được bật lại ở finish_ingest"""
+        dataframe = normalize_specifications(dataframe)
+        try:
+            if not getattr(self, "_ingesting", False):
+                self._create_index(dataframe)
+                self._pause_refresh()
+                self._ingesting = True
+            return self.bulk_index(dataframe, manage_refresh=False)
+        except Exception as e:
+            LOGGER.log.error(f"An error occurred while connecting to Elastic Search: {str(e)}")
+            return UpsertReport(failed=len(dataframe), errors=[{"error": str(e)}])
+
+    def finish_ingest(self, complete: bool=True) -> UpsertReport:
+        # bật lại refresh kể cả khi ingest không trọn vẹn
+        if getattr(self, "_ingesting", False):
+            self._ingesting = False
+            self._resume_refresh()
+        return UpsertReport()
+        
     def bulk_search_products(self, queries: List[Dict]) -> List[Dict]:
         """
         Hàm này dùng để search nhiều query trên elasticsearch.
@@ -171,51 +436,50 @@ class ElasticQueryEngine(BaseRetriever):
         return results['responses']
 
 
-    def query(self, demands: Dict[str, Any])-> Tuple[str, List[Dict], int]:
+    def _search(self, queries: List[Dict]) -> List[Dict]:
+        """Qua micro-batch dispatcher nếu bật, để gộp truy vấn của các request đồng thời"""
+        if self._dispatcher is not None:
+            return self._dispatcher.search(queries)
+        return self.bulk_search_products(queries)
+
+    async def _asearch(self, queries: List[Dict]) -> List[Dict]:
+        if self._dispatcher is not None:
+            return await self._dispatcher.asearch(queries)
+        return await self.abulk_search_products(queries)
+
+    async def abulk_search_products(self, queries: List[Dict]) -> List[Dict]:
+        """Giống bulk_search_products nhưng dùng AsyncElasticsearch"""
+        body = []
+        for query in queries:
+            body.extend([{"index": self.index_name}, query])
+        
+        results = await self._get_async_client().msearch(body=body)
+        return results['responses']
+
+    def query(self, demands: Dict[str, Any], query: str=None)-> Tuple[str, List[Dict], int]:
 
         """
         Hàm này dùng để search thông tin sản phẩm trên elasticsearch.
 
         Args:
             - demands: dictionary chứa thông tin cần search
+            - query: câu hỏi gốc, không dùng vì truy vấn được tạo từ demands
         Returns:
             - trả về câu trả lời, list chứa thông tin sản phẩm, và số lượng sản phẩm tìm thấy
         """
-        group_product = demands.get("group", '')
+        queries = self._build_queries(demands)
+        if len(queries) < 1:
+            return None, []
+        LOGGER.log.info(f"queries: {queries}")
 
-        queries = []
-        if group_product in LIST_GROUP_PRODUCT:
-            query = self.create_elastic_query(
-                group_product, 
-                demands.get("object"), 
-                demands.get("price"), 
-                demands.get('power'), 
-                demands.get('weight'), 
-                demands.get('volume')
-            )
-            queries.append(query)
-        
+        results = self._search(queries)
+        return self._parse_results(results)
+
+    async def aquery(self, demands: Dict[str, Any], query: str=None) -> Tuple[str, List[Dict]]:
+        queries = self._build_queries(demands)
         if len(queries) < 1:
             return None, []
-        print("queries: ", queries)
-
-        results = self.bulk_search_products(queries)
-
-        out_text, products_info = "", [] 
-        for result in results:
-            for i, hit in enumerate(result['hits']['hits']):
-                product_details = hit['_source']
-                out_text += self.format_output_structure(i, product_details)
-                products_info.append({
-                    "product_info_id": product_details['product_info_id'],
-                    "product_name": product_details['product_name'],
-                    "file_path": product_details['file_path']
-                })
-        return out_text, products_info
+        LOGGER.log.info(f"queries: {queries}")
 
-    def format_output_structure(self, index: int, product_details: Dict):
-        return f"""\n{index + 1}. Tên: '{product_details['product_name']}' 
-        - Mã sản phẩm: {product_details['product_info_id']} 
-        - Giá: {product_details['lifecare_price']:,.0f} đ
-        - Số lượng đã bán: {product_details['sold_quantity']}
-        - Thông số : {product_details['specifications']}\n"""
\ No newline at end of file
+        results = await self._asearch(queries)
+        return self._parse_results(results)
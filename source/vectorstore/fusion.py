@@ -0,0 +1,158 @@
+import time
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+
+from utils import Logger
+from telemetry import TELEMETRY
+
+LOGGER = Logger(name=__file__, log_file="fusion_retriever.log")
+
+FUSION_MISSES = TELEMETRY.counter("fusion_retriever_misses_total",
+                                  "Retrievers left out of a fusion because of a timeout or an error")
+
+# mỗi loại retriever có pool riêng: retriever quá hạn vẫn chạy nốt trong pool nhưng chỉ chiếm
+# thread của chính nó, các retriever khác (và các request khác) không phải xếp hàng sau
+_RETRIEVER_POOLS: Dict[str, ThreadPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def retriever_pool(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Pool dùng chung của retriever name, được tạo ở lần gọi đầu tiên với max_workers thread"""
+    pool = _RETRIEVER_POOLS.get(name)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _RETRIEVER_POOLS.get(name)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"fusion-{name}")
+                _RETRIEVER_POOLS[name] = pool
+    return pool
+
+
+def weighted_rrf(rankings: Sequence[Sequence[Hashable]],
+                 weights: Sequence[float],
+                 c: int = 60) -> Tuple[List[Hashable], np.ndarray]:
+    """
+    Weighted Reciprocal Rank Fusion: score(d) = sum_i weights[i] / (c + rank_i(d)), rank bắt đầu từ 1.
+
+    Args:
+        - rankings: danh sách key đã xếp hạng của từng retriever
+        - weights: trọng số của từng retriever
+        - c: hằng số làm mượt của RRF
+    Return:
+        - (keys, scores) xếp theo điểm giảm dần, hòa điểm giữ thứ tự xuất hiện đầu tiên
+    """
+    positions: Dict[Hashable, int] = {}
+    indices, contributions = [], []
+    for ranking, weight in zip(rankings, weights):
+        indices.append(np.fromiter((positions.setdefault(key, len(positions)) for key in ranking),
+                                   dtype=np.int64, count=len(ranking)))
+        contributions.append(weight / (c + np.arange(1, len(ranking) + 1, dtype=np.float64)))
+    if not positions:
+        return [], np.zeros(0)
+
+    scores = np.zeros(len(positions), dtype=np.float64)
+    np.add.at(scores, np.concatenate(indices), np.concatenate(contributions))
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    keys = list(positions)
+    return [keys[i] for i in order], scores[order]
+
+
+@dataclass
+class FusionRetriever:
+    """
+    Gọi các retriever song song, mỗi retriever có deadline riêng, rồi gộp bằng weighted RRF.
+    Retriever lỗi hoặc quá hạn bị bỏ qua, kết quả được gộp từ các retriever còn lại
+    nên độ trễ bằng retriever chậm nhất (tối đa là timeout) thay vì tổng các retriever.
+        - mỗi retriever (theo names) chạy trên pool riêng có max_workers thread, nên đặt max_workers
+          bằng số request đồng thời mong đợi
+        - top_k giới hạn số document sau khi gộp, None là trả về tất cả
+
+    >>> examples:
+        retriever = FusionRetriever(retrievers=[bm25_retriever, mmr_retriever], weights=[0.5, 0.5],
+                                    timeouts=[0.5, 2.0], names=["bm25", "mmr"], top_k=3)
+        docs = retriever.invoke("điều hòa 12000 btu")
+    """
+    retrievers: List[Any]
+    weights: List[float]
+    timeouts: List[Optional[float]] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    c: int = 60
+    id_key: Optional[str] = "product_info_id"
+    top_k: Optional[int] = None
+    max_workers: int = 16
+
+    def __post_init__(self):
+        if len(self.weights) != len(self.retrievers):
+            raise ValueError(f"Expected {len(self.retrievers)} weights, got {len(self.weights)}")
+        self.timeouts = list(self.timeouts) or [None] * len(self.retrievers)
+        self.names = list(self.names) or [type(retriever).__name__ for retriever in self.retrievers]
+        self._pools = [retriever_pool(name, self.max_workers) for name in self.names]
+
+    def _key(self, doc: Document) -> Hashable:
+        if self.id_key is not None and doc.metadata.get(self.id_key) is not None:
+            return doc.metadata[self.id_key]
+        return doc.page_content
+
+    def _miss(self, name: str, reason: str, error: BaseException):
+        FUSION_MISSES.inc(retriever=name, reason=reason)
+        LOGGER.log.warning(f"Retriever {name} left out of fusion ({reason}): {type(error).__name__}: {error}")
+
+    def _fuse(self, results: List[Optional[List[Document]]]) -> List[Document]:
+        docs: Dict[Hashable, Document] = {}
+        rankings, weights = [], []
+        for result, weight in zip(results, self.weights):
+            if result is None:
+                continue
+            ranking = []
+            for doc in result:
+                key = self._key(doc)
+                docs.setdefault(key, doc)
+                ranking.append(key)
+            rankings.append(ranking)
+            weights.append(weight)
+
+        keys, _ = weighted_rrf(rankings, weights, c=self.c)
+        return [docs[key] for key in keys[:self.top_k]]
+
+    def invoke(self, input: str, **kwargs) -> List[Document]:
+        start = time.monotonic()
+        futures = [pool.submit(retriever.invoke, input) for pool, retriever in zip(self._pools, self.retrievers)]
+
+        results: List[Optional[List[Document]]] = []
+        for future, timeout, name in zip(futures, self.timeouts, self.names):
+            remaining = None if timeout is None else max(start + timeout - time.monotonic(), 0.0)
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError as e:
+                future.cancel()  # đã chạy thì để chạy nốt trong pool, kết quả bị bỏ
+                self._miss(name, "timeout", e)
+                results.append(None)
+            except Exception as e:
+                self._miss(name, "error", e)
+                results.append(None)
+        return self._fuse(results)
+
+    async def ainvoke(self, input: str, **kwargs) -> List[Document]:
+        loop = asyncio.get_running_loop()
+
+        async def _run(retriever: Any, pool: ThreadPoolExecutor, timeout: Optional[float],
+                       name: str) -> Optional[List[Document]]:
+            # bm25 và chroma đều là retriever đồng bộ: chạy trên pool để quá hạn thì trả về ngay,
+            # không phải chờ thread như ainvoke mặc định của langchain
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(pool, retriever.invoke, input),
+                                              timeout=timeout)
+            except asyncio.TimeoutError as e:
+                self._miss(name, "timeout", e)
+            except Exception as e:
+                self._miss(name, "error", e)
+            return None
+
+        results = await asyncio.gather(*(_run(retriever, pool, timeout, name) for retriever, pool, timeout, name
+                                         in zip(self.retrievers, self._pools, self.timeouts, self.names)))
+        return self._fuse(list(results))
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import shutil
+from hashlib import md5
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+from base import BaseRetriever, UpsertReport, ProductHit, PRODUCT_FIELDS, format_hits
+from utils import Logger, normalize_specifications, parse_specification_range, DEMAND_COLUMNS
+from config import ArgMemmap
+from telemetry import TELEMETRY
+
+LOGGER = Logger(name=__file__, log_file="memmap_retriever.log")
+
+FORMAT_VERSION = 1
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _kmeans(vectors: np.ndarray, num_lists: int, iterations: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means trên vector đã chuẩn hóa (spherical), trả về (centroids, list của từng vector)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=num_lists, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(num_lists):
+            members = vectors[assignments == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+@dataclass
+class _Partition:
+    """1 group_product_name: đoạn [start, end) liên tục trong ma trận, có thể chia tiếp thành các list IVF"""
+    start: int
+    end: int
+    centroids: Optional[np.ndarray] = None
+    list_offsets: Optional[np.ndarray] = None
+
+
+@dataclass
+class MemmapVectorEngine(BaseRetriever):
+    """
+    Dense search cục bộ không cần server: embedding của sản phẩm được lượng tử hóa float16 hoặc int8
+    (kèm scale theo dòng) và lưu thành file .npy, mở lại bằng np.load(mmap_mode="r").
+        - các worker cùng máy dùng chung page cache của file, khởi động lạnh không copy index vào RAM
+        - các dòng được xếp theo group_product_name nên filter group chỉ là cắt 1 đoạn của memmap
+        - tìm kiếm chính xác bằng tích ma trận theo block, group lớn hơn ivf_min_rows được chia IVF
+          (k-means) và chỉ quét ivf_nprobe list gần nhất
+        - khoảng giá / công suất / ... lọc trên các cột đã chuẩn hóa như các engine khác
+
+    >>> examples:
+        engine = MemmapVectorEngine(embedder=REGISTRY.get_embedder("openai"), df=CATALOG.dataframe)
+        engine.search_records(query="điều hòa 12000 btu", demands={"group": "điều hòa", ...})
+    """
+    embedder: Embeddings
+    df: pd.DataFrame
+    index_name: str = "products"
+    config = ArgMemmap()
+    streaming_ingest = False  # dựng lại index từ cả dataframe mỗi lần upsert
+
+    def __post_init__(self):
+        self.upsert(self.df)
+
+    # ------------------------------------------------------------------ build / load
+
+    def _fingerprint(self, df: pd.DataFrame) -> str:
+        model_name = getattr(self.embedder, "model_name", None) or getattr(self.embedder, "model", None) \
+            or type(self.embedder).__name__
+        hashed = pd.util.hash_pandas_object(df[["product_info_id", "group_product_name", "group_name"]],
+                                            index=False).to_numpy()
+        hasher = md5(f"{FORMAT_VERSION}-{model_name}-{self.config.dtype}-{self.config.ivf_min_rows}".encode())
+        hasher.update(hashed.tobytes())
+        return hasher.hexdigest()
+
+    @property
+    def _root(self) -> str:
+        return os.path.join(self.config.index_dir, self.index_name)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        batch_size = self.config.embed_batch_size
+        batches = [np.asarray(self.embedder.embed_documents(texts[i: i + batch_size]), dtype=np.float32)
+                   for i in range(0, len(texts), batch_size)]
+        return _normalize_rows(np.concatenate(batches)) if batches else np.zeros((0, 0), dtype=np.float32)
+
+    def _build(self, df: pd.DataFrame, path: str):
+        """Embed, sắp xếp theo group (và list IVF), lượng tử hóa rồi ghi vào thư mục tạm, rename khi xong"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        vectors = self._embed(df["group_name"].astype(str).tolist())
+        codes, groups = pd.factorize(df["group_product_name"])
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.concatenate([[0], np.flatnonzero(np.diff(codes[order])) + 1, [len(order)]])
+
+        partitions = {}
+        for i, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+            group = str(groups[codes[order[start]]])
+            rows = order[start:end]
+            partition = {"start": int(start), "end": int(end)}
+            if self.config.ivf_min_rows and len(rows) >= self.config.ivf_min_rows:
+                num_lists = int(np.clip(np.sqrt(len(rows)), 2, 4096))
+                centroids, assignments = _kmeans(vectors[rows], num_lists, self.config.ivf_iterations)
+                list_order = np.argsort(assignments, kind="stable")
+                order[start:end] = rows[list_order]
+                counts = np.bincount(assignments, minlength=num_lists)
+                np.save(os.path.join(tmp_path, f"centroids_{i}.npy"), centroids.astype(np.float32))
+                partition.update(centroids=f"centroids_{i}.npy",
+                                 list_offsets=(start + np.concatenate([[0], np.cumsum(counts)])).tolist())
+            partitions[group] = partition
+
+        ordered = vectors[order]
+        if self.config.dtype == "int8":
+            scales = np.abs(ordered).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            np.save(os.path.join(tmp_path, "scales.npy"), scales.astype(np.float32))
+            ordered = np.round(ordered / scales[:, None]).astype(np.int8)
+        else:
+            ordered = ordered.astype(np.float16)
+        np.save(os.path.join(tmp_path, "vectors.npy"), ordered)
+        np.save(os.path.join(tmp_path, "rows.npy"), order.astype(np.int64))
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "dtype": self.config.dtype, "rows": len(df),
+                       "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+                       "partitions": partitions}, f, ensure_ascii=False)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # worker khác đã dựng xong cùng index
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _load(self, path: str, df: pd.DataFrame):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(path, "scales.npy")
+        self._scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        self._rows = np.load(os.path.join(path, "rows.npy"))
+
+        self._partitions = {}
+        for group, partition in meta["partitions"].items():
+            centroids = np.load(os.path.join(path, partition["centroids"])) if "centroids" in partition else None
+            offsets = np.asarray(partition["list_offsets"]) if "list_offsets" in partition else None
+            self._partitions[group] = _Partition(start=partition["start"], end=partition["end"],
+                                                 centroids=centroids, list_offsets=offsets)
+
+        # record và các cột số theo thứ tự dòng của index
+        self._frame = df.iloc[self._rows].reset_index(drop=True)
+        self._numeric = {column: self._frame[column].to_numpy(dtype=np.float64) for column in DEMAND_COLUMNS.values()}
+
+    def _prune(self, keep: str):
+        for name in os.listdir(self._root):
+            if name != keep and not name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(self._root, name), ignore_errors=True)
+
+    @TELEMETRY.traced("upsert")
+    def upsert(self, df: pd.DataFrame=None) -> UpsertReport:
+        """Dựng lại index khi dataframe hoặc embedder thay đổi, ngược lại chỉ mmap index đã có"""
+        start = time.perf_counter()
+        df = normalize_specifications(self.df if df is None else df).reset_index(drop=True)
+        fingerprint = self._fingerprint(df)
+        path = os.path.join(self._root, fingerprint)
+        os.makedirs(self._root, exist_ok=True)
+
+        built = not os.path.exists(os.path.join(path, "meta.json"))
+        if built:
+            self._build(df, path)
+            self._prune(keep=fingerprint)
+        self._load(path, df)
+        self.df = df
+
+        report = UpsertReport(added=len(df) if built else 0,
+                              unchanged=0 if built else len(df),
+                              elapsed=time.perf_counter() - start)
+        LOGGER.log.info(f"{'Build' if built else 'Load'} memmap index {path}: {len(df)} rows, "
+                        f"{self.config.dtype}, {report.elapsed:.3f}s")
+        return report
+
+    def upsert_chunk(self, df: pd.DataFrame) -> UpsertReport:
+        raise NotImplementedError(f"{type(self).__name__} rebuilds its whole index on upsert, "
+                                  f"call upsert() with the full catalog instead of streaming chunks")
+
+    # ------------------------------------------------------------------ search
+
+    def _score_slice(self, start: int, end: int, queries: np.ndarray) -> np.ndarray:
+        """Điểm cosine của các dòng [start, end) với ma trận câu hỏi (d, m), tính theo block"""
+        scores = np.empty((end - start, queries.shape[1]), dtype=np.float32)
+        block_rows = self.config.block_rows
+        for offset in range(start, end, block_rows):
+            stop = min(offset + block_rows, end)
+            block = np.asarray(self._vectors[offset:stop], dtype=np.float32) @ queries
+            if self._scales is not None:
+                block *= self._scales[offset:stop, None]
+            scores[offset - start: stop - start] = block
+        return scores
+
+    def _candidate_slices(self, partition: _Partition, query: np.ndarray) -> List[Tuple[int, int]]:
+        if partition.centroids is None:
+            return [(partition.start, partition.end)]
+        nprobe = min(self.config.ivf_nprobe, len(partition.centroids))
+        lists = np.argpartition(-(partition.centroids @ query), nprobe - 1)[:nprobe]
+        return [(int(partition.list_offsets[i]), int(partition.list_offsets[i + 1])) for i in np.sort(lists)]
+
+    def _range_mask(self, rows: np.ndarray, demands: Dict[str, Any]) -> Optional[np.ndarray]:
+        mask = None
+        for dimension, column in DEMAND_COLUMNS.items():
+            value = demands.get(dimension)
+            if value:
+                min_value, max_value = parse_specification_range(value)
+                values = self._numeric[column][rows]
+                keep = (values >= min_value) & (values <= max_value)
+                mask = keep if mask is None else mask & keep
+        return mask
+
+    def _search_group(self, demands: Dict[str, Any], queries: np.ndarray) -> List[List[Tuple[int, float]]]:
+        """Top k (dòng, điểm) cho mỗi câu hỏi (cột của queries) có cùng demands"""
+        partition = self._partitions.get(demands.get("group")) if demands else None
+        if demands and demands.get("group") and partition is None:
+            return [[] for _ in range(queries.shape[1])]
+        if partition is None:
+            partition = _Partition(start=0, end=len(self._frame))
+
+        # IVF chọn list theo từng câu hỏi, không có IVF thì cả batch dùng chung 1 tích ma trận
+        query_groups = ([[i] for i in range(queries.shape[1])] if partition.centroids is not None
+                        else [list(range(queries.shape[1]))])
+        outputs: Dict[int, List[Tuple[int, float]]] = {}
+        for columns in query_groups:
+            slices = self._candidate_slices(partition, queries[:, columns[0]])
+            rows = np.concatenate([np.arange(start, end) for start, end in slices])
+            scores = np.concatenate([self._score_slice(start, end, queries[:, columns]) for start, end in slices])
+            mask = self._range_mask(rows, demands or {})
+            if mask is not None:
+                rows, scores = rows[mask], scores[mask]
+
+            k = min(self.config.top_k, len(rows))
+            for j, column in enumerate(columns):
+                if k == 0:
+                    outputs[column] = []
+                    continue
+                top = np.argpartition(-scores[:, j], k - 1)[:k]
+                top = top[np.argsort(-scores[top, j], kind="stable")]
+                outputs[column] = [(int(rows[i]), float(scores[i, j])) for i in top]
+        return [outputs[column] for column in range(queries.shape[1])]
+
+    def _hit(self, row: int, score: float) -> ProductHit:
+        record = {name: self._frame.at[row, name] for name in PRODUCT_FIELDS if name in self._frame.columns}
+        return ProductHit.from_record(record, score=score)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        vectors = np.asarray([self.embedder.embed_query(query) for query in queries], dtype=np.float32)
+        return _normalize_rows(vectors).T
+
+    def search_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        return self.search_records_batch([query or ""], [demands])[0]
+
+    def search_records_batch(self, queries: List[str], list_demands: List[Optional[Dict[str, Any]]]) -> List[List[ProductHit]]:
+        """
+        Nhiều câu hỏi cùng lúc: các câu hỏi cùng demands dùng chung 1 lần quét ma trận.
+        Args:
+            - queries: các câu hỏi
+            - list_demands: demands tương ứng của từng câu hỏi
+        Return:
+            - danh sách ProductHit của từng câu hỏi
+        """
+        vectors = self._embed_queries(queries)
+        grouped: Dict[str, List[int]] = {}
+        for i, demands in enumerate(list_demands):
+            grouped.setdefault(json.dumps(demands or {}, sort_keys=True, ensure_ascii=False), []).append(i)
+
+        results: List[List[ProductHit]] = [[] for _ in queries]
+        for positions in grouped.values():
+            found = self._search_group(list_demands[positions[0]], vectors[:, positions])
+            for position, hits in zip(positions, found):
+                results[position] = [self._hit(row, score) for row, score in hits]
+        return results
+
+    def query(self, query: str, demands: Dict[str, Any]=None) -> str:
+        return format_hits(self.search_records(query=query, demands=demands))
@@ -1,48 +1,92 @@
 # https://qdrant.tech/articles/vector-search-filtering/
 
+import math
 import uuid
-import json
+import asyncio
+import time
+import threading
 import pandas as pd
-from datasets import Dataset
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
 from tqdm import tqdm
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from fastembed import SparseTextEmbedding, TextEmbedding
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client import models
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 load_dotenv()
 
-from base import BaseRetriever
-from utils import Logger
+from base import BaseRetriever, UpsertReport, ProductHit, format_hits
+from utils import (Logger, compute_mdhash_id, normalize_specifications, parse_specification_range, 
+                   DEMAND_COLUMNS, EmbeddingCache, EMBEDDING_CACHE)
 from config import ArgQdrant
+from telemetry import TELEMETRY
 
 LOGGER = Logger(name=__file__, log_file="qdrant_retriever.log")
 
+# payload được index để filter trong lúc duyệt HNSW / sparse thay vì lọc sau
+KEYWORD_INDEXES = ("group_product_name",)
+FLOAT_INDEXES = tuple(DEMAND_COLUMNS.values())
+# tăng khi payload thay đổi (vd: thêm cột chuẩn hóa) để collection cũ được upsert lại
+SCHEMA_VERSION = 2
+# payload trả về cùng kết quả, bỏ content_hash và các cột gốc chưa chuẩn hóa
+PAYLOAD_FIELDS = ["product_info_id", "product_name", "group_product_name", "price_vnd", "price", "sold_quantity",
+                  "specifications", "file_path", "power_w", "weight_kg", "volume_l"]
+
 @dataclass
 class QdrantQueryEngine(BaseRetriever):
     url: str
     api_key: str
     df: pd.DataFrame
     timeout: int=30
-    batch_size: int=4
     index_name: str="qdrant_retriever"
+    dense_model: Optional[TextEmbedding]=None
+    sparse_model: Optional[SparseTextEmbedding]=None
+    embedding_cache: EmbeddingCache=field(default_factory=lambda: EMBEDDING_CACHE)
     config = ArgQdrant()
 
     def __post_init__ (self):
-        self.client = QdrantClient(
-            url=self.url,
-            api_key=self.api_key,
-            timeout=self.timeout
-        )
-        self.jina_model = TextEmbedding(model_name="jinaai/jina-embeddings-v2-base-en")
-        self.bm25_model = SparseTextEmbedding(model_name="Qdrant/bm25")
+        self._async_client: Optional[AsyncQdrantClient] = None
+        if self.url == ":memory:":
+            self.client = QdrantClient(location=":memory:")
+        else:
+            self.client = QdrantClient(
+                url=self.url,
+                api_key=self.api_key,
+                timeout=self.timeout
+            )
+        self.jina_model = self.dense_model or TextEmbedding(model_name="jinaai/jina-embeddings-v2-base-en")
+        self.bm25_model = self.sparse_model or SparseTextEmbedding(model_name="Qdrant/bm25")
 
         self.create_collection()
-        self.upsert()
+        # collection dựng trước khi có price_vnd, power_w... thì range filter không khớp điểm nào
+        if self._count_data(schema_version=SCHEMA_VERSION) < len(self.df):
+            self.upsert()
+
+    def _get_async_client(self) -> Optional[AsyncQdrantClient]:
+        """
+        AsyncQdrantClient tạo ở lần gọi async đầu tiên.
+        Chế độ ":memory:" không chia sẻ dữ liệu giữa 2 client nên không có async client.
+        """
+        if self._async_client is None and self.url != ":memory:":
+            self._async_client = AsyncQdrantClient(url=self.url, 
+                                                   api_key=self.api_key, 
+                                                   timeout=self.timeout)
+        return self._async_client
 
-    def _count_data(self):
-        return self.client.count(collection_name=self.index_name).count
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def _count_data(self, schema_version: Optional[int] = None):
+        count_filter = None if schema_version is None else models.Filter(must=[
+            models.FieldCondition(key="schema_version", match=models.MatchValue(value=schema_version))])
+        return self.client.count(collection_name=self.index_name, count_filter=count_filter, exact=True).count
     
     def _delete_colection(self):
         self.client.delete_collection(collection_name=self.index_name)
@@ -79,108 +123,238 @@ class QdrantQueryEngine(BaseRetriever):
             LOGGER.log.info(f"Create index name: {self.index_name} successfull!")
         else:
             LOGGER.log.info(f"Collection name: {self.index_name} exists")
+        self._create_payload_indexes()
 
+    def _create_payload_indexes(self):
+        """Tạo index keyword/float còn thiếu, collection tạo từ trước cũng được bổ sung"""
+        existing = self.client.get_collection(collection_name=self.index_name).payload_schema or {}
+        schemas = [(name, models.PayloadSchemaType.KEYWORD) for name in KEYWORD_INDEXES]
+        schemas += [(name, models.PayloadSchemaType.FLOAT) for name in FLOAT_INDEXES]
+        for name, schema in schemas:
+            if name not in existing:
+                self.client.create_payload_index(collection_name=self.index_name,
+                                                 field_name=name,
+                                                 field_schema=schema,
+                                                 wait=True)
+                LOGGER.log.info(f"Create payload index {name} ({schema.value}) on {self.index_name}")
 
-    def upsert(self, batch_size: int=4):
-        num_data = self._count_data()
-        if num_data > 0:
-            LOGGER.log.info("The data has been uploaded to Qdrant!")
-            return
-        
-        dataset = Dataset.from_pandas(self.df, preserve_index=False)
-        for batch in tqdm(dataset.iter(batch_size=batch_size), total=len(dataset) // batch_size):
 
-            dense_embedding = list(self.jina_model.embed(documents=batch['group_name']))
-            bm25_embedding = list(self.bm25_model.embed(documents=batch['group_name']))
+    @staticmethod
+    def _point_id(product_info_id: Any) -> str:
+        """Id cố định theo sản phẩm để chạy lại upsert sẽ ghi đè thay vì nhân bản"""
+        return str(uuid.UUID(compute_mdhash_id(str(product_info_id))))
 
-            self.client.upload_points(
-                collection_name=self.index_name,
-                points=[
-                    models.PointStruct(
-                        id=uuid.uuid4().hex,
-                        
-                        payload={
-                            'product_info_id': batch['product_info_id'][i],
-                            'group_product_name': batch['group_product_name'][i],
-                            'product_name': batch['product_name'][i],
-                            'price': batch['lifecare_price'][i],
-                            'short_description': batch['short_description'][i],
-                            'specifications': batch['specifications'][i],
-                            'file_path': batch['file_path'][i],
-                            'power': batch['power'][i],
-                            'weight': batch['weight'][i],
-                            'volume': batch['volume'][i]
-                        },
-                        vector={
-                            "jina-embeddings-v2": dense_embedding[i].tolist(),
-                            "bm25": bm25_embedding[i].as_object(),
-                        },
-                    ) for i, _ in enumerate(batch["group_name"])
-                ],
-                batch_size=batch_size
-            )
-        LOGGER.log.info(f"Uploading data to Qdrant client successfull !!")
+    @staticmethod
+    def _content_hash(record: Dict[str, Any]) -> str:
+        return compute_mdhash_id(f"{SCHEMA_VERSION}-{sorted(record.items())}")
 
+    def _build_payload(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'product_info_id': record['product_info_id'],
+            'group_product_name': record['group_product_name'],
+            'product_name': record['product_name'],
+            'price': record['lifecare_price'],
+            'short_description': record['short_description'],
+            'specifications': record['specifications'],
+            'file_path': record['file_path'],
+            'power': record['power'],
+            'weight': record['weight'],
+            'volume': record['volume'],
+            'price_vnd': record.get('price_vnd'),
+            'power_w': record.get('power_w'),
+            'weight_kg': record.get('weight_kg'),
+            'volume_l': record.get('volume_l'),
+            'sold_quantity': record.get('sold_quantity'),
+            'content_hash': self._content_hash(record),
+            'schema_version': SCHEMA_VERSION,
+        }
 
-    def _create_filter_search(self, demands: Dict[str, Any]):
-        group_product = demands.get("group")
-        filter = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="group_product_name", 
-                    match=models.MatchValue(value=group_product)
-                ),
-                # models.FieldCondition(
-                #     key="price",
-                #     range=models.Range(
-                #         gte=3000000,
-                #         lte=5000000
-                #     )
-                # )
-            ],
-        )
-        return filter
+    def _iter_batches(self, df: pd.DataFrame, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        for start in range(0, len(df), batch_size):
+            chunk = df.iloc[start: start + batch_size]
+            yield chunk.astype(object).where(chunk.notna(), None).to_dict(orient="records")
 
+    def _filter_unchanged(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Bỏ qua các điểm đã có trong collection với cùng content_hash (resume sau khi restart).
+        Trả về các record cần ghi và số record trong đó đã tồn tại (cập nhật).
+        """
+        stored = self.client.retrieve(collection_name=self.index_name,
+                                      ids=[self._point_id(record['product_info_id']) for record in records],
+                                      with_payload=['content_hash'],
+                                      with_vectors=False)
+        stored_hashes = {str(point.id): point.payload.get('content_hash') for point in stored}
+        pending = [record for record in records 
+                   if stored_hashes.get(self._point_id(record['product_info_id'])) != self._content_hash(record)]
+        num_updated = sum(self._point_id(record['product_info_id']) in stored_hashes for record in pending)
+        return pending, num_updated
 
-    def query(self, 
-               query: str, 
-               demands: dict[str, any] = None):
-        
-        sparse_embedding = list(self.bm25_model.embed(documents=query))[0]
-        dense_embedding = list(self.jina_model.embed(documents=query))[0]
+    @TELEMETRY.traced("embed")
+    def _embed_batch(self, 
+                     records: List[Dict[str, Any]], 
+                     executor: ThreadPoolExecutor) -> List[models.PointStruct]:
+        """Embed dense (jina) và sparse (bm25) song song trên 2 worker"""
+        texts = [record['group_name'] for record in records]
+        dense_future = executor.submit(lambda: list(self.jina_model.embed(documents=texts, 
+                                                                          batch_size=len(texts))))
+        sparse_future = executor.submit(lambda: list(self.bm25_model.embed(documents=texts, 
+                                                                           batch_size=len(texts))))
+        dense_embedding, bm25_embedding = dense_future.result(), sparse_future.result()
+
+        return [
+            models.PointStruct(
+                id=self._point_id(record['product_info_id']),
+                payload=self._build_payload(record),
+                vector={
+                    "jina-embeddings-v2": dense_embedding[i].tolist(),
+                    "bm25": bm25_embedding[i].as_object(),
+                },
+            ) for i, record in enumerate(records)
+        ]
+
+    @TELEMETRY.traced("upsert")
+    def upsert(self, df: pd.DataFrame=None, batch_size: int=None) -> UpsertReport:
+        """
+        Pipeline ingest: embed batch tiếp theo trong khi batch trước đang được upload.
+        Upload chạy trên 1 thread riêng, nhận dữ liệu qua queue có giới hạn nên
+        embedding không thể chạy quá xa so với upload (backpressure).
+        """
+        df = normalize_specifications(self.df if df is None else df)
+        batch_size = batch_size or self.config.upsert_batch_size
+        report = UpsertReport()
+        start = time.perf_counter()
+        upload_queue: Queue = Queue(maxsize=self.config.upload_queue_size)
+
+        def _upload_worker():
+            while True:
+                points = upload_queue.get()
+                if points is None:
+                    return
+                try:
+                    self.client.upsert(collection_name=self.index_name, points=points, wait=True)
+                    report.added += len(points)
+                except Exception as e:
+                    report.failed += len(points)
+                    report.errors.append({"ids": [point.id for point in points], "error": str(e)})
+                    LOGGER.log.error(f"An error occurred while uploading to Qdrant: {str(e)}")
+
+        uploader = threading.Thread(target=_upload_worker, daemon=True)
+        uploader.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.config.embed_workers) as executor:
+                for records in tqdm(self._iter_batches(df, batch_size), 
+                                    total=-(-len(df) // batch_size)):
+                    pending, num_updated = self._filter_unchanged(records)
+                    report.unchanged += len(records) - len(pending)
+                    report.updated += num_updated
+                    if pending:
+                        upload_queue.put(self._embed_batch(pending, executor))
+        finally:
+            upload_queue.put(None)
+            uploader.join()
+
+        report.added = max(report.added - report.updated, 0)
+        report.elapsed = time.perf_counter() - start
+        LOGGER.log.info(f"Uploading data to Qdrant client successfull !! {report.added} points in "
+                        f"{report.elapsed:.2f}s, {report.unchanged} unchanged, {report.failed} failed")
+        return report
+
+
+    @TELEMETRY.traced("embed")
+    def _embed_dense_query(self, query: str) -> List[float]:
+        model_name = getattr(self.jina_model, "model_name", type(self.jina_model).__name__)
+        return self.embedding_cache.get_dense(
+            model_name=model_name, 
+            text=query,
+            compute=lambda text: list(self.jina_model.embed(documents=[text]))[0]).tolist()
+
+    @TELEMETRY.traced("embed")
+    def _embed_sparse_query(self, query: str) -> models.SparseVector:
+        def _compute(text: str):
+            embedding = list(self.bm25_model.embed(documents=[text]))[0]
+            return embedding.indices, embedding.values
+
+        model_name = getattr(self.bm25_model, "model_name", type(self.bm25_model).__name__)
+        indices, values = self.embedding_cache.get_sparse(model_name=model_name, text=query, compute=_compute)
+        return models.SparseVector(indices=indices.tolist(), values=values.tolist())
+
+    def _create_filter_search(self, demands: Dict[str, Any]) -> Optional[models.Filter]:
+        """
+        Group sản phẩm và khoảng của từng thông số trong demands (giá, công suất, trọng lượng, dung tích),
+        cùng ngữ nghĩa với create_filter_range của ElasticQueryEngine, trên các cột đã chuẩn hóa đơn vị.
+        """
+        if not demands:
+            return None
+
+        must = [
+            models.FieldCondition(
+                key="group_product_name", 
+                match=models.MatchValue(value=demands.get("group"))
+            ),
+        ]
+        if self.config.range_pushdown:
+            for dimension, field_name in DEMAND_COLUMNS.items():
+                value = demands.get(dimension)
+                if value:
+                    min_value, max_value = parse_specification_range(value)
+                    must.append(models.FieldCondition(key=field_name,
+                                                      range=models.Range(gte=min_value, 
+                                                                         lte=None if max_value == math.inf else max_value)))
+        return models.Filter(must=must)
+
+
+    def _build_query_request(self, query: str, demands: dict[str, any] = None) -> Dict[str, Any]:
+        sparse_embedding = self._embed_sparse_query(query)
+        dense_embedding = self._embed_dense_query(query)
 
         filter_search = self._create_filter_search(demands=demands)
 
-        search_result = self.client.query_points(
+        # filter trong từng prefetch để top_k ứng viên của mỗi nhánh đều thỏa điều kiện,
+        # không bị lấp bởi sản phẩm ngoài khoảng rồi mới loại sau khi fusion
+        prefetch_filter = filter_search if self.config.range_pushdown else None
+        return dict(
             collection_name=self.index_name,
             prefetch=[
-                models.Prefetch(query=sparse_embedding.as_object(), 
+                models.Prefetch(query=sparse_embedding, 
                                 using="bm25", 
+                                filter=prefetch_filter,
                                 limit=self.config.top_k),
 
-                models.Prefetch(query=dense_embedding.tolist(), 
+                models.Prefetch(query=dense_embedding, 
                                 using="jina-embeddings-v2", 
+                                filter=prefetch_filter,
                                 limit=self.config.top_k),
             ],
             query=models.FusionQuery(fusion=models.Fusion.RRF), # <--- Combine the scores of the two embeddings
             query_filter=filter_search,
             score_threshold=self.config.score_threshold,
-            with_payload=self.config.is_with_payload,
+            with_payload=PAYLOAD_FIELDS if self.config.is_with_payload else False,
             with_vectors=self.config.is_with_vector,
             limit=self.config.top_k,
-        ).points
+        )
+
+    def query(self, 
+               query: str, 
+               demands: dict[str, any] = None):
+        
+        return format_hits(self.search_records(query=query, demands=demands))
+
+    async def aquery(self, 
+                     query: str, 
+                     demands: dict[str, any] = None):
+        return format_hits(await self.asearch_records(query=query, demands=demands))
 
-        response_structured = self.format_output_structure(output_qdrant=search_result)
-        return response_structured
+    def search_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        points = self.client.query_points(**self._build_query_request(query, demands)).points
+        return [ProductHit.from_record(point.payload or {}, score=point.score) for point in points]
 
+    async def asearch_records(self, query: str=None, demands: Dict[str, Any]=None) -> List[ProductHit]:
+        if self._get_async_client() is None:
+            return await super().asearch_records(query=query, demands=demands)
+        # embedding chạy trên CPU -> đẩy sang thread để không chặn event loop
+        request = await asyncio.to_thread(self._build_query_request, query, demands)
+        points = (await self._get_async_client().query_points(**request)).points
+        return [ProductHit.from_record(point.payload or {}, score=point.score) for point in points]
 
     def format_output_structure(self, output_qdrant: list) -> str:
-        outtext = ""
-        for index, point in enumerate(output_qdrant):
-            point = json.loads(json.dumps(point.dict(), indent=4))
-            payload = point['payload']
-            outtext +=  f"""
-                {index+1}. "id": {payload['product_info_id']},
-                "product_name": {payload['product_name']},
-                "price": {payload['price']} \n"""
-        return outtext
\ No newline at end of file
+        return format_hits([ProductHit.from_record(point.payload or {}, score=point.score) for point in output_qdrant])
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# các module trong source/ import nhau theo đường dẫn tuyệt đối (PYTHONPATH=source)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
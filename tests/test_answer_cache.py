@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+
+from answer_cache import SemanticAnswerCache
+from catalog import ProductCatalog
+
+DEMANDS = {"group": "máy giặt", "object": "máy giặt", "price": "", "power": "",
+           "weight": "", "volume": "", "intent": "mua"}
+
+
+def _write_catalog(path: str, price: int):
+    pd.DataFrame({"product_info_id": [1], "group_product_name": ["máy giặt"], "product_name": ["Máy giặt A"],
+                  "lifecare_price": [price], "power": [0], "weight": [0], "volume": [0],
+                  "specifications": ["trọng lượng: 9 kg"]}).to_excel(path, index=False)
+
+
+def test_catalog_change_invalidates_cached_answer(tmp_path):
+    source = str(tmp_path / "catalog.xlsx")
+    _write_catalog(source, price=5_000_000)
+    catalog = ProductCatalog(source_path=source, snapshot_path=str(tmp_path / "catalog.parquet"))
+    cache = SemanticAnswerCache()
+
+    cache.store(question="máy giặt giá bao nhiêu", demands=DEMANDS, answer="5 triệu",
+                fingerprint=catalog.fingerprint)
+    assert cache.lookup(question="máy giặt giá bao nhiêu", demands=DEMANDS,
+                        fingerprint=catalog.fingerprint) == "5 triệu"
+
+    _write_catalog(source, price=6_500_000)
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.lookup(question="máy giặt giá bao nhiêu", demands=DEMANDS,
+                        fingerprint=catalog.fingerprint) is None
+    assert catalog.dataframe["lifecare_price"].iloc[0] == 6_500_000
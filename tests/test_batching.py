@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from vectorstore.batching import MicroBatchDispatcher
+
+
+def echo(queries):
+    return [{"query": query} for query in queries]
+
+
+def test_submit_after_close_raises():
+    dispatcher = MicroBatchDispatcher(search_fn=echo)
+    assert dispatcher.search([1, 2]) == [{"query": 1}, {"query": 2}]
+    dispatcher.close()
+
+    with pytest.raises(RuntimeError):
+        dispatcher.submit(3)
+    with pytest.raises(RuntimeError):
+        dispatcher.search([4])
+
+
+def test_queries_submitted_before_close_are_answered():
+    for _ in range(50):
+        dispatcher = MicroBatchDispatcher(search_fn=echo, window_ms=1)
+        futures, start = [], threading.Event()
+
+        def submit_all():
+            start.wait()
+            for i in range(20):
+                try:
+                    futures.append(dispatcher.submit(i))
+                except RuntimeError:
+                    return
+
+        threads = [threading.Thread(target=submit_all) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        dispatcher.close()
+        for thread in threads:
+            thread.join()
+        # không future nào bị kẹt sau _STOP
+        assert all(future.result(timeout=5)["query"] is not None for future in futures)
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import clients
+from clients import ClientManager
+
+
+@pytest.fixture
+def warnings(monkeypatch):
+    messages = []
+    monkeypatch.setattr(clients.LOGGER.log, "warning", messages.append)
+    return messages
+
+
+def test_chat_model_is_cached(monkeypatch):
+    pytest.importorskip("langchain_openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    manager = ClientManager(provider=None)
+
+    model = manager.chat_model(llm_type="openai")
+    assert manager.chat_model(llm_type="openai") is model
+    assert manager.chat_model(llm_type="openai", model_name="other-model") is not model
+    manager.close()
+
+
+def test_fake_chat_model_is_cached():
+    manager = ClientManager(provider="fake")
+    assert manager.chat_model(llm_type="openai") is manager.chat_model(llm_type="groq")
+
+
+def test_close_warns_when_async_client_is_open(warnings):
+    manager = ClientManager(provider=None)
+    http, async_http = manager.http_client, manager.async_http_client
+
+    manager.close()
+    assert http.is_closed
+    assert len(warnings) == 1 and "aclose()" in warnings[0]
+    asyncio.run(async_http.aclose())
+
+
+def test_aclose_closes_both_clients(warnings):
+    manager = ClientManager(provider=None)
+    http = manager.http_client
+
+    async def main():
+        async_http = manager.async_http_client
+        await manager.aclose()
+        return async_http
+
+    assert asyncio.run(main()).is_closed
+    assert http.is_closed
+    assert warnings == []
@@ -0,0 +1,29 @@
+from benchmarks.parity_columnar import ReferenceExecutor, ids_of, sample_demands
+from catalog import CATALOG
+from vectorstore.columnar import ColumnarQueryEngine
+
+
+def test_columnar_matches_reference_executor():
+    df = CATALOG.dataframe
+    engine = ColumnarQueryEngine(df=df)
+    reference = ReferenceExecutor(df)
+
+    mismatches, num_queries = [], 0
+    for demands in sample_demands(df, num_samples=300, seed=0):
+        for query in engine._build_queries(demands):
+            num_queries += 1
+            got, expected = ids_of(engine.execute(query)), reference.execute(query)
+            if got != expected:
+                mismatches.append((demands, got, expected))
+
+    assert num_queries > 0
+    assert mismatches == []
+
+
+def test_open_upper_bound_has_no_lte():
+    engine = ColumnarQueryEngine(df=CATALOG.dataframe)
+    demands = {"group": "điều hòa", "object": "điều hòa", "price": "trên 20 triệu",
+               "power": "", "weight": "", "volume": ""}
+    ranges = [clause["range"]["price_vnd"] for query in engine._build_queries(demands)
+              for clause in query["query"]["bool"]["must"] if "range" in clause]
+    assert ranges and all("lte" not in bounds and bounds["gte"] == 20_000_000 for bounds in ranges)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from vectorstore.fusion import FusionRetriever
+
+
+class ListRetriever:
+    def __init__(self, ids, release: threading.Event = None):
+        self.ids, self.release = ids, release
+
+    def invoke(self, input: str):
+        if self.release is not None:
+            self.release.wait(5)
+        return [Document(page_content=str(i), metadata={"product_info_id": i}) for i in self.ids]
+
+
+def test_fused_list_is_truncated_to_top_k():
+    retriever = FusionRetriever(retrievers=[ListRetriever([1, 2, 3, 4]), ListRetriever([4, 5, 6])],
+                                weights=[0.5, 0.5], names=["top_k_a", "top_k_b"], top_k=3)
+    docs = retriever.invoke("máy giặt")
+    assert [doc.metadata["product_info_id"] for doc in docs] == [4, 1, 2]
+
+
+def test_stalled_retriever_does_not_block_the_others():
+    release = threading.Event()
+    slow = ListRetriever([1], release=release)
+    fast = ListRetriever([2])
+    retriever = FusionRetriever(retrievers=[fast, slow], weights=[0.5, 0.5], timeouts=[1.0, 0.05],
+                                names=["stall_fast", "stall_slow"], max_workers=1)
+    try:
+        # request đầu tiên để lại 1 thread của stall_slow chạy quá hạn, pool của nó đã đầy
+        assert [doc.metadata["product_info_id"] for doc in retriever.invoke("q1")] == [2]
+        start = time.monotonic()
+        assert [doc.metadata["product_info_id"] for doc in retriever.invoke("q2")] == [2]
+        assert time.monotonic() - start < 0.5
+    finally:
+        release.set()
@@ -0,0 +1,25 @@
+import math
+
+from config import ArgExtract
+from rule_extractor import extract_rule_based
+from utils import parse_specification_range
+
+
+def test_lower_bound_price_with_thousands_separators():
+    specifications, confidence = extract_rule_based("máy giặt trên 1.500.000đ")
+    assert specifications["price"] == "trên 1.500.000đ"
+    assert parse_specification_range(specifications["price"]) == (1_500_000, math.inf)
+    assert confidence >= ArgExtract.min_confidence
+
+
+def test_lower_bound_power_in_btu():
+    specifications, _ = extract_rule_based("điều hòa trên 12.000 btu")
+    min_value, max_value = parse_specification_range(specifications["power"])
+    assert math.isclose(min_value, 12_000 * 0.293071)
+    assert max_value == math.inf
+
+
+def test_unparsable_number_falls_back_to_llm():
+    specifications, confidence = extract_rule_based("máy giặt trên 1.500.00 đ")
+    assert specifications["price"] == ""
+    assert confidence < ArgExtract.min_confidence
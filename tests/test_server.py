@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from config import ArgServer
+from server import ChatService
+
+
+async def fake_chat(question: str, search_type: str, llm_type: str) -> str:
+    await asyncio.sleep(0.05)
+    return f"answer: {question}"
+
+
+async def fake_stream(question: str, search_type: str, llm_type: str):
+    yield {"type": "tool", "data": {"tool": "product_search"}}
+    for text in ["máy ", "giặt"]:
+        yield {"type": "token", "data": {"text": text}}
+    yield {"type": "done", "data": {"answer": "máy giặt"}}
+
+
+async def slow_stream(question: str, search_type: str, llm_type: str):
+    yield {"type": "token", "data": {"text": "máy "}}
+    await asyncio.sleep(10)
+    yield {"type": "done", "data": {"answer": "máy giặt"}}
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def run(app: ChatService, scenario):
+    async def main():
+        await app.startup()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await scenario(client)
+        finally:
+            await app.shutdown(drain_timeout=1)
+    return asyncio.run(main())
+
+
+def make_app(chat_fn=fake_chat, stream_fn=fake_stream, **config) -> ChatService:
+    return ChatService(chat_fn=chat_fn, stream_fn=stream_fn, warmup_fn=None, shutdown_fn=None,
+                       config=ArgServer(**config))
+
+
+def test_chat_returns_answer():
+    async def scenario(client):
+        return await client.post("/chat", json={"question": "máy giặt", "search_type": "columnar"})
+
+    response = run(make_app(), scenario)
+    assert response.status_code == 200
+    assert response.json() == {"answer": "answer: máy giặt"}
+
+
+def test_chat_stream_sends_events():
+    async def scenario(client):
+        return await client.post("/chat/stream", json={"question": "máy giặt"})
+
+    response = run(make_app(), scenario)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_events(response.text) == [("tool", {"tool": "product_search"}),
+                                           ("token", {"text": "máy "}),
+                                           ("token", {"text": "giặt"}),
+                                           ("done", {"answer": "máy giặt"})]
+
+
+def test_chat_stream_timeout_sends_error_event():
+    async def scenario(client):
+        return await client.post("/chat/stream", json={"question": "máy giặt"})
+
+    response = run(make_app(stream_fn=slow_stream, request_timeout=0.2), scenario)
+    assert parse_events(response.text) == [("token", {"text": "máy "}), ("error", {"error": "timeout"})]
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"question": "  "},
+    {"question": "máy giặt", "search_type": "unknown"},
+    {"question": "máy giặt", "llm_type": "unknown"},
+    "{not json",
+])
+def test_invalid_request_returns_400(body):
+    async def scenario(client):
+        if isinstance(body, str):
+            return await client.post("/chat", content=body.encode())
+        return await client.post("/chat", json=body)
+
+    response = run(make_app(), scenario)
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_full_queue_rejects_with_503():
+    async def scenario(client):
+        return await asyncio.gather(*[client.post("/chat", json={"question": f"q{i}"}) for i in range(4)])
+
+    app = make_app(max_concurrency=1, max_queue=1, queue_timeout=5)
+    responses = run(app, scenario)
+    assert sorted(response.status_code for response in responses) == [200, 200, 503, 503]
+    assert all(response.headers["retry-after"] == "1" for response in responses if response.status_code == 503)
+    assert app.admission.rejected == 2
+
+
+def test_queue_timeout_sheds_with_503():
+    async def slow_chat(question: str, search_type: str, llm_type: str) -> str:
+        await asyncio.sleep(0.5)
+        return "ok"
+
+    async def scenario(client):
+        return await asyncio.gather(*[client.post("/chat", json={"question": f"q{i}"}) for i in range(2)])
+
+    app = make_app(chat_fn=slow_chat, max_concurrency=1, max_queue=1, queue_timeout=0.1)
+    responses = run(app, scenario)
+    assert sorted(response.status_code for response in responses) == [200, 503]
+    assert app.admission.shed == 1
+
+
+def test_default_backends_with_fake_llm(monkeypatch):
+    # tools và CLIENTS đọc LLM_PROVIDER khi import
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    pytest.importorskip("main", exc_type=ImportError)
+    from clients import CLIENTS
+
+    monkeypatch.setattr(CLIENTS, "provider", "fake")
+    app = ChatService(warmup_fn=None, shutdown_fn=None)
+
+    async def scenario(client):
+        request = {"question": "tư vấn máy giặt dưới 10 triệu", "search_type": "columnar", "llm_type": "openai"}
+        return await client.post("/chat", json=request), await client.post("/chat/stream", json=request)
+
+    chat, stream = run(app, scenario)
+    assert chat.status_code == 200 and chat.json()["answer"]
+    events = parse_events(stream.text)
+    assert events[-1][0] == "done"
+    assert all(event_type != "error" for event_type, _ in events)
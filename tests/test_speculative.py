@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+
+@pytest.fixture
+def main(monkeypatch):
+    # tools và CLIENTS đọc LLM_PROVIDER khi import
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    return pytest.importorskip("main", exc_type=ImportError)
+
+
+@pytest.fixture
+def blocked_extract(main, monkeypatch):
+    """extract_info chờ tới khi test cho phép, lookup_answer ghi lại các câu hỏi đã được tra"""
+    release, looked_up = threading.Event(), []
+    monkeypatch.setattr(main, "extract_info", lambda query_user, type_client: release.wait(5) and {})
+    monkeypatch.setattr(main, "lookup_answer", lambda question, demands, llm_type: looked_up.append(question))
+    return release, looked_up
+
+
+def test_cancel_stops_running_retrieval_before_search(main, blocked_extract):
+    release, looked_up = blocked_extract
+    retrieval = main._start_retrieval(None, "máy giặt", "columnar", "openai", speculative=True)
+
+    retrieval.cancel()
+    release.set()
+    with pytest.raises(CancelledError):
+        retrieval.future.result(timeout=5)
+    assert looked_up == []
+
+
+def test_stream_closed_early_cancels_retrieval(main, blocked_extract, monkeypatch):
+    release, looked_up = blocked_extract
+    started = []
+    start_retrieval = main._start_retrieval
+    monkeypatch.setattr(main, "route_question", lambda question, retrieval=None: "product_search")
+    monkeypatch.setattr(main, "_start_retrieval",
+                        lambda *args, **kwargs: started.append(start_retrieval(*args, **kwargs)) or started[-1])
+
+    stream = main.stream_chatbot(None, "máy giặt", "columnar", "openai")
+    assert next(stream).type == "tool"
+    stream.close()
+
+    assert started[0].cancelled.is_set()
+    release.set()
+    with pytest.raises(CancelledError):
+        started[0].future.result(timeout=5)
+    assert looked_up == []